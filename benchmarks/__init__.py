@@ -0,0 +1 @@
+"""Benchmarks of file-scraper, run from the root of the source tree."""
@@ -0,0 +1,355 @@
+"""Micro-benchmarks of the detectors and scrapers on the test data.
+
+Every detector and every scraper supporting the file is run on the valid
+files of tests/data/<mimetype>/, and the latency and the peak memory are
+reported per detector or scraper class and MIME type::
+
+    python -m benchmarks.micro --output results.json
+    python -m benchmarks.micro --mimetype image/jpeg --baseline results.json
+
+The latency is the wall time of detect() or scrape_file(), measured over the
+given number of repeats after a warm-up run, and reported as the median and
+the 95th percentile of the runs of all the files of the MIME type. The peak
+memory is measured in an extra run: the peak of the Python allocations,
+measured with tracemalloc on Python 3, and the peak resident set size of
+the largest external tool.
+
+The detectors and scrapers whose external tools or Python libraries are
+missing are skipped. With --baseline, the medians are compared to earlier
+results, and the exit status is 1 if some median grew more than the
+threshold.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import errno
+import io
+import json
+import math
+import os
+import platform
+import sys
+
+from file_scraper.accounting import ResourceUsage
+from file_scraper.detectors import VerapdfDetector
+from file_scraper.iterator import iter_detectors, iter_scrapers
+from file_scraper.scraper import Scraper
+from file_scraper.shell import subprocess_runner
+from file_scraper.utils import encode_path
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # pylint: disable=invalid-name
+
+DATA_DIR = "tests/data"
+
+# Default number of measured runs of each tool on each file
+REPEATS = 10
+
+# Relative growth of a median counted as a regression, and the growth in
+# seconds below which the difference is counted as noise
+THRESHOLD = 0.2
+MIN_DELTA = 0.002
+
+
+class SkipTool(Exception):
+    """Raised when a tool can not be run in this environment."""
+
+
+def corpus(data_dir=DATA_DIR, mimetypes=None):
+    """
+    List the valid files of the test data.
+
+    :data_dir: Directory of the test data, with a subdirectory per MIME
+               type, e.g. image_jpeg
+    :mimetypes: List of MIME types to include, or None for all
+    :returns: List of tuples (mimetype, filename) sorted by MIME type
+    """
+    files = []
+    for directory in sorted(os.listdir(data_dir)):
+        mimetype = directory.replace("_", "/", 1)
+        if mimetypes and mimetype not in mimetypes:
+            continue
+        path = os.path.join(data_dir, directory)
+        if not os.path.isdir(path):
+            continue
+        for name in sorted(os.listdir(path)):
+            if name.startswith("valid_"):
+                files.append((mimetype, os.path.join(path, name)))
+    return files
+
+
+def _detect_version(filename):
+    """
+    Detect the version of a file as the scrapers are selected by it.
+
+    :filename: File path
+    :returns: Detected version, or None if detection failed
+    """
+    scraper = Scraper(filename)
+    try:
+        scraper.detect_filetype()
+    except Exception:  # pylint: disable=broad-except
+        return None
+    return scraper.version
+
+
+def tools(mimetype, filename):
+    """
+    List the detectors and scrapers run on a file.
+
+    :mimetype: MIME type of the file
+    :filename: File path
+    :returns: List of functions creating a new instance of a tool, and
+              with attribute "tool_name" the name of the tool's class
+    """
+    version = _detect_version(filename)
+    filename = encode_path(filename)
+    factories = []
+    for detector in iter_detectors():
+        factories.append(_factory(detector, filename, None, None))
+    if mimetype == "application/pdf":
+        factories.append(_factory(VerapdfDetector, filename))
+
+    params = {"mimetype_guess": mimetype}
+    for scraper in iter_scrapers(mimetype, version, True, params):
+        factories.append(_factory(scraper, filename, True, params))
+    return factories
+
+
+def _factory(cls, *args):
+    """
+    Return a function creating a new instance of a tool.
+
+    :cls: Detector or scraper class
+    :args: Arguments of the class
+    :returns: Function without arguments
+    """
+    def create():
+        """Create the tool."""
+        return cls(*args)
+    create.tool_name = cls.__name__
+    return create
+
+
+def _command_checker(missing):
+    """
+    Return a Shell runner recording the missing tools.
+
+    :missing: List where the names of the missing tools are appended
+    :returns: Function running the command of a Shell
+    """
+    def run(shell):
+        """Run the command, recording the tool if it does not exist."""
+        try:
+            shell._execute()  # pylint: disable=protected-access
+        except OSError as error:
+            if error.errno == errno.ENOENT:
+                missing.append(shell.tool)
+            raise
+    return run
+
+
+def run_tool(create, measure_memory=False):
+    """
+    Create a tool and run it once.
+
+    A missing tool is detected when its command is run, so the scrapers
+    catching the errors of their tools do not hide it.
+
+    :create: Function creating the tool
+    :measure_memory: True to measure the peak of the Python allocations
+    :returns: ResourceUsage of the run, with attribute python_peak the peak
+              of the Python allocations in bytes, or None if not measured
+    :raises: SkipTool if a tool or Python library is missing, or if the
+             tool fails
+    """
+    tool = create()
+    run = getattr(tool, "detect", None) or tool.scrape_file
+    measure_memory = measure_memory and tracemalloc is not None
+    missing = []
+    usage = ResourceUsage()
+    usage.python_peak = None
+    if measure_memory:
+        tracemalloc.start()
+    try:
+        with subprocess_runner(_command_checker(missing)), usage:
+            run()
+    except ImportError as error:
+        raise SkipTool("Missing library: {}".format(error))
+    except OSError as error:
+        if error.errno == errno.ENOENT and not missing:
+            missing.append(error.filename)
+        if not missing:
+            raise SkipTool("{}: {}".format(error.__class__.__name__, error))
+    except Exception as error:  # pylint: disable=broad-except
+        if not missing:
+            raise SkipTool("{}: {}".format(error.__class__.__name__, error))
+    finally:
+        if measure_memory:
+            usage.python_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    if missing:
+        raise SkipTool("Missing tool: {}".format(missing[0]))
+    return usage
+
+
+def percentile(samples, fraction):
+    """
+    Return a percentile of samples by the nearest-rank method.
+
+    :samples: List of numbers
+    :fraction: Percentile as a fraction, e.g. 0.95
+    :returns: The percentile
+    """
+    ordered = sorted(samples)
+    return ordered[max(int(math.ceil(fraction * len(ordered))) - 1, 0)]
+
+
+def benchmark(files, repeats=REPEATS, log=None):
+    """
+    Benchmark the detectors and scrapers on files.
+
+    :files: List of tuples (mimetype, filename)
+    :repeats: Number of measured runs of each tool on each file
+    :log: Text stream for progress messages, or None
+    :returns: dict with keys "results", the measurements by
+              "<class> <mimetype>", and "skipped", the reasons of the skipped
+              tools by the same keys
+    """
+    samples = {}
+    memory = {}
+    skipped = {}
+    for (mimetype, filename) in files:
+        if log is not None:
+            print(filename, file=log)
+        for create in tools(mimetype, filename):
+            key = "{} {}".format(create.tool_name, mimetype)
+            if key in skipped:
+                continue
+            try:
+                run_tool(create)
+                times = [run_tool(create).wall_time
+                         for _ in range(repeats)]
+                usage = run_tool(create, measure_memory=True)
+            except SkipTool as error:
+                skipped[key] = str(error)
+                samples.pop(key, None)
+                memory.pop(key, None)
+                continue
+            samples.setdefault(key, []).extend(times)
+            peaks = memory.setdefault(key, {"python_peak": None,
+                                            "child_maxrss": 0})
+            if usage.python_peak is not None:
+                peaks["python_peak"] = max(peaks["python_peak"] or 0,
+                                           usage.python_peak)
+            peaks["child_maxrss"] = max(peaks["child_maxrss"],
+                                        usage.child_maxrss)
+
+    results = {}
+    for (key, times) in samples.items():
+        results[key] = dict(memory[key], runs=len(times),
+                            median=percentile(times, 0.5),
+                            p95=percentile(times, 0.95))
+    return {"python": platform.python_version(),
+            "repeats": repeats,
+            "results": results,
+            "skipped": skipped}
+
+
+def compare(results, baseline, threshold=THRESHOLD, min_delta=MIN_DELTA):
+    """
+    Find the regressions compared to a baseline.
+
+    :results: Results of benchmark()
+    :baseline: Earlier results of benchmark()
+    :threshold: Relative growth of a median counted as a regression
+    :min_delta: Growth in seconds below which a median is not counted as
+                a regression
+    :returns: List of tuples (key, baseline median, median) of the
+              regressions, sorted by key
+    """
+    regressions = []
+    for (key, result) in sorted(results["results"].items()):
+        before = baseline["results"].get(key)
+        if before is None:
+            continue
+        growth = result["median"] - before["median"]
+        if growth > min_delta and growth > threshold * before["median"]:
+            regressions.append((key, before["median"], result["median"]))
+    return regressions
+
+
+def report(results, stream):
+    """
+    Write the results as a table.
+
+    :results: Results of benchmark()
+    :stream: Text stream
+    """
+    width = max([len(key) for key in results["results"]] + [18])
+    row = "{:<%d} {:>10} {:>10} {:>10} {:>10}" % width
+    print(row.format("Tool and MIME type", "median ms", "p95 ms",
+                     "python kB", "tool kB"), file=stream)
+    for (key, result) in sorted(results["results"].items()):
+        python_peak = result["python_peak"]
+        print(row.format(
+            key, "{:.2f}".format(result["median"] * 1000),
+            "{:.2f}".format(result["p95"] * 1000),
+            "-" if python_peak is None else python_peak // 1024,
+            result["child_maxrss"] or "-"), file=stream)
+    for (key, reason) in sorted(results["skipped"].items()):
+        print("{} skipped: {}".format(key, reason), file=stream)
+
+
+def main(argv=None):
+    """
+    Run the benchmarks.
+
+    :argv: List of arguments without the program name, sys.argv by default
+    :returns: Exit status, 1 if regressions were found
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.micro",
+        description="Benchmark the detectors and scrapers on the test data.")
+    parser.add_argument(
+        "-m", "--mimetype", action="append", default=[],
+        help="benchmark only the files of this MIME type")
+    parser.add_argument(
+        "-n", "--repeats", type=int, default=REPEATS,
+        help="number of runs per tool and file, {} by default".format(
+            REPEATS))
+    parser.add_argument(
+        "-o", "--output", help="file to save the results as JSON to")
+    parser.add_argument(
+        "-b", "--baseline", help="results to compare the medians to")
+    parser.add_argument(
+        "-t", "--threshold", type=float, default=THRESHOLD,
+        help="relative growth counted as a regression, {} by default".format(
+            THRESHOLD))
+    parser.add_argument(
+        "--data-dir", default=DATA_DIR,
+        help="directory of the test data, {} by default".format(DATA_DIR))
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    results = benchmark(corpus(args.data_dir, args.mimetype), args.repeats,
+                        log=sys.stderr)
+    report(results, sys.stdout)
+    if args.output:
+        with io.open(args.output, "wt", encoding="utf-8") as outfile:
+            outfile.write(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.baseline:
+        with io.open(args.baseline, "rt", encoding="utf-8") as infile:
+            baseline = json.load(infile)
+        regressions = compare(results, baseline, args.threshold)
+        for (key, before, after) in regressions:
+            print("Regression: {}: median {:.2f} ms -> {:.2f} ms".format(
+                key, before * 1000, after * 1000))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""Benchmarks of how the scrapers scale with the size of the input.
+
+Synthetic files of growing scale are generated with benchmarks.synthetic,
+and the time and the peak resident set size of the scrapers and of the
+merge phase are measured against the size of the file::
+
+    python -m benchmarks.scaling --kind csv --scales 100000,1000000,10000000
+    python -m benchmarks.scaling --output scaling.json --plot scaling.png
+
+Each measurement runs in a new process, so that the growth of its peak
+resident set size is not hidden by earlier measurements. The peak of the
+external tools is reported separately. The merge measurement runs the
+available scrapers of the file and times the merging of their results into
+streams; its peak resident set size includes the scrapers.
+
+For each tool the growth of the time and the memory with the file size is
+summarized by the exponent of a power law fitted to the measurements: an
+exponent of 1 means linear growth. Time exponents over SUPERLINEAR and
+memory exponents over GROWING_MEMORY are flagged, as they point to O(n^2)
+algorithms and to files read into memory as a whole.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import argparse
+import io
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from benchmarks.micro import SkipTool, run_tool
+from benchmarks.synthetic import KINDS, generate
+from file_scraper.scraper import LOSE
+from file_scraper.iterator import iter_scrapers, scraper_classes
+from file_scraper.utils import (LazyModule, encode_path,
+                                generate_metadata_dict)
+
+multiprocessing = LazyModule(  # pylint: disable=invalid-name
+    "multiprocessing", ["multiprocessing.pool"])
+
+# time.perf_counter is not available in Python 2
+_CLOCK = getattr(time, "perf_counter", time.time)
+
+# Name of the merge phase in the list of the tools of a scenario
+MERGE = "merge"
+
+# Tools measured for each kind of file, and the default scales
+SCENARIOS = {
+    "csv": (["CsvScraper"], [10000, 100000, 1000000]),
+    "xml-wide": (["LxmlScraper", "XmllintScraper"], [1000, 10000, 100000]),
+    "xml-deep": (["LxmlScraper", "XmllintScraper"], [10, 100, 1000]),
+    "warc": (["WarcWarctoolsScraper"], [1000, 10000, 100000]),
+    "tiff": (["PilScraper", "WandScraper", MERGE], [10, 100, 1000]),
+    "gif": (["PilScraper", "WandScraper", MERGE], [10, 100, 1000]),
+    "pdf": (["GhostscriptScraper", "JHovePdfScraper", "VerapdfScraper"],
+            [10, 100, 1000]),
+}
+
+# Exponents of the power laws flagged as superlinear time and as memory
+# growing with the input
+SUPERLINEAR = 1.3
+GROWING_MEMORY = 0.8
+
+
+def _scraper(name, path, mimetype):
+    """
+    Create a scraper for a file.
+
+    :name: Name of the scraper class
+    :path: File path
+    :mimetype: MIME type of the file
+    :returns: Scraper instance
+    """
+    for cls in scraper_classes():
+        if cls.__name__ == name:
+            return cls(encode_path(path), True, {"mimetype_guess": mimetype})
+    raise ValueError("Unknown scraper: {}".format(name))
+
+
+def _max_rss():
+    """Return the peak resident set size of this process in kilobytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _measure_scraper(name, path, mimetype):
+    """
+    Measure a scraper.
+
+    :name: Name of the scraper class
+    :path: File path
+    :mimetype: MIME type of the file
+    :returns: dict of the measurement
+    """
+    scraper = _scraper(name, path, mimetype)
+    usage = run_tool(lambda: scraper)
+    return {"wall_time": usage.wall_time,
+            "child_maxrss": usage.child_maxrss,
+            "well_formed": scraper.well_formed}
+
+
+def _measure_merge(path, mimetype):
+    """
+    Measure merging the results of the available scrapers of a file.
+
+    :path: File path
+    :mimetype: MIME type of the file
+    :returns: dict of the measurement
+    """
+    params = {"mimetype_guess": mimetype}
+    results = []
+    for cls in iter_scrapers(mimetype, None, True, params):
+        scraper = cls(encode_path(path), True, params)
+        try:
+            run_tool(lambda: scraper)  # pylint: disable=cell-var-from-loop
+        except SkipTool:
+            continue
+        if scraper.streams:
+            results.append(scraper.streams)
+    if not results:
+        raise SkipTool("No scrapers available")
+
+    start = _CLOCK()
+    try:
+        streams = generate_metadata_dict(results, LOSE)
+    except ValueError as error:
+        raise SkipTool("Merge failed: {}".format(error))
+    return {"wall_time": _CLOCK() - start,
+            "child_maxrss": 0,
+            "streams": len(streams)}
+
+
+def _measure(task):
+    """
+    Measure a tool on a file in a worker process.
+
+    :task: Tuple of the tool name, the file path and the MIME type
+    :returns: dict of the measurement, with the growth of the peak
+              resident set size of the process, or with key "skipped" if
+              the tool could not be run
+    """
+    (name, path, mimetype) = task
+    before = _max_rss()
+    try:
+        if name == MERGE:
+            result = _measure_merge(path, mimetype)
+        else:
+            result = _measure_scraper(name, path, mimetype)
+    except SkipTool as error:
+        return {"skipped": str(error)}
+    result["peak_rss"] = _max_rss() - before
+    return result
+
+
+def measure(name, path, mimetype):
+    """
+    Measure a tool on a file in a new process.
+
+    :name: Name of the scraper class, or MERGE
+    :path: File path
+    :mimetype: MIME type of the file
+    :returns: dict with keys "wall_time" in seconds, "peak_rss", the growth
+              of the peak resident set size of the process, and
+              "child_maxrss", the peak of the external tools, both in
+              kilobytes, or with key "skipped" if the tool could not be run
+    """
+    pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(_measure, [(name, path, mimetype)])
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def exponent(sizes, values):
+    """
+    Fit a power law to measurements.
+
+    :sizes: List of the input sizes
+    :values: List of the measured values
+    :returns: Exponent of the least squares fit of the logarithms, or None
+              if there are less than two positive measurements
+    """
+    points = [(math.log(size), math.log(value))
+              for (size, value) in zip(sizes, values)
+              if size > 0 and value > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for (x, _) in points) / len(points)
+    mean_y = sum(y for (_, y) in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for (x, _) in points)
+    if not variance:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for (x, y) in points) / variance
+
+
+def benchmark(kinds, directory, scales=None, log=None):
+    """
+    Measure the tools on files of growing scale.
+
+    :kinds: List of the kinds of files, keys of SCENARIOS
+    :directory: Directory of the generated files
+    :scales: List of scales replacing the default scales, or None
+    :log: Text stream for progress messages, or None
+    :returns: dict of the results by "<tool> <kind>", with the keys
+              "measurements", a list of the measurements with the scale and
+              the size of the file, "time_exponent" and "memory_exponent",
+              or "skipped" if the tool could not be run
+    """
+    results = {}
+    for kind in kinds:
+        (tools, default_scales) = SCENARIOS[kind]
+        mimetype = KINDS[kind][1]
+        for scale in scales or default_scales:
+            path = generate(kind, scale, directory)
+            size = os.path.getsize(path)
+            for name in tools:
+                key = "{} {}".format(name, kind)
+                result = results.setdefault(key, {"measurements": []})
+                if "skipped" in result:
+                    continue
+                if log is not None:
+                    print("{} {}".format(key, scale), file=log)
+                measurement = measure(name, path, mimetype)
+                if "skipped" in measurement:
+                    results[key] = {"skipped": measurement["skipped"]}
+                    continue
+                measurement.update({"scale": scale, "size": size})
+                result["measurements"].append(measurement)
+
+    for result in results.values():
+        if "skipped" in result:
+            continue
+        measurements = result["measurements"]
+        sizes = [item["size"] for item in measurements]
+        result["time_exponent"] = exponent(
+            sizes, [item["wall_time"] for item in measurements])
+        result["memory_exponent"] = exponent(
+            sizes, [item["peak_rss"] + item["child_maxrss"]
+                    for item in measurements])
+    return results
+
+
+def _format_exponent(value, limit):
+    """
+    Format an exponent, flagging it if it is over the limit.
+
+    :value: Exponent or None
+    :limit: Limit of the exponent
+    :returns: Formatted string
+    """
+    if value is None:
+        return "-"
+    return "{:.2f}{}".format(value, " !" if value > limit else "")
+
+
+def report(results, stream):
+    """
+    Write the results as a table.
+
+    :results: Results of benchmark()
+    :stream: Text stream
+    """
+    row = "{:<32} {:>10} {:>14} {:>10} {:>12} {:>12}  {}"
+    print(row.format("Tool and kind", "scale", "size", "time s",
+                     "RSS kB", "tool kB", "result"), file=stream)
+    for (key, result) in sorted(results.items()):
+        if "skipped" in result:
+            print("{:<32} skipped: {}".format(key, result["skipped"]),
+                  file=stream)
+            continue
+        for item in result["measurements"]:
+            if "streams" in item:
+                outcome = "{} streams".format(item["streams"])
+            else:
+                outcome = "well-formed: {}".format(item["well_formed"])
+            print(row.format(key, item["scale"], item["size"],
+                             "{:.3f}".format(item["wall_time"]),
+                             item["peak_rss"], item["child_maxrss"],
+                             outcome), file=stream)
+        print("{:<32} time exponent {}, memory exponent {}".format(
+            key, _format_exponent(result["time_exponent"], SUPERLINEAR),
+            _format_exponent(result["memory_exponent"], GROWING_MEMORY)),
+              file=stream)
+
+
+def plot(results, path):
+    """
+    Plot the time and the peak resident set size against the file size.
+
+    matplotlib is needed for plotting.
+
+    :results: Results of benchmark()
+    :path: Path of the image file
+    """
+    import matplotlib  # pylint: disable=import-error
+    matplotlib.use("Agg")
+    from matplotlib import pyplot  # pylint: disable=import-error
+
+    (figure, (time_axes, memory_axes)) = pyplot.subplots(
+        1, 2, figsize=(14, 6))
+    for (key, result) in sorted(results.items()):
+        if "skipped" in result or not result["measurements"]:
+            continue
+        measurements = result["measurements"]
+        sizes = [item["size"] for item in measurements]
+        time_axes.plot(sizes, [item["wall_time"] for item in measurements],
+                       marker="o", label=key)
+        memory_axes.plot(sizes, [item["peak_rss"] + item["child_maxrss"]
+                                 for item in measurements],
+                         marker="o", label=key)
+    for (axes, label) in [(time_axes, "Time (s)"),
+                          (memory_axes, "Peak RSS growth (kB)")]:
+        axes.set_xscale("log")
+        axes.set_yscale("log")
+        axes.set_xlabel("File size (bytes)")
+        axes.set_ylabel(label)
+        axes.grid(True)
+    time_axes.legend(fontsize="small")
+    figure.tight_layout()
+    figure.savefig(path)
+
+
+def main(argv=None):
+    """
+    Run the scaling benchmarks.
+
+    :argv: List of arguments without the program name, sys.argv by default
+    :returns: Exit status
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.scaling",
+        description="Measure how the scrapers scale with the input size.")
+    parser.add_argument(
+        "-k", "--kind", action="append", choices=sorted(SCENARIOS),
+        help="kind of the files, all by default")
+    parser.add_argument(
+        "-s", "--scales",
+        help="comma separated scales replacing the default scales")
+    parser.add_argument(
+        "-d", "--directory",
+        default=os.path.join(tempfile.gettempdir(),
+                             "file-scraper-benchmarks"),
+        help="directory of the generated files, reused between runs")
+    parser.add_argument(
+        "-o", "--output", help="file to save the results as JSON to")
+    parser.add_argument(
+        "--plot", help="image file to plot the results to, needs matplotlib")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    if args.plot:
+        try:
+            import matplotlib  # pylint: disable=import-error, unused-import
+        except ImportError:
+            parser.error("--plot needs matplotlib")
+
+    scales = None
+    if args.scales:
+        scales = [int(scale) for scale in args.scales.split(",")]
+    results = benchmark(args.kind or sorted(SCENARIOS), args.directory,
+                        scales, log=sys.stderr)
+    report(results, sys.stdout)
+    if args.output:
+        with io.open(args.output, "wt", encoding="utf-8") as outfile:
+            outfile.write(json.dumps(results, indent=2, sort_keys=True))
+    if args.plot:
+        plot(results, args.plot)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+"""Generator of large synthetic files for the scaling benchmarks.
+
+The files are generated deterministically from their kind and scale, so
+that the same inputs can be recreated on any machine instead of storing
+them. The XML files refer to a schema by its absolute path in the same
+directory. The scale is the number of the repeated units of the file:
+
+    ==========  =====================================================
+    Kind        Scale
+    ==========  =====================================================
+    csv         Rows of about 100 bytes
+    xml-wide    Elements under the root, with schemaLocations
+    xml-deep    Depth of nested elements
+    warc        Response records
+    tiff        Pages of 64x64 pixels
+    gif         Animation frames of 64x64 pixels
+    pdf         Pages with a line of text
+    ==========  =====================================================
+
+The files are written to a directory and reused when they exist::
+
+    python -m benchmarks.synthetic csv 10000000 /tmp/synthetic
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import io
+import os
+import sys
+import uuid
+
+from file_scraper.utils import LazyModule
+
+PIL = LazyModule("PIL", ["PIL.Image"])
+
+# Side length of the frames of the images in pixels
+_FRAME_SIZE = 64
+
+_XSD = """<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
+           targetNamespace="urn:benchmark" xmlns="urn:benchmark"
+           elementFormDefault="qualified">
+  <xs:element name="root">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element ref="item" minOccurs="0" maxOccurs="unbounded"/>
+      </xs:sequence>
+      <xs:anyAttribute namespace="##other" processContents="lax"/>
+    </xs:complexType>
+  </xs:element>
+  <xs:element name="item">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element ref="item" minOccurs="0"/>
+      </xs:sequence>
+      <xs:attribute name="id" type="xs:integer"/>
+      <xs:attribute name="name" type="xs:string"/>
+      <xs:anyAttribute namespace="##other" processContents="lax"/>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+"""
+
+_XSI = "http://www.w3.org/2001/XMLSchema-instance"
+
+# Elements of the wide XML carrying a schemaLocation, as in aggregated
+# documents embedding other documents
+_LOCATION_INTERVAL = 100
+
+
+def _write_csv(outfile, scale):
+    """
+    Write a CSV file.
+
+    :outfile: Binary file object
+    :scale: Number of rows after the header
+    """
+    outfile.write(b"id,name,value,timestamp,description\r\n")
+    for row in range(scale):
+        outfile.write(
+            "{0},item-{0:010d},{1}.{2:03d},2019-{3:02d}-{4:02d}T12:00:00,"
+            "\"Row {0}, with a quoted comma\"\r\n".format(
+                row, row * 7919 % 100000, row % 1000, row % 12 + 1,
+                row % 28 + 1).encode("ascii"))
+
+
+def _write_xml_wide(outfile, scale, schema):
+    """
+    Write an XML document with many elements under the root.
+
+    :outfile: Binary file object
+    :scale: Number of elements
+    :schema: Path of the schema of the document
+    """
+    location = "urn:benchmark {}".format(schema).encode("utf-8")
+    outfile.write(
+        b'<?xml version="1.0" encoding="UTF-8"?>\n'
+        b'<root xmlns="urn:benchmark" xmlns:xsi="' +
+        _XSI.encode("ascii") + b'" xsi:schemaLocation="' + location +
+        b'">\n')
+    for index in range(scale):
+        extra = b""
+        if index % _LOCATION_INTERVAL == 0:
+            extra = b' xsi:schemaLocation="' + location + b'"'
+        outfile.write('  <item id="{0}" name="item-{0}"'.format(
+            index).encode("ascii") + extra + b"/>\n")
+    outfile.write(b"</root>\n")
+
+
+def _write_xml_deep(outfile, scale, schema):
+    """
+    Write an XML document with deeply nested elements.
+
+    :outfile: Binary file object
+    :scale: Depth of the nested elements under the root
+    :schema: Path of the schema of the document
+    """
+    outfile.write(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<root xmlns="urn:benchmark" xmlns:xsi="{}" '
+        'xsi:schemaLocation="urn:benchmark {}">\n'.format(
+            _XSI, schema).encode("utf-8"))
+    for index in range(scale):
+        outfile.write('<item id="{}">'.format(index).encode("ascii"))
+    outfile.write(b"</item>" * scale)
+    outfile.write(b"\n</root>\n")
+
+
+def _warc_record(outfile, record_type, index, headers, payload):
+    """
+    Write a WARC record.
+
+    :outfile: Binary file object
+    :record_type: WARC-Type of the record
+    :index: Index of the record, giving its record ID
+    :headers: List of extra header lines as text
+    :payload: Payload as bytes
+    """
+    lines = ["WARC/1.0",
+             "WARC-Type: {}".format(record_type),
+             "WARC-Record-ID: <urn:uuid:{}>".format(uuid.UUID(int=index)),
+             "WARC-Date: 2019-01-01T00:00:00Z"] + headers + [
+                 "Content-Length: {}".format(len(payload))]
+    outfile.write(("\r\n".join(lines) + "\r\n\r\n").encode("ascii"))
+    outfile.write(payload + b"\r\n\r\n")
+
+
+def _write_warc(outfile, scale):
+    """
+    Write an uncompressed WARC file.
+
+    :outfile: Binary file object
+    :scale: Number of response records after the warcinfo record
+    """
+    _warc_record(outfile, "warcinfo", 0,
+                 ["Content-Type: application/warc-fields"],
+                 b"software: file-scraper benchmarks\r\nformat: WARC File "
+                 b"Format 1.0\r\n")
+    for index in range(1, scale + 1):
+        body = "<html><body>Page {}</body></html>\n".format(index).encode(
+            "ascii")
+        http = ("HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n"
+                "Content-Length: {}\r\n\r\n".format(len(body)).encode(
+                    "ascii")) + body
+        _warc_record(outfile, "response", index,
+                     ["WARC-Target-URI: http://example.com/{}".format(index),
+                      "Content-Type: application/http; msgtype=response"],
+                     http)
+
+
+def _frames(scale):
+    """
+    Iterate the frames of the images.
+
+    :scale: Number of frames
+    :returns: Iterator of grayscale PIL images with a moving gradient
+    """
+    for index in range(scale):
+        data = bytes(bytearray(
+            (x + y + index) % 256 for y in range(_FRAME_SIZE)
+            for x in range(_FRAME_SIZE)))
+        yield PIL.Image.frombytes("L", (_FRAME_SIZE, _FRAME_SIZE), data)
+
+
+def _write_image(outfile, scale, image_format):
+    """
+    Write a multi-page image.
+
+    :outfile: Binary file object
+    :scale: Number of pages or frames
+    :image_format: PIL format, "TIFF" or "GIF"
+    """
+    frames = _frames(scale)
+    first = next(frames)
+    first.save(outfile, image_format, save_all=True,
+               append_images=list(frames), duration=40, loop=0)
+
+
+def _write_pdf(outfile, scale):
+    """
+    Write a PDF file.
+
+    :outfile: Binary file object
+    :scale: Number of pages
+    """
+    offsets = []
+
+    def write_object(body):
+        """Write the next object."""
+        offsets.append(outfile.tell())
+        outfile.write("{} 0 obj\n".format(len(offsets)).encode("ascii") +
+                      body + b"\nendobj\n")
+
+    outfile.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    kids = " ".join("{} 0 R".format(4 + 2 * page) for page in range(scale))
+    write_object(b"<< /Type /Catalog /Pages 2 0 R >>")
+    write_object("<< /Type /Pages /Kids [{}] /Count {} >>".format(
+        kids, scale).encode("ascii"))
+    write_object(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page in range(scale):
+        write_object(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            "/Resources << /Font << /F1 3 0 R >> >> /Contents {} 0 R "
+            ">>".format(5 + 2 * page).encode("ascii"))
+        content = "BT /F1 24 Tf 72 720 Td (Page {}) Tj ET".format(
+            page + 1).encode("ascii")
+        write_object("<< /Length {} >>\nstream\n".format(
+            len(content)).encode("ascii") + content + b"\nendstream")
+
+    xref = outfile.tell()
+    outfile.write("xref\n0 {}\n0000000000 65535 f \n".format(
+        len(offsets) + 1).encode("ascii"))
+    for offset in offsets:
+        outfile.write("{:010d} 00000 n \n".format(offset).encode("ascii"))
+    outfile.write(
+        "trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n".format(
+            len(offsets) + 1, xref).encode("ascii"))
+
+
+# Kinds of the files by name: extension and MIME type of the file
+KINDS = {
+    "csv": ("csv", "text/csv"),
+    "xml-wide": ("xml", "text/xml"),
+    "xml-deep": ("xml", "text/xml"),
+    "warc": ("warc", "application/warc"),
+    "tiff": ("tif", "image/tiff"),
+    "gif": ("gif", "image/gif"),
+    "pdf": ("pdf", "application/pdf"),
+}
+
+
+def generate(kind, scale, directory):
+    """
+    Generate a synthetic file unless it exists.
+
+    :kind: Kind of the file, a key of KINDS
+    :scale: Number of the repeated units of the file
+    :directory: Directory of the generated files
+    :returns: Path of the file
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, "{}-{}.{}".format(
+        kind, scale, KINDS[kind][0]))
+    if os.path.exists(path):
+        return path
+
+    schema = os.path.abspath(os.path.join(directory, "benchmark.xsd"))
+    if kind.startswith("xml"):
+        with io.open(schema, "wt", encoding="utf-8") as outfile:
+            outfile.write(_XSD)
+
+    writers = {
+        "csv": lambda outfile: _write_csv(outfile, scale),
+        "xml-wide": lambda outfile: _write_xml_wide(outfile, scale, schema),
+        "xml-deep": lambda outfile: _write_xml_deep(outfile, scale, schema),
+        "warc": lambda outfile: _write_warc(outfile, scale),
+        "tiff": lambda outfile: _write_image(outfile, scale, "TIFF"),
+        "gif": lambda outfile: _write_image(outfile, scale, "GIF"),
+        "pdf": lambda outfile: _write_pdf(outfile, scale),
+    }
+    # The file is written under a temporary name, so that an interrupted
+    # generation is not reused
+    partial = path + ".part"
+    with io.open(partial, "w+b") as outfile:
+        writers[kind](outfile)
+    os.rename(partial, path)
+    return path
+
+
+def main(argv=None):
+    """
+    Generate a synthetic file.
+
+    :argv: List of arguments without the program name, sys.argv by default
+    :returns: Exit status
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.synthetic",
+        description="Generate a large synthetic file.")
+    parser.add_argument("kind", choices=sorted(KINDS))
+    parser.add_argument("scale", type=int,
+                        help="number of the repeated units of the file")
+    parser.add_argument("directory", help="directory of the generated files")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    print(generate(args.kind, args.scale, args.directory))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""Benchmark of the batch throughput over worker counts.
+
+A mixed-format corpus, by default the valid files of tests/data, is scraped
+through file_scraper.batch.scrape_batch() with 1, 2, 4, ... worker processes,
+and the throughput, the CPU utilization and the time the detectors and
+scrapers spend waiting are reported for each worker count::
+
+    python -m benchmarks.throughput --max-workers 16 --repeat 10
+    python -m benchmarks.throughput --cache cold /data/sample
+
+The CPU utilization is the CPU time of the workers and of the tools they
+run, divided by the wall time and the number of CPUs. The wait time of a
+tool is its wall time not spent on CPU, neither by the worker nor by the
+external tools, e.g. reading the file, waiting for a free slot of a tool
+with limited concurrency, or starting a Java virtual machine. Scaling is
+reported to stop at the worker count after which adding workers raises the
+throughput less than MIN_GAIN.
+
+In the cold cache runs, the page cache is dropped before each worker count
+through /proc/sys/vm/drop_caches, which needs root, or else the cached pages
+of the corpus files are evicted with posix_fadvise(). The latter does not
+evict the executables and the libraries of the tools. In the warm cache
+runs, the corpus is scraped once before the measurements.
+"""
+from __future__ import division, print_function, unicode_literals
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+from benchmarks.micro import corpus
+from file_scraper.batch import iter_files, scrape_batch
+from file_scraper.utils import encode_path
+
+# Relative growth of the throughput below which adding workers is counted
+# as the end of scaling
+MIN_GAIN = 0.1
+
+
+def worker_counts(max_workers):
+    """
+    Return the worker counts to measure.
+
+    :max_workers: Largest worker count
+    :returns: List of the powers of two up to max_workers, and max_workers
+    """
+    counts = []
+    count = 1
+    while count < max_workers:
+        counts.append(count)
+        count *= 2
+    return counts + [max_workers]
+
+
+def drop_caches(paths):
+    """
+    Drop the page cache, or the cached pages of the given files.
+
+    :paths: File paths
+    :returns: Method used, "drop_caches" or "fadvise", or None if the cache
+              could not be dropped
+    """
+    if hasattr(os, "sync"):
+        os.sync()
+    try:
+        with io.open("/proc/sys/vm/drop_caches", "wb") as outfile:
+            outfile.write(b"3\n")
+        return "drop_caches"
+    except (IOError, OSError):
+        pass
+
+    if not hasattr(os, "posix_fadvise"):
+        return None
+    for path in paths:
+        try:
+            fd = os.open(encode_path(path), os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return "fadvise"
+
+
+def _cpu_time():
+    """
+    Return the CPU time of this process and its waited-for descendants.
+
+    :returns: CPU time in seconds
+    """
+    total = 0.0
+    for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN]:
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def _add_waits(waits, result):
+    """
+    Add the wait times of the tools of a file.
+
+    :waits: dict of the wait times in seconds by tool class, updated
+    :result: Result of scrape_one() with resource usage
+    """
+    for info in (result.get("info") or {}).values():
+        usage = info.get("resource_usage")
+        if usage is None:
+            continue
+        wait = usage["wall_time"] - usage["cpu_time"] - \
+            usage["child_utime"] - usage["child_stime"]
+        waits[info["class"]] = waits.get(info["class"], 0.0) + max(wait, 0.0)
+
+
+def run(files, workers, **kwargs):
+    """
+    Scrape files and measure the throughput.
+
+    :files: List of tuples (path, size)
+    :workers: Number of worker processes
+    :kwargs: Arguments for scrape_batch()
+    :returns: dict with keys "workers", "files", "errors", "seconds",
+              "files_per_second", "bytes_per_second", "cpu_utilization" and
+              "waits", the wait times of the tools in seconds by tool class
+    """
+    waits = {}
+    errors = 0
+    cpu_start = _cpu_time()
+    start = time.time()
+    for result in scrape_batch([path for (path, _) in files], workers,
+                               resource_usage=True, **kwargs):
+        errors += "error" in result
+        _add_waits(waits, result)
+    seconds = max(time.time() - start, 1e-6)
+    cpu = _cpu_time() - cpu_start
+    return {"workers": workers,
+            "files": len(files),
+            "errors": errors,
+            "seconds": seconds,
+            "files_per_second": len(files) / seconds,
+            "bytes_per_second": sum(size for (_, size) in files) / seconds,
+            "cpu_utilization": cpu / (seconds * multiprocessing.cpu_count()),
+            "waits": waits}
+
+
+def scaling_limit(runs, min_gain=MIN_GAIN):
+    """
+    Find the worker count where scaling stops.
+
+    :runs: Results of run() in the order of growing worker counts
+    :min_gain: Relative growth of the throughput below which adding
+               workers is counted as the end of scaling
+    :returns: Worker count after which the throughput grows less than
+              min_gain, or None if it grows up to the largest count
+    """
+    for (previous, current) in zip(runs, runs[1:]):
+        if current["files_per_second"] < \
+                previous["files_per_second"] * (1 + min_gain):
+            return previous["workers"]
+    return None
+
+
+def benchmark(files, counts, caches, log=None, **kwargs):
+    """
+    Measure the throughput at several worker counts.
+
+    :files: List of tuples (path, size)
+    :counts: List of worker counts
+    :caches: List of the cache modes, "warm" and "cold"
+    :log: Text stream for progress messages, or None
+    :kwargs: Arguments for scrape_batch()
+    :returns: dict of the results by cache mode, with keys "runs", the
+              results of run(), "scaling_limit", and for the cold cache
+              "drop_method", the method used for dropping the cache
+    """
+    results = {}
+    for cache in caches:
+        result = {"runs": []}
+        if cache == "warm":
+            run(files, max(counts), **kwargs)
+        for count in counts:
+            if cache == "cold":
+                result["drop_method"] = drop_caches(
+                    [path for (path, _) in files])
+            if log is not None:
+                print("{} cache, {} workers".format(cache, count), file=log)
+            result["runs"].append(run(files, count, **kwargs))
+        result["scaling_limit"] = scaling_limit(result["runs"])
+        results[cache] = result
+    return results
+
+
+def report(results, stream):
+    """
+    Write the results as a table.
+
+    :results: Results of benchmark()
+    :stream: Text stream
+    """
+    row = "{:<6} {:>8} {:>10} {:>10} {:>12} {:>8} {:>8}  {}"
+    print(row.format("cache", "workers", "files/s", "speedup", "MB/s",
+                     "CPU %", "errors", "largest waits"), file=stream)
+    for (cache, result) in sorted(results.items()):
+        base = result["runs"][0]["files_per_second"]
+        for item in result["runs"]:
+            waits = sorted(item["waits"].items(), key=lambda wait: -wait[1])
+            print(row.format(
+                cache, item["workers"],
+                "{:.2f}".format(item["files_per_second"]),
+                "{:.2f}".format(item["files_per_second"] / base),
+                "{:.2f}".format(item["bytes_per_second"] / 1e6),
+                "{:.0f}".format(item["cpu_utilization"] * 100),
+                item["errors"],
+                ", ".join("{} {:.1f} s".format(name, wait)
+                          for (name, wait) in waits[:3])), file=stream)
+        limit = result["scaling_limit"]
+        print("{} cache: {}".format(
+            cache, "scaling stops at {} workers".format(limit)
+            if limit else "throughput grows up to the largest worker count"),
+              file=stream)
+        if cache == "cold" and result.get("drop_method") is None:
+            print("cold cache: the page cache could not be dropped",
+                  file=stream)
+
+
+def main(argv=None):
+    """
+    Run the throughput benchmark.
+
+    :argv: List of arguments without the program name, sys.argv by default
+    :returns: Exit status
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.throughput",
+        description="Measure the batch throughput over worker counts.")
+    parser.add_argument(
+        "paths", nargs="*", metavar="PATH",
+        help="files and directories of the corpus, by default the valid "
+             "files of tests/data")
+    parser.add_argument(
+        "-w", "--max-workers", type=int,
+        default=multiprocessing.cpu_count(),
+        help="largest worker count, the number of CPUs by default")
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=1,
+        help="number of times the corpus is scraped in each run")
+    parser.add_argument(
+        "-c", "--cache", choices=["warm", "cold", "both"], default="warm",
+        help="page cache state of the runs, warm by default")
+    parser.add_argument(
+        "--detect-only", action="store_true",
+        help="only detect the file types, without scraping")
+    parser.add_argument(
+        "--no-wellformed", action="store_true",
+        help="skip the well-formed check")
+    parser.add_argument(
+        "-o", "--output", help="file to save the results as JSON to")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.paths:
+        files = list(iter_files(args.paths))
+    else:
+        files = [(path, os.path.getsize(path)) for (_, path) in corpus()]
+    caches = ["warm", "cold"] if args.cache == "both" else [args.cache]
+    results = benchmark(files * args.repeat, worker_counts(args.max_workers),
+                        caches, log=sys.stderr,
+                        detect_only=args.detect_only,
+                        check_wellformed=not args.no_wellformed)
+    report(results, sys.stdout)
+    if args.output:
+        with io.open(args.output, "wt", encoding="utf-8") as outfile:
+            outfile.write(json.dumps(results, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
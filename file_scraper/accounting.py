@@ -0,0 +1,309 @@
+"""Accounting of the time and resources used by detectors and scrapers.
+
+Measurements are optional. A disabled measurement does nothing, so the
+accounting costs next to nothing when it is not used.
+
+The subprocesses run with Shell are charged to the innermost active
+measurement of the current thread. When a measurement ends, its subprocess
+figures are added to its parent measurement.
+"""
+from __future__ import unicode_literals
+
+import resource
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None  # pylint: disable=invalid-name
+
+_LOCAL = threading.local()
+
+# time.perf_counter is not available in Python 2
+_CLOCK = getattr(time, "perf_counter", time.time)
+
+
+def _stack():
+    """Return the stack of active measurements of the current thread."""
+    if not hasattr(_LOCAL, "stack"):
+        _LOCAL.stack = []
+    return _LOCAL.stack
+
+
+def current_measurement():
+    """
+    Return the innermost active measurement of the current thread.
+
+    :returns: ResourceUsage instance or None if nothing is measured
+    """
+    stack = getattr(_LOCAL, "stack", None)
+    if stack:
+        return stack[-1]
+    return None
+
+
+def record_subprocess(rusage):
+    """
+    Charge a finished subprocess to the current measurement.
+
+    :rusage: Resource usage of the subprocess as returned by os.wait4(), or
+             None if it is not known. Then only the subprocess is counted.
+    """
+    measurement = current_measurement()
+    if measurement is None:
+        return
+    if rusage is None:
+        measurement.add_subprocess(0.0, 0.0, 0)
+    else:
+        measurement.add_subprocess(rusage.ru_utime, rusage.ru_stime,
+                                   rusage.ru_maxrss)
+
+
+def _cpu_time():
+    """Return the CPU time used by this process in seconds."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _bytes_read():
+    """
+    Return the number of bytes read by this process so far.
+
+    The figure includes reads from files and from the pipes of the
+    subprocesses. It is available on Linux only.
+
+    :returns: Number of bytes or None if not available
+    """
+    try:
+        with open("/proc/self/io", "rb") as io_file:
+            for line in io_file:
+                if line.startswith(b"rchar:"):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return None
+
+
+class ResourceUsage(object):
+    """
+    Time and resources used during a with block.
+
+    The following figures are collected:
+
+        * wall_time: Elapsed time in seconds
+        * cpu_time: CPU time of this process in seconds
+        * child_utime: User CPU time of the subprocesses in seconds
+        * child_stime: System CPU time of the subprocesses in seconds
+        * child_maxrss: Peak resident set size of the largest subprocess in
+          kilobytes
+        * bytes_read: Bytes read by this process, or None if not available
+        * subprocesses: Number of subprocesses run
+
+    CPU time and bytes read are process-wide figures. The attribute memory
+    holds the peak memory figures of a scraper in the memory usage mode of
+    the Scraper, and is None otherwise.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, enabled=True, parent=None):
+        """
+        Initialize the measurement.
+
+        :enabled: False to skip all accounting
+        :parent: Measurement which the subprocess figures are added to when
+                 this measurement ends. By default the innermost active
+                 measurement of the current thread.
+        """
+        self.enabled = enabled
+        self._parent = parent
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.child_utime = 0.0
+        self.child_stime = 0.0
+        self.child_maxrss = 0
+        self.bytes_read = None
+        self.subprocesses = 0
+        self.memory = None
+        self._start = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        """Start measuring."""
+        if not self.enabled:
+            return self
+        if self._parent is None:
+            self._parent = current_measurement()
+        _stack().append(self)
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop measuring and charge the subprocesses to the parent."""
+        if not self.enabled:
+            return
+        _stack().remove(self)
+        self.stop()
+
+    def start(self):
+        """
+        Start measuring without making this the current measurement.
+
+        Used when the measured work does not stay in one thread, e.g. in
+        asyncio. The subprocesses are then charged to this measurement only
+        through the measurements which have this one as their parent.
+        """
+        if self.enabled:
+            self._start = (_CLOCK(), _cpu_time(), _bytes_read(),
+                           self.child_utime, self.child_stime,
+                           self.subprocesses)
+
+    def stop(self):
+        """Stop measuring and charge the subprocesses to the parent."""
+        if not self.enabled:
+            return
+        (wall_start, cpu_start, bytes_start,
+         utime_start, stime_start, subprocesses_start) = self._start
+        self.wall_time += _CLOCK() - wall_start
+        self.cpu_time += _cpu_time() - cpu_start
+        bytes_end = _bytes_read()
+        if bytes_start is not None and bytes_end is not None:
+            self.bytes_read = (self.bytes_read or 0) + bytes_end - bytes_start
+        # Only the subprocesses since the start are charged, so a
+        # measurement can be started and stopped several times
+        if self._parent is not None:
+            self._parent.add_subprocess(
+                self.child_utime - utime_start,
+                self.child_stime - stime_start,
+                self.child_maxrss,
+                self.subprocesses - subprocesses_start)
+
+    def add_subprocess(self, utime, stime, maxrss, count=1):
+        """
+        Add the resource usage of finished subprocesses.
+
+        :utime: User CPU time in seconds
+        :stime: System CPU time in seconds
+        :maxrss: Peak resident set size in kilobytes
+        :count: Number of subprocesses
+        """
+        # Measurements of work done in several threads share a parent
+        with self._lock:
+            self.child_utime += utime
+            self.child_stime += stime
+            self.child_maxrss = max(self.child_maxrss, maxrss)
+            self.subprocesses += count
+
+    def as_dict(self):
+        """
+        Return the collected figures.
+
+        :returns: dict with the figures listed in the class documentation
+        """
+        return {"wall_time": self.wall_time,
+                "cpu_time": self.cpu_time,
+                "child_utime": self.child_utime,
+                "child_stime": self.child_stime,
+                "child_maxrss": self.child_maxrss,
+                "bytes_read": self.bytes_read,
+                "subprocesses": self.subprocesses}
+
+
+# PythonPeak measurements running, and whether they started tracemalloc
+_TRACEMALLOC_LOCK = threading.Lock()
+_TRACEMALLOC_USERS = []
+_TRACEMALLOC_STARTED = False
+
+
+def _start_tracemalloc(measurement):
+    """
+    Start tracing the Python allocations unless they are traced.
+
+    The peak of tracemalloc is reset if no other measurement is running.
+    Otherwise the running measurements and the new one are marked as
+    overlapping, and their peaks are not known.
+
+    :measurement: PythonPeak instance starting
+    :returns: Traced memory after the reset, from which the peak is counted
+    """
+    # pylint: disable=global-statement
+    global _TRACEMALLOC_STARTED
+    with _TRACEMALLOC_LOCK:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _TRACEMALLOC_STARTED = True
+        if _TRACEMALLOC_USERS:
+            for user in _TRACEMALLOC_USERS + [measurement]:
+                user.known = False
+        # The peak can be reset without clearing the traces in Python 3.9
+        elif hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        elif _TRACEMALLOC_STARTED:
+            tracemalloc.clear_traces()
+        else:
+            # The traces of a session started by someone else are not
+            # cleared, so the peak of the session is not known
+            measurement.known = False
+        _TRACEMALLOC_USERS.append(measurement)
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _stop_tracemalloc(measurement):
+    """
+    Stop tracing the Python allocations when started for the last user.
+
+    :measurement: PythonPeak instance ending
+    :returns: Peak of the traced memory since the previous reset
+    """
+    # pylint: disable=global-statement
+    global _TRACEMALLOC_STARTED
+    with _TRACEMALLOC_LOCK:
+        peak = tracemalloc.get_traced_memory()[1]
+        _TRACEMALLOC_USERS.remove(measurement)
+        if not _TRACEMALLOC_USERS and _TRACEMALLOC_STARTED:
+            tracemalloc.stop()
+            _TRACEMALLOC_STARTED = False
+        return peak
+
+
+class PythonPeak(object):
+    """
+    Peak of the Python allocations during a with block.
+
+    The allocations are traced with tracemalloc, which is started for the
+    with block if it is not already tracing, and the peak is counted from
+    the memory traced at the start of the block. tracemalloc has a single
+    peak for the whole process, so a peak is known only for a block that
+    did not run at the same time with other PythonPeak blocks, nested or in
+    other threads. For overlapping blocks the peak is None. Before Python
+    3.9 the peak can be reset only by clearing the traces, which is not done
+    to a tracing session started elsewhere, so the peak is None also when
+    tracemalloc was already tracing. Tracing slows down the allocations
+    considerably. The peak is not measured in Python 2.
+    """
+
+    def __init__(self, enabled=True):
+        """
+        Initialize the measurement.
+
+        :enabled: False to measure nothing
+        """
+        self.enabled = enabled and tracemalloc is not None
+        self.peak = None
+        self.known = True
+        self._start = None
+
+    def __enter__(self):
+        """Start measuring."""
+        if self.enabled:
+            self._start = _start_tracemalloc(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop measuring."""
+        if not self.enabled:
+            return
+        peak = _stop_tracemalloc(self)
+        if self.known:
+            self.peak = max(0, peak - self._start)
@@ -0,0 +1,392 @@
+"""Asyncio API for scraping files. Requires Python 3.
+
+The detectors and scrapers are synchronous code, so each of them is run in a
+worker thread of an executor. The external tools they run with Shell are
+however executed as asynchronous subprocesses of the event loop, so the
+tools used for one file and for several files overlap in one event loop.
+The number of detectors and scrapers running at the same time is limited by
+the concurrency given to the functions, ASYNC_CONCURRENCY by default.
+
+Example::
+
+    scraper = Scraper(filename)
+    await scraper.scrape_async()
+
+    scrapers = await scrape_many_async(filenames, check_wellformed=False)
+
+The CPU time and peak memory of the subprocesses are not known to asyncio,
+so in the resource usage only the number of subprocesses is counted for
+them.
+"""
+from __future__ import unicode_literals
+
+import asyncio
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from file_scraper.accounting import record_subprocess
+from file_scraper.config import ASYNC_CONCURRENCY, SHELL_KILL_GRACE
+from file_scraper.detectors import VerapdfDetector
+from file_scraper.dummy.dummy_scraper import FileExists
+from file_scraper.scraper import LOSE, Scraper
+from file_scraper.shell import (_CHUNK_SIZE, Shell, ToolSlot,
+                                subprocess_runner)
+from file_scraper.utils import generate_metadata_dict
+
+# The functions here drive the steps of Scraper and Shell
+# pylint: disable=protected-access
+
+
+class AsyncShell(Shell):
+    """
+    Shell command handler running the command as an asyncio subprocess.
+
+    The command is run by awaiting run(), after which the results are
+    available as with Shell::
+
+        shell = await AsyncShell(["jhove", filename]).run()
+        print(shell.stdout)
+    """
+
+    async def run(self):
+        """
+        Run the command unless it has already been run.
+
+        :returns: The instance itself
+        :raises: ShellTimeoutError if the command timed out
+        """
+        if self._returncode is None:
+            await _run_subprocess(self)
+            record_subprocess(self._rusage)
+        self._check_timeout()
+        return self
+
+    def _execute(self):
+        """Refuse to run the command synchronously."""
+        raise RuntimeError("AsyncShell must be run by awaiting run().")
+
+
+async def _run_subprocess(shell):
+    """
+    Run the command of a Shell instance as an asyncio subprocess.
+
+    :shell: Shell instance, where the results are stored
+    """
+    slot = ToolSlot(shell.tool)
+    delay = 0.01
+    while not slot.acquire_nowait():
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *shell.command, stdout=shell.stdout_file,
+            stderr=shell.stderr_file, env=shell._env,
+            start_new_session=True)
+        await _communicate(shell, proc)
+    finally:
+        slot.release()
+
+
+async def _read_stream(stream, capture):
+    """
+    Read a subprocess output stream until EOF.
+
+    :stream: asyncio StreamReader
+    :capture: _Capture instance where the output is stored
+    """
+    while True:
+        chunk = await stream.read(_CHUNK_SIZE)
+        if not chunk:
+            break
+        capture.feed(chunk)
+
+
+async def _communicate(shell, proc):
+    """
+    Read the outputs of the subprocess and wait for it to finish.
+
+    If the timeout of the Shell expires, the process group is terminated.
+
+    :shell: Shell instance, where the results are stored
+    :proc: asyncio Process instance
+    """
+    captures = shell._new_captures(proc)
+    readers = [_read_stream(getattr(proc, name), capture)
+               for (name, capture) in captures.items()]
+    try:
+        await asyncio.wait_for(asyncio.gather(proc.wait(), *readers),
+                               shell.timeout)
+    except asyncio.TimeoutError:
+        shell.timed_out = True
+        await _kill(proc)
+    shell._returncode = proc.returncode
+    shell._close_captures(captures)
+
+
+async def _kill(proc):
+    """
+    Terminate the process group of the subprocess.
+
+    SIGTERM is sent first and SIGKILL after a grace period.
+
+    :proc: asyncio Process instance
+    """
+    Shell._signal_group(proc, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(proc.wait(), SHELL_KILL_GRACE)
+    except asyncio.TimeoutError:
+        pass
+    Shell._signal_group(proc, signal.SIGKILL)
+    await proc.wait()
+
+
+@contextmanager
+def _measured(usage):
+    """
+    Measure the resource usage of a with block containing awaits.
+
+    :usage: ResourceUsage instance
+    """
+    usage.start()
+    try:
+        yield usage
+    finally:
+        usage.stop()
+
+
+class _Runner(object):
+    """Runner of detectors and scrapers in worker threads."""
+
+    def __init__(self, concurrency=None):
+        """
+        Initialize runner for the running event loop.
+
+        :concurrency: Maximum number of detectors and scrapers running at the
+                      same time, ASYNC_CONCURRENCY by default
+        """
+        if concurrency is None:
+            concurrency = ASYNC_CONCURRENCY
+        self._loop = asyncio.get_event_loop()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def close(self):
+        """Release the worker threads."""
+        self._executor.shutdown(wait=False)
+
+    async def call(self, func, *args):
+        """
+        Call a function in a worker thread.
+
+        The commands run with Shell by the function are run in the event
+        loop.
+
+        :func: Function to call
+        :args: Arguments of the function
+        :returns: Return value of the function
+        """
+        async with self._semaphore:
+            return await self._loop.run_in_executor(
+                self._executor, self._in_worker, func, args)
+
+    def _in_worker(self, func, args):
+        """
+        Call a function, running its Shell commands in the event loop.
+
+        :func: Function to call
+        :args: Arguments of the function
+        :returns: Return value of the function
+        """
+        with subprocess_runner(self._run_shell):
+            return func(*args)
+
+    def _run_shell(self, shell):
+        """
+        Run the command of a Shell instance in the event loop and wait.
+
+        :shell: Shell instance
+        """
+        asyncio.run_coroutine_threadsafe(
+            _run_subprocess(shell), self._loop).result()
+
+    async def scrape(self, scraper, check_wellformed, fail_fast=False):
+        """
+        Scrape a file, as Scraper.scrape() does.
+
+        :scraper: Scraper instance
+        :check_wellformed: True, full scraping; False, skip well-formed check.
+        :fail_fast: True to stop scraping once the file is known not to be
+                    well-formed
+        """
+        scraper._fail_fast = fail_fast
+        scraper._usage = {}
+        with _measured(scraper._stage("total")) as total:
+            await self._scrape(scraper, check_wellformed, total)
+        scraper._store_resource_usage()
+        if scraper._scheduler is not None:
+            scraper._scheduler.checkpoint()
+
+    async def _scrape(self, scraper, check_wellformed, total):
+        """
+        Detect the file type and scrape the file.
+
+        :scraper: Scraper instance
+        :check_wellformed: True, full scraping; False, skip well-formed check.
+        :total: ResourceUsage of the whole run
+        """
+        with _measured(scraper._stage("detection", total)) as stage:
+            await self._detect_filetype(scraper, stage)
+
+        # File not found or MIME type could not be determined
+        if not scraper.mimetype:
+            scraper.streams = {}
+            return
+
+        with _measured(scraper._stage("scraping", total)) as stage:
+            scrapers = scraper._scrapers(check_wellformed)
+            await self._run_all(scraper, scraper._scheduled_run,
+                                scraper._collect_scraper, scrapers, stage,
+                                fail_fast=True,
+                                order=scraper._execution_order(scrapers))
+        with _measured(scraper._stage("merge", total)):
+            scraper.streams = generate_metadata_dict(
+                scraper._scraper_results, LOSE)
+        with _measured(scraper._stage("utf8", total)) as stage:
+            utf8_scraper = scraper._utf8_scraper(check_wellformed)
+            if utf8_scraper is not None:
+                await self._run_all(scraper, scraper._run_scraper,
+                                    scraper._collect_scraper,
+                                    [utf8_scraper], stage, fail_fast=True)
+        with _measured(scraper._stage("merge", total)):
+            scraper._check_mimetype_version()
+
+    async def _detect_filetype(self, scraper, stage):
+        """
+        Find out the MIME type and version of the file.
+
+        :scraper: Scraper instance
+        :stage: ResourceUsage of the detection stage
+        """
+        scraper._reset()
+        file_exists = FileExists(scraper.filename, None)
+        await self._run_all(scraper, scraper._run_scraper,
+                            scraper._collect_scraper, [file_exists], stage)
+        if file_exists.well_formed is False:
+            return
+
+        scraper.info = {}
+        detectors = scraper._detectors()
+        if not scraper._short_circuit:
+            await self._run_all(scraper, scraper._run_detector,
+                                scraper._collect_detector, detectors, stage)
+        else:
+            usages = {}
+            for detector in scraper._detection_order(detectors):
+                usages[id(detector)] = await self.call(
+                    scraper._run_detector, detector, stage)
+                if detector.is_final():
+                    break
+            scraper._collect_detectors(detectors, usages)
+        if scraper._needs_verapdf():
+            await self._run_all(scraper, scraper._run_detector,
+                                scraper._collect_detector,
+                                [VerapdfDetector(scraper.filename)], stage)
+
+    async def _run_all(self, scraper, run, collect, tools, stage,
+                       fail_fast=False, order=None):
+        """
+        Run detectors or scrapers concurrently and collect their results.
+
+        The tools are started in the execution order, but the results are
+        collected in the order of the tools, so that they are the same as
+        when the tools are run one by one.
+
+        :scraper: Scraper instance
+        :run: Scraper method running a tool
+        :collect: Scraper method collecting the results of a tool
+        :tools: List of detector or scraper instances
+        :stage: ResourceUsage of the stage, parent of the tool measurements
+        :fail_fast: True to skip the scrapers not yet started once the file
+                    is known not to be well-formed, if fail-fast scraping
+                    was requested
+        :order: The tools in the execution order, the order of the tools by
+                default
+        """
+        if order is None:
+            order = tools
+        fail_fast = fail_fast and scraper._fail_fast
+        if fail_fast and scraper.well_formed is False:
+            for tool in tools:
+                scraper._skip_scraper(tool)
+            return
+        failed = threading.Event()
+
+        def run_unless_failed(tool, stage):
+            """Run the tool unless the file is known not to be well-formed."""
+            if failed.is_set():
+                return None
+            usage = run(tool, stage)
+            if fail_fast and tool.well_formed is False:
+                failed.set()
+            return usage
+
+        # The tasks are created here, as gather() does not keep their order
+        usages = await asyncio.gather(
+            *[asyncio.ensure_future(self.call(run_unless_failed, tool, stage))
+              for tool in order])
+        usages = dict(zip([id(tool) for tool in order], usages))
+        for tool in tools:
+            usage = usages[id(tool)]
+            if usage is None:
+                scraper._skip_scraper(tool)
+            else:
+                collect(tool, usage)
+
+
+async def scrape_async(scraper, check_wellformed=True, concurrency=None,
+                       fail_fast=False):
+    """
+    Scrape a file in the running event loop.
+
+    :scraper: Scraper instance
+    :check_wellformed: True, full scraping; False, skip well-formed check.
+    :concurrency: Maximum number of detectors and scrapers running at the
+                  same time, ASYNC_CONCURRENCY by default
+    :fail_fast: True to stop scraping once the file is known not to be
+                well-formed, as in Scraper.scrape()
+    :returns: The scraper instance
+    """
+    runner = _Runner(concurrency)
+    try:
+        await runner.scrape(scraper, check_wellformed, fail_fast)
+    finally:
+        runner.close()
+    return scraper
+
+
+async def scrape_many_async(filenames, check_wellformed=True,
+                            concurrency=None, fail_fast=False, **kwargs):
+    """
+    Scrape several files concurrently in the running event loop.
+
+    :filenames: File paths
+    :check_wellformed: True, full scraping; False, skip well-formed check.
+    :concurrency: Maximum number of detectors and scrapers running at the
+                  same time for all files together, ASYNC_CONCURRENCY by
+                  default
+    :fail_fast: True to stop scraping each file once it is known not to be
+                well-formed, as in Scraper.scrape()
+    :kwargs: Extra arguments for Scraper
+    :returns: List of Scraper instances in the order of the filenames
+    """
+    scrapers = [Scraper(filename, **kwargs) for filename in filenames]
+    runner = _Runner(concurrency)
+    try:
+        await asyncio.gather(
+            *[runner.scrape(scraper, check_wellformed, fail_fast)
+              for scraper in scrapers])
+    finally:
+        runner.close()
+    return scrapers
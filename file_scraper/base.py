@@ -11,6 +11,7 @@ class BaseScraper(object):
 
     _supported_metadata = []
     _only_wellformed = False
+    _selection_params = []  # Keys in params that is_supported() looks at
 
     def __init__(self, filename, check_wellformed=True, params=None):
         """
@@ -283,3 +284,15 @@ class BaseDetector(object):
         method to add "mimetype" and/or "version" keys to the dict.
         """
         return {}
+
+    def is_final(self):
+        # pylint: disable=no-self-use
+        """
+        Return True if the result of the detector is final.
+
+        A final result can not be changed by the other detectors, so they
+        are not run. The method is called both before and after detect(),
+        and a detector known to be final before running is run first.
+        By default the result is not final.
+        """
+        return False
@@ -0,0 +1,399 @@
+"""Scraping of large batches of files in worker processes.
+
+The files are found by walking directories or by reading a manifest listing
+one path per line, and they are scraped in a pool of worker processes. The
+results are yielded as JSON serializable dicts in the order the files are
+finished::
+
+    files = list(iter_files(["/data"], include=["*.pdf"]))
+    for result in scrape_batch([path for (path, _) in files], processes=4):
+        print(result["filename"], result["well_formed"])
+"""
+from __future__ import unicode_literals
+
+import fnmatch
+import io
+import json
+import os
+import sys
+import time
+
+import six
+
+from file_scraper import metrics
+from file_scraper.sampling import StackSampler
+from file_scraper.scheduler import save_default_schedulers
+from file_scraper.scraper import Scraper
+from file_scraper.utils import LazyModule, decode_path
+
+multiprocessing = LazyModule(  # pylint: disable=invalid-name
+    "multiprocessing", ["multiprocessing.pool", "multiprocessing.util"])
+
+# Stack sampler and metrics registry of a worker process
+_WORKER_SAMPLER = None
+_WORKER_REGISTRY = None
+
+
+def _matches(path, patterns):
+    """
+    Find out whether a path matches any of the glob patterns.
+
+    Patterns containing a slash are matched against the whole path, others
+    against the last component of the path.
+
+    :path: File or directory path
+    :patterns: List of glob patterns
+    :returns: True if the path matches
+    """
+    name = os.path.basename(path)
+    for pattern in patterns:
+        if fnmatch.fnmatch(path if "/" in pattern else name, pattern):
+            return True
+    return False
+
+
+def _selected(path, include, exclude):
+    """
+    Find out whether a file is selected by the include and exclude globs.
+
+    :path: File path
+    :include: List of glob patterns of which a file must match one, or None
+              to include all files
+    :exclude: List of glob patterns of excluded files and directories
+    :returns: True if the file is selected
+    """
+    if include and not _matches(path, include):
+        return False
+    return not (exclude and _matches(path, exclude))
+
+
+def _scandir(directory):
+    """
+    List the entries of a directory.
+
+    os.scandir() is used when available, as it gets the file types without
+    extra system calls.
+
+    :directory: Directory path
+    :returns: List of tuples (path, is_dir, size) sorted by name, size None
+              for directories
+    """
+    entries = []
+    if hasattr(os, "scandir"):
+        for entry in os.scandir(directory):
+            if entry.is_dir(follow_symlinks=False):
+                entries.append((entry.path, True, None))
+            else:
+                entries.append((entry.path, False, _size(entry.path, entry)))
+    else:
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                entries.append((path, True, None))
+            else:
+                entries.append((path, False, _size(path)))
+    return sorted(entries)
+
+
+def _size(path, entry=None):
+    """
+    Return the size of a file.
+
+    :path: File path
+    :entry: os.DirEntry of the file, if available
+    :returns: Size in bytes, 0 if the file can not be accessed
+    """
+    try:
+        if entry is not None:
+            return entry.stat().st_size
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+def iter_files(paths, include=None, exclude=None):
+    """
+    Iterate the files in the given files and directories.
+
+    The directories are walked recursively in the order of the file names.
+    Symbolic links to directories are not followed. Excluded directories
+    are not walked.
+
+    :paths: File and directory paths
+    :include: List of glob patterns of which a file must match one, or None
+              to include all files
+    :exclude: List of glob patterns of excluded files and directories
+    :returns: Iterator of tuples (path, size)
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            if _selected(path, include, exclude):
+                yield (path, _size(path))
+            continue
+
+        stack = [path]
+        while stack:
+            directories = []
+            for (entry, is_dir, size) in _scandir(stack.pop()):
+                if is_dir:
+                    if not (exclude and _matches(entry, exclude)):
+                        directories.append(entry)
+                elif _selected(entry, include, exclude):
+                    yield (entry, size)
+            stack.extend(reversed(directories))
+
+
+def read_manifest(manifest, include=None, exclude=None):
+    """
+    Iterate the files listed in a manifest.
+
+    :manifest: Path of a file listing one file path per line, or "-" to read
+               the paths from the standard input
+    :include: List of glob patterns of which a file must match one, or None
+              to include all files
+    :exclude: List of glob patterns of excluded files
+    :returns: Iterator of tuples (path, size)
+    """
+    if manifest == "-":
+        infile = io.open(sys.stdin.fileno(), "rt", encoding="utf-8",
+                         closefd=False)
+    else:
+        infile = io.open(manifest, "rt", encoding="utf-8")
+    with infile:
+        for line in infile:
+            path = line.rstrip("\r\n")
+            if path and _selected(path, include, exclude):
+                yield (path, _size(path))
+
+
+def scrape_one(filename, detect_only=False, check_wellformed=True,
+               fail_fast=False, **kwargs):
+    """
+    Scrape a file and return the results.
+
+    Errors in scraping are reported in the results instead of raising them,
+    so that one file does not stop a batch.
+
+    :filename: File path
+    :detect_only: True to only detect the file type
+    :check_wellformed: True, full scraping; False, skip well-formed check.
+    :fail_fast: True to stop scraping once the file is known not to be
+                well-formed
+    :kwargs: Extra arguments for Scraper
+    :returns: dict with keys "filename", "mimetype", "version",
+              "well_formed", "streams" and "info", "resource_usage" if
+              requested, and "profile" if a profile was written, or
+              "filename" and "error" if scraping failed
+    """
+    start = time.time()
+    result = {"filename": decode_path(filename)}
+    try:
+        scraper = Scraper(filename, **kwargs)
+        if detect_only:
+            scraper.detect_filetype()
+        else:
+            scraper.scrape(check_wellformed, fail_fast=fail_fast)
+    except Exception as error:  # pylint: disable=broad-except
+        result["error"] = "{}: {}".format(error.__class__.__name__,
+                                          six.text_type(error))
+        metrics.record_file(filename, result, time.time() - start)
+        return result
+
+    result.update({"mimetype": scraper.mimetype,
+                   "version": scraper.version,
+                   "well_formed": scraper.well_formed,
+                   "streams": scraper.streams,
+                   "info": scraper.info})
+    if scraper.resource_usage is not None:
+        result["resource_usage"] = scraper.resource_usage
+    if scraper.profile is not None:
+        result["profile"] = scraper.profile
+    metrics.record_file(filename, result, time.time() - start)
+    return result
+
+
+class MemorySummary(object):
+    """Peak memory of the scrapers over a batch, by scraper and MIME type."""
+
+    def __init__(self):
+        """Initialize summary."""
+        self.peaks = {}
+
+    def add(self, result):
+        """
+        Add the peak memory figures of the scrapers of a file.
+
+        :result: Results of scrape_one() scraped in the memory usage mode
+        """
+        for info in six.itervalues(result.get("info") or {}):
+            memory = info.get("memory_usage")
+            if memory is None:
+                continue
+            key = (info["class"], result.get("mimetype"))
+            peak = self.peaks.setdefault(key, {"files": 0,
+                                               "python_peak": None,
+                                               "child_maxrss": 0})
+            peak["files"] += 1
+            if memory["python_peak"] is not None:
+                peak["python_peak"] = max(peak["python_peak"] or 0,
+                                          memory["python_peak"])
+            peak["child_maxrss"] = max(peak["child_maxrss"],
+                                       memory["child_maxrss"])
+
+    def largest(self, limit=None):
+        """
+        Return the scrapers with the largest peaks.
+
+        :limit: Maximum number of the scrapers, or None for all
+        :returns: List of tuples (scraper class, MIME type, peaks), where
+                  peaks is a dict with the number of files under the key
+                  "files", the largest Python peak in bytes under
+                  "python_peak", and the largest peak resident set size of
+                  the subprocesses in kilobytes under "child_maxrss", sorted
+                  by the larger of the two peaks
+        """
+        def size(item):
+            """Return the larger peak in bytes."""
+            peak = item[1]
+            return max(peak["python_peak"] or 0, peak["child_maxrss"] * 1024)
+
+        ordered = sorted(six.iteritems(self.peaks),
+                         key=lambda item: (-size(item), item[0][0],
+                                           item[0][1] or ""))
+        return [(key[0], key[1], peak) for (key, peak) in ordered[:limit]]
+
+
+def dump_result(result):
+    """
+    Serialize the results of a file as a line of JSON Lines.
+
+    :result: Results of scrape_one()
+    :returns: Line as UTF-8 encoded bytes, ending in a newline
+    """
+    line = json.dumps(result, sort_keys=True, ensure_ascii=False,
+                      default=six.text_type)
+    return (line + "\n").encode("utf-8")
+
+
+def _scrape_task(task):
+    """
+    Scrape a file in a worker process.
+
+    :task: Tuple of the file path and the keyword arguments of scrape_one()
+    :returns: Results of scrape_one()
+    """
+    (filename, kwargs) = task
+    return scrape_one(filename, **kwargs)
+
+
+def _save_scheduler(scheduler):
+    """
+    Save the runs recorded by the scheduler of the scraped files.
+
+    :scheduler: Value of the scheduler argument of Scraper
+    """
+    if scheduler is True:
+        save_default_schedulers()
+    elif scheduler:
+        scheduler.save()
+
+
+def _start_worker(interval, metered):
+    """
+    Start a worker process.
+
+    The stacks are sampled and the metrics recorded if requested, and the
+    runs recorded by the schedulers are saved when the worker exits.
+
+    :interval: Sampling interval in seconds, or None to not sample
+    :metered: True to record the metrics
+    """
+    # pylint: disable=global-statement
+    global _WORKER_SAMPLER, _WORKER_REGISTRY
+    multiprocessing.util.Finalize(None, save_default_schedulers,
+                                  exitpriority=10)
+    if interval is not None:
+        _WORKER_SAMPLER = StackSampler(interval)
+        _WORKER_SAMPLER.start()
+    if metered:
+        _WORKER_REGISTRY = metrics.Registry()
+        metrics.set_registry(_WORKER_REGISTRY)
+
+
+def _observed_task(task):
+    """
+    Scrape a file in a worker process sampling its stacks or its metrics.
+
+    :task: Tuple of the file path and the keyword arguments of scrape_one()
+    :returns: Tuple of the results of scrape_one(), and the stacks sampled
+              and the metrics recorded since the previous file, or None for
+              those not observed
+    """
+    result = _scrape_task(task)
+    counts = None
+    if _WORKER_SAMPLER is not None:
+        counts = _WORKER_SAMPLER.take()
+    state = None
+    if _WORKER_REGISTRY is not None:
+        state = _WORKER_REGISTRY.take()
+    return (result, counts, state)
+
+
+def scrape_batch(filenames, processes=1, sampler=None, registry=None,
+                 **kwargs):
+    """
+    Scrape files in worker processes.
+
+    :filenames: Iterable of file paths
+    :processes: Number of worker processes, 1 to scrape the files in this
+                process
+    :sampler: StackSampler to which the stacks sampled in the worker
+              processes are merged, or None to not sample
+    :registry: file_scraper.metrics.Registry to which the metrics of the
+               worker processes are merged, or None to not record them
+    :kwargs: Arguments for scrape_one() and Scraper
+    :returns: Iterator of the results of scrape_one(), in the order the
+              files are finished. The runs recorded by the scheduler are
+              saved when the iterator is exhausted.
+    """
+    tasks = ((filename, kwargs) for filename in filenames)
+    if processes <= 1:
+        if sampler is not None:
+            sampler.start()
+        if registry is not None:
+            previous = metrics.set_registry(registry)
+        try:
+            for task in tasks:
+                yield _scrape_task(task)
+        finally:
+            _save_scheduler(kwargs.get("scheduler"))
+            if sampler is not None:
+                sampler.stop()
+            if registry is not None:
+                metrics.set_registry(previous)
+        return
+
+    pool = multiprocessing.Pool(processes, _start_worker, (
+        None if sampler is None else sampler.interval, registry is not None))
+    if sampler is None and registry is None:
+        run = _scrape_task
+    else:
+        run = _observed_task
+    # The workers save their schedulers when they exit after close(), so
+    # they are terminated only when the batch is interrupted
+    finished = False
+    try:
+        for result in pool.imap_unordered(run, tasks):
+            if run is _observed_task:
+                (result, counts, state) = result
+                if sampler is not None:
+                    sampler.merge(counts)
+                if registry is not None:
+                    registry.merge(state)
+            yield result
+        pool.close()
+        finished = True
+    finally:
+        if not finished:
+            pool.terminate()
+        pool.join()
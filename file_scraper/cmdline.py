@@ -0,0 +1,374 @@
+"""Command line tool for scraping batches of files.
+
+The files given as arguments, found in the given directories or listed in a
+manifest are scraped in worker processes, and the results are written as
+JSON Lines, one JSON object per file::
+
+    file-scraper --processes 8 --include "*.pdf" /data > results.jsonl
+
+The progress and the throughput are reported to the standard error, so the
+tool also serves as a benchmark harness for scraping large batches.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import io
+import os
+import sys
+import time
+
+from file_scraper.batch import (MemorySummary, dump_result, iter_files,
+                                read_manifest, scrape_batch)
+from file_scraper.config import (METRICS_INTERVAL, PROFILE_SAMPLE,
+                                  PROFILE_THRESHOLD)
+from file_scraper.journal import Journal
+from file_scraper.metrics import Registry, TextfileWriter
+from file_scraper.sampling import StackSampler
+from file_scraper.utils import decode_path
+
+
+def _format_bytes(size):
+    """
+    Format a byte count for humans.
+
+    :size: Number of bytes
+    :returns: Formatted string, e.g. "1.5 MB"
+    """
+    for unit in ["B", "kB", "MB", "GB"]:
+        if size < 1000:
+            return "{:.1f} {}".format(size, unit)
+        size /= 1000.0
+    return "{:.1f} TB".format(size)
+
+
+def _format_duration(seconds):
+    """
+    Format a duration as hours, minutes and seconds.
+
+    :seconds: Duration in seconds
+    :returns: Formatted string, e.g. "0:01:05"
+    """
+    (minutes, seconds) = divmod(int(seconds), 60)
+    (hours, minutes) = divmod(minutes, 60)
+    return "{}:{:02d}:{:02d}".format(hours, minutes, seconds)
+
+
+class Progress(object):
+    """Progress and throughput of a batch."""
+
+    def __init__(self, total_files, total_bytes, stream=None, interval=1.0):
+        """
+        Initialize progress.
+
+        :total_files: Number of files in the batch
+        :total_bytes: Total size of the files in bytes
+        :stream: Text stream where the progress is shown, or None to not
+                 show it
+        :interval: Minimum interval of showing the progress in seconds
+        """
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files = 0
+        self.bytes = 0
+        self.start = time.time()
+        self._stream = stream
+        self._interval = interval
+        self._shown = 0
+        self._width = 0
+
+    def update(self, size):
+        """
+        Record a finished file and show the progress if it is time to.
+
+        :size: Size of the file in bytes
+        """
+        self.files += 1
+        self.bytes += size
+        now = time.time()
+        if self._stream is not None and (
+                now - self._shown >= self._interval or
+                self.files == self.total_files):
+            self._shown = now
+            status = self.status()
+            self._stream.write("\r" + status.ljust(self._width))
+            self._width = len(status)
+            self._stream.flush()
+
+    def status(self):
+        """
+        Return the progress as a line of text.
+
+        :returns: Progress with the throughput and the estimated time left
+        """
+        elapsed = max(time.time() - self.start, 1e-6)
+        files_per_second = self.files / elapsed
+        status = "{}/{} files, {}/{}, {:.1f} files/s, {}/s".format(
+            self.files, self.total_files, _format_bytes(self.bytes),
+            _format_bytes(self.total_bytes), files_per_second,
+            _format_bytes(self.bytes / elapsed))
+        if self.files and self.files < self.total_files:
+            status += ", ETA {}".format(_format_duration(
+                (self.total_files - self.files) / files_per_second))
+        return status
+
+    def summary(self):
+        """
+        Return the throughput of the whole batch.
+
+        :returns: dict with keys "files", "bytes", "seconds",
+                  "files_per_second" and "bytes_per_second"
+        """
+        elapsed = max(time.time() - self.start, 1e-6)
+        return {"files": self.files,
+                "bytes": self.bytes,
+                "seconds": elapsed,
+                "files_per_second": self.files / elapsed,
+                "bytes_per_second": self.bytes / elapsed}
+
+
+def _print_memory(memory, limit=20):
+    """
+    Report the largest peak memory of the scrapers to the standard error.
+
+    :memory: MemorySummary instance
+    :limit: Maximum number of the scrapers reported
+    """
+    largest = memory.largest(limit)
+    if not largest:
+        return
+    print("Peak memory by scraper and MIME type:", file=sys.stderr)
+    for (scraper, mimetype, peak) in largest:
+        python_peak = "n/a" if peak["python_peak"] is None else \
+            _format_bytes(peak["python_peak"])
+        print("  {} {}: Python {}, tools {}, {} files".format(
+            scraper, mimetype, python_peak,
+            _format_bytes(peak["child_maxrss"] * 1024), peak["files"]),
+              file=sys.stderr)
+
+
+def _parse_args(argv):
+    """
+    Parse the command line arguments.
+
+    :argv: List of arguments without the program name
+    :returns: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(
+        prog="file-scraper",
+        description="Scrape files and write the results as JSON Lines.")
+    parser.add_argument(
+        "paths", nargs="*", metavar="PATH",
+        help="file or directory to scrape, directories recursively")
+    parser.add_argument(
+        "-m", "--manifest", action="append", default=[],
+        help="file listing one path to scrape per line, - for stdin")
+    parser.add_argument(
+        "-o", "--output", default="-",
+        help="file for the results, stdout by default")
+    parser.add_argument(
+        "-j", "--processes", type=int, default=1,
+        help="number of worker processes, 1 by default")
+    parser.add_argument(
+        "-i", "--include", action="append", default=[], metavar="GLOB",
+        help="scrape only the files matching one of these globs")
+    parser.add_argument(
+        "-e", "--exclude", action="append", default=[], metavar="GLOB",
+        help="skip the files and directories matching these globs")
+    parser.add_argument(
+        "--detect-only", action="store_true",
+        help="only detect the file types, without scraping")
+    parser.add_argument(
+        "--no-wellformed", action="store_true",
+        help="skip the well-formed check")
+    parser.add_argument(
+        "--fail-fast", action="store_true",
+        help="stop scraping a file once it is known not to be well-formed")
+    parser.add_argument(
+        "--resource-usage", action="store_true",
+        help="include the resource usage in the results")
+    parser.add_argument(
+        "--memory-usage", action="store_true",
+        help="include the peak memory of the scrapers in the results, and "
+             "report the largest peaks")
+    parser.add_argument(
+        "--profile-dir", metavar="DIR",
+        help="write cProfile profiles of the slow and the sampled files to "
+             "DIR")
+    parser.add_argument(
+        "--profile-threshold", type=float, metavar="SECONDS",
+        help="profile the files taking at least SECONDS, {} by "
+             "default".format(PROFILE_THRESHOLD))
+    parser.add_argument(
+        "--profile-sample", type=float, metavar="FRACTION",
+        help="profile also this fraction of the files, {} by "
+             "default".format(PROFILE_SAMPLE))
+    parser.add_argument(
+        "--sample-stacks", metavar="FILE",
+        help="sample the Python stacks of the run and write them to FILE in "
+             "the collapsed stack format of flame graphs")
+    parser.add_argument(
+        "--metrics-file", metavar="FILE",
+        help="write the metrics of the run to FILE for the Prometheus "
+             "textfile collector every {} seconds".format(METRICS_INTERVAL))
+    parser.add_argument(
+        "--journal", metavar="FILE",
+        help="keep a progress journal in FILE and resume the run recorded "
+             "in it, requires --output")
+    parser.add_argument(
+        "-q", "--quiet", action="store_true",
+        help="do not report progress and throughput")
+    args = parser.parse_args(argv)
+    if not args.paths and not args.manifest:
+        parser.error("no paths or manifest given")
+    if args.journal and args.output == "-":
+        parser.error("--journal requires --output")
+    if args.processes < 1:
+        parser.error("the number of processes must be at least 1")
+    return args
+
+
+def _open_output(output, offset=None):
+    """
+    Open the output for the results.
+
+    :output: File path, or "-" for the standard output
+    :offset: Size of the results of a resumed run, or None to overwrite
+             the file
+    :returns: Binary file object
+    :raises: IOError if the file is shorter than the offset
+    """
+    if output == "-":
+        return io.open(sys.stdout.fileno(), "wb", closefd=False)
+    if offset is None:
+        return io.open(output, "wb")
+
+    outfile = io.open(output, "ab")
+    outfile.seek(0, os.SEEK_END)
+    if outfile.tell() < offset:
+        outfile.close()
+        raise IOError("The output {} is shorter than recorded in the "
+                      "journal".format(output))
+    outfile.truncate(offset)
+    outfile.seek(offset)
+    return outfile
+
+
+def _scrape(args, files, outfile, progress, journal, memory=None):
+    """
+    Scrape the files and write the results.
+
+    :args: Parsed command line arguments
+    :files: List of tuples (path, size) of the files to scrape
+    :outfile: Binary file object for the results
+    :progress: Progress instance
+    :journal: Journal instance opened for the output, or None
+    :memory: MemorySummary to which the results are added, or None
+    :returns: Number of the files for which scraping failed
+    """
+    sizes = {decode_path(path): size for (path, size) in files}
+    kwargs = {"detect_only": args.detect_only,
+              "check_wellformed": not args.no_wellformed,
+              "fail_fast": args.fail_fast}
+    if args.resource_usage:
+        kwargs["resource_usage"] = True
+    if args.memory_usage:
+        kwargs["memory_usage"] = True
+    if args.profile_dir:
+        kwargs["profile_dir"] = args.profile_dir
+        if args.profile_threshold is not None:
+            kwargs["profile_threshold"] = args.profile_threshold
+        if args.profile_sample is not None:
+            kwargs["profile_sample"] = args.profile_sample
+
+    if args.sample_stacks:
+        kwargs["sampler"] = StackSampler()
+    writer = None
+    if args.metrics_file:
+        kwargs["registry"] = Registry()
+        writer = TextfileWriter(kwargs["registry"], args.metrics_file)
+        writer.start()
+
+    errors = 0
+    try:
+        for result in scrape_batch([path for (path, _) in files],
+                                   args.processes, **kwargs):
+            errors += "error" in result
+            outfile.write(dump_result(result))
+            outfile.flush()
+            if journal is not None:
+                journal.done(result["filename"])
+            if memory is not None:
+                memory.add(result)
+            progress.update(sizes.get(result["filename"], 0))
+    finally:
+        if writer is not None:
+            writer.stop()
+
+    if args.sample_stacks:
+        with io.open(args.sample_stacks, "wt", encoding="utf-8") as stacks:
+            kwargs["sampler"].write(stacks)
+    return errors
+
+
+def main(argv=None):
+    """
+    Scrape the files given on the command line.
+
+    :argv: List of arguments without the program name, sys.argv by default
+    :returns: Exit status, 0 if all the files were scraped
+    """
+    args = _parse_args(sys.argv[1:] if argv is None else argv)
+
+    files = list(iter_files(args.paths, args.include, args.exclude))
+    for manifest in args.manifest:
+        files.extend(read_manifest(manifest, args.include, args.exclude))
+
+    journal = None
+    offset = None
+    if args.journal:
+        journal = Journal(args.journal)
+        offset = journal.load()
+        files = [(path, size) for (path, size) in files
+                 if not journal.is_done(path)]
+        if len(journal) and not args.quiet:
+            print("Resuming, {} files already scraped".format(len(journal)),
+                  file=sys.stderr)
+    try:
+        outfile = _open_output(args.output, offset)
+    except IOError as error:
+        print("file-scraper: error: {}".format(error), file=sys.stderr)
+        return 2
+
+    show = not args.quiet and sys.stderr.isatty()
+    memory = MemorySummary() if args.memory_usage else None
+    progress = Progress(len(files), sum(size for (_, size) in files),
+                        sys.stderr if show else None)
+    with outfile:
+        if journal is not None:
+            journal.open(outfile)
+        try:
+            errors = _scrape(args, files, outfile, progress, journal,
+                             memory)
+        finally:
+            if journal is not None:
+                journal.close()
+
+    if show:
+        sys.stderr.write("\n")
+    if not args.quiet:
+        summary = progress.summary()
+        print("Scraped {} files, {}, in {}: {:.1f} files/s, {}/s".format(
+            summary["files"], _format_bytes(summary["bytes"]),
+            _format_duration(summary["seconds"]),
+            summary["files_per_second"],
+            _format_bytes(summary["bytes_per_second"])), file=sys.stderr)
+        if errors:
+            print("Scraping failed for {} files".format(errors),
+                  file=sys.stderr)
+        if memory is not None:
+            _print_memory(memory)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
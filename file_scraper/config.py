@@ -13,3 +13,143 @@ PSPP_PATH = "/usr/bin/pspp-convert"
 SCHEMATRON_DIRNAME = "/usr/share/iso_schematron_xslt1"
 VERAPDF_PATH = "/usr/share/java/verapdf/verapdf"
 VNU_PATH = "/usr/share/java/vnu/vnu.jar"
+
+# ImageMagick resource limits used by WandScraper. Memory, map and disk are
+# given in bytes and thread as the number of threads. None leaves the
+# ImageMagick default (or the corresponding MAGICK_*_LIMIT environment
+# variable) in effect. Lower these when several scraper processes share a
+# machine.
+WAND_RESOURCE_LIMITS = {
+    "memory": None,
+    "map": None,
+    "disk": None,
+    "thread": None
+}
+
+# Timeouts of the external tools run by the scrapers and detectors. For each
+# tool, given as the name of the executable, the timeout is a base time plus
+# some time for each megabyte of the largest input file of the command, both
+# in seconds. Tools not listed use SHELL_DEFAULT_TIMEOUT. A timeout of None
+# lets the tool run as long as it needs.
+SHELL_DEFAULT_TIMEOUT = (600, 1)
+SHELL_TIMEOUTS = {
+    "dpxv": (60, 0.5),
+    "ffmpeg": (600, 1),
+    "file": (60, 0),
+    "gs": (300, 2),
+    "jhove": (300, 2),
+    "pngcheck": (60, 0.5),
+    "soffice": (300, 2),
+    "verapdf": (300, 2),
+    "vnu": (120, 1),
+    "xmllint": (300, 1)
+}
+
+# Seconds to wait after SIGTERM before the process group of a timed out tool
+# is killed with SIGKILL
+SHELL_KILL_GRACE = 5
+
+# Maximum number of simultaneously running instances of the expensive
+# external tools, shared by all scraper processes and threads on the machine
+# using lock files in SHELL_LOCK_DIR. A command waits for a free slot before
+# it is started, and the waiting does not count towards its timeout. Tools
+# not listed are not limited. SHELL_LOCK_DIR None uses a "file-scraper-locks"
+# directory in the system temporary directory.
+SHELL_CONCURRENCY = {
+    "ffmpeg": 4,
+    "gs": 4,
+    "jhove": 4,
+    "soffice": 1,
+    "verapdf": 2,
+    "vnu": 2
+}
+SHELL_LOCK_DIR = None
+
+# Record and replay of the external tool calls, see file_scraper.shell_fixtures.
+# In the "record" mode the commands are run and their results are stored in
+# SHELL_FIXTURE_DIR. In the "replay" mode the commands are not run, but their
+# results are served from SHELL_FIXTURE_DIR after SHELL_FIXTURE_LATENCY times
+# their recorded run time, and a command that has not been recorded fails as
+# if the tool was missing. None runs the commands normally.
+SHELL_FIXTURE_MODE = None
+SHELL_FIXTURE_DIR = "~/.cache/file-scraper/shell-fixtures"
+SHELL_FIXTURE_LATENCY = 0.0
+
+# Profiling of single files with Scraper(filename, profile_dir=directory): the
+# profile of a file is written when scraping or detecting it took at least
+# PROFILE_THRESHOLD seconds, and for the fraction PROFILE_SAMPLE of the files
+# regardless of the duration. A threshold of None writes only the sampled
+# profiles.
+PROFILE_THRESHOLD = 10.0
+PROFILE_SAMPLE = 0.0
+
+# Interval of the stack samples of the sampling profiler of the batch runs, in
+# seconds of CPU time. At 100 samples per second the overhead stays around one
+# percent.
+SAMPLING_INTERVAL = 0.01
+
+# File where the tracing spans of the detection, scraping and merge phases are
+# appended in the OTLP JSON format of the OpenTelemetry file exporter, see
+# file_scraper.tracing. None disables tracing.
+TRACE_FILE = None
+
+# Metrics of the batch runs and the server for the Prometheus textfile
+# collector, see file_scraper.metrics: the metrics file is rewritten every
+# METRICS_INTERVAL seconds, and the duration histograms have buckets up to
+# these bounds in seconds.
+METRICS_INTERVAL = 15.0
+METRICS_BUCKETS = [0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0]
+
+# Outputs of the external tools run in the spooled mode are moved from memory
+# to temporary files when they grow over this many bytes. SHELL_STDERR_LIMIT
+# caps the stored error output of the tools that can produce huge amounts of
+# it, e.g. FFMpeg for damaged video files.
+SHELL_SPOOL_THRESHOLD = 4 * 1024**2
+SHELL_STDERR_LIMIT = 1024**2
+
+# Maximum number of detectors and scrapers running at the same time in the
+# asyncio API, i.e. Scraper.scrape_async() and file_scraper.aio
+ASYNC_CONCURRENCY = 8
+
+# History of the scraper durations and results used for ordering the scrapers
+# with Scraper(filename, scheduler=True), and the number of runs of a scraper
+# for a MIME type needed before its history is used
+SCHEDULER_HISTORY_PATH = "~/.cache/file-scraper/scraper-history.json"
+SCHEDULER_MIN_RUNS = 5
+
+# The recorded runs are kept in memory and added to the history file after
+# this many files or after this many seconds, whichever comes first, and at
+# the end of a batch run
+SCHEDULER_SAVE_FILES = 100
+SCHEDULER_SAVE_INTERVAL = 60.0
+
+# Run the detectors one by one and stop when a detector gives a final result,
+# e.g. when the user has given both the MIME type and the version. When False,
+# all the detectors are always run.
+DETECTION_SHORT_CIRCUIT = True
+
+# The progress journal of the batch runs is written to disk after this many
+# files or after this many seconds, whichever comes first
+JOURNAL_SYNC_FILES = 1000
+JOURNAL_SYNC_INTERVAL = 10.0
+
+# Number of worker threads of the scraping server, and the maximum number of
+# requests waiting for a worker before new requests are rejected
+SERVER_WORKERS = 4
+SERVER_QUEUE_SIZE = 32
+
+# Distributed batch mode of file_scraper.distributed. A claimed file is leased
+# to a worker for QUEUE_LEASE seconds, renewed while the worker scrapes its
+# claim, and a file is delivered at most QUEUE_MAX_ATTEMPTS times. The workers
+# claim QUEUE_CLAIM_FILES files per process at a time, and poll the queue every
+# QUEUE_POLL_INTERVAL seconds while waiting for the files leased to others.
+# The clocks of the nodes must agree to well within the lease.
+QUEUE_LEASE = 600.0
+QUEUE_MAX_ATTEMPTS = 3
+QUEUE_CLAIM_FILES = 4
+QUEUE_POLL_INTERVAL = 10.0
+
+# SQLite journal mode of the work queue. The default rollback journal works on
+# network filesystems. "WAL" is faster, but it needs shared memory and works
+# only when all the workers run on the same host.
+QUEUE_JOURNAL_MODE = "DELETE"
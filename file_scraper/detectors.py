@@ -2,105 +2,18 @@
 # pylint: disable=ungrouped-imports
 from __future__ import unicode_literals
 
-import lxml.etree as ET
 import six
 
-from fido.fido import Fido, defaults
-from fido.pronomutils import get_local_pronom_versions
 from file_scraper.base import BaseDetector
 from file_scraper.shell import Shell
 from file_scraper.config import VERAPDF_PATH
-from file_scraper.defaults import (MIMETYPE_DICT, PRIORITY_PRONOM, PRONOM_DICT,
-                                   VERSION_DICT)
-from file_scraper.utils import encode_path, decode_path
+from file_scraper.defaults import MIMETYPE_DICT, PRONOM_DICT
+from file_scraper.utils import encode_path, LazyModule
 from file_scraper.magiclib import magiclib, magic_analyze
 
-MAGIC_LIB = magiclib()
-
-
-class _FidoReader(Fido):
-    """Fido wrapper to get pronom code, mimetype and version."""
-
-    # Global variable in Fido
-    # pylint: disable=invalid-name, global-statement
-    # pylint: disable=global-variable-not-assigned
-    global defaults
-
-    def __init__(self, filename):
-        """
-        Initialize the reader.
-
-        Fido is done with old-style python and does not inherit object,
-        so super() is not available.
-        :filename: File path
-        """
-        self.filename = filename  # File path
-        self.puid = None  # Identified pronom code
-        self.mimetype = None  # Identified mime type
-        self.version = None  # Identified file format version
-        Fido.__init__(self, quiet=True, format_files=[
-            "formats-v94.xml", "format_extensions.xml"])
-
-    def identify(self):
-        """Identify file format with using pronom registry."""
-        versions = get_local_pronom_versions()
-        defaults["xml_pronomSignature"] = versions.pronom_signature
-        defaults["containersignature_file"] = \
-            versions.pronom_container_signature
-        defaults["xml_fidoExtensionSignature"] = \
-            versions.fido_extension_signature
-        defaults["format_files"] = [defaults["xml_pronomSignature"]]
-        defaults["format_files"].append(
-            defaults["xml_fidoExtensionSignature"])
-        self.identify_file(
-            # Python's zipfile module used internally by FIDO doesn't support
-            # paths that are provided as byte strings
-            filename=decode_path(self.filename), extension=False
-        )
-
-    def print_matches(self, fullname, matches, delta_t, matchtype=""):
-        """
-        Get puid, mimetype and version.
-
-        :fullname: File path
-        :matches: Matches tuples in Fido
-        :delta_t: Not needed here, but originates from Fido
-        :matchtype: Not needed here, but originates from Fido
-        """
-        # pylint: disable=unused-argument
-        for (item, _) in matches:
-            self.puid = self.get_puid(item)
-            if self.puid in PRONOM_DICT:
-                (self.mimetype, self.version) = PRONOM_DICT[self.puid]
-                return
-
-        for (item, _) in matches:
-            self.puid = self.get_puid(item)
-            if self.puid in PRIORITY_PRONOM:
-                self._find_mime(item)
-                return
-
-        for (item, _) in matches:
-            if self.mimetype is None:
-                self.puid = self.get_puid(item)
-                self._find_mime(item)
-
-    def _find_mime(self, item):
-        """
-        Find mimetype and version in Fido.
-
-        :item: Fido result
-        """
-        mime = item.find("mime")
-        self.mimetype = mime.text if mime is not None else None
-        version = item.find("version")
-        self.version = version.text if version is not None else None
-        if self.mimetype in MIMETYPE_DICT:
-            self.mimetype = MIMETYPE_DICT[self.mimetype]
-        if self.mimetype in VERSION_DICT:
-            if self.version in VERSION_DICT[self.mimetype]:
-                self.version = \
-                    VERSION_DICT[self.mimetype][self.version]
+ET = LazyModule("lxml.etree")
+fido_reader = LazyModule(  # pylint: disable=invalid-name
+    "file_scraper.fido_reader")
 
 
 class FidoDetector(BaseDetector):
@@ -114,7 +27,7 @@ class FidoDetector(BaseDetector):
 
     def detect(self):
         """Detect file format and version."""
-        fido = _FidoReader(self.filename)
+        fido = fido_reader.FidoReader(self.filename)
         fido.identify()
         self.mimetype = fido.mimetype
         self.version = fido.version
@@ -146,13 +59,25 @@ class FidoDetector(BaseDetector):
                 important["mimetype"] = self.mimetype
         return important
 
+    def is_final(self):
+        """
+        The result is final when Fido matched a PRONOM code in PRONOM_DICT.
+
+        The MIME type and version of these formats are known, so the other
+        detectors can not improve them. Formats with no version in
+        PRONOM_DICT are left to the other detectors.
+        """
+        return (not self._given_mimetype and self._puid in PRONOM_DICT and
+                bool(self.version))
+
 
 class MagicDetector(BaseDetector):
     """File magic detector."""
 
     def detect(self):
         """Detect mimetype."""
-        mimetype = magic_analyze(MAGIC_LIB, MAGIC_LIB.MAGIC_MIME_TYPE,
+        magic_lib = magiclib()
+        mimetype = magic_analyze(magic_lib, magic_lib.MAGIC_MIME_TYPE,
                                  self.filename)
         if mimetype in MIMETYPE_DICT:
             self.mimetype = MIMETYPE_DICT[mimetype]
@@ -214,6 +139,14 @@ class PredefinedDetector(BaseDetector):
         """
         return {"mimetype": self.mimetype, "version": self.version}
 
+    def is_final(self):
+        """
+        The result is final when the user gave both MIME type and version.
+
+        This is known already before running the detector.
+        """
+        return bool(self._given_mimetype and self._given_version)
+
 
 class VerapdfDetector(BaseDetector):
     """
@@ -0,0 +1,492 @@
+"""Distribution of batches of files to several nodes through a shared queue.
+
+The files are added to a work queue, a SQLite database on a filesystem
+shared by the nodes. Each node runs a worker claiming files from the queue,
+scraping them and writing the results as JSON Lines to its own result
+shard, and at the end the shards are merged::
+
+    file-scraper-queue add /shared/queue.db --manifest files.txt
+    # On each node
+    file-scraper-queue work /shared/queue.db \\
+        --output /shared/results/$(hostname).jsonl --processes 8
+    file-scraper-queue merge --output results.jsonl /shared/results/*.jsonl
+
+A claimed file is leased to the worker for a limited time, and the lease is
+renewed while the worker scrapes the files of its claim. If a node dies,
+its leases expire and the files are delivered to another worker. A file is
+delivered at most QUEUE_MAX_ATTEMPTS times, so that a file crashing the
+workers does not stop the whole batch.
+
+A file is marked done only after its result has been written to disk, so a
+result is never lost, but the result of a file may be written to two
+shards if a worker dies or its lease expires after writing it. The
+duplicates and the partially written last lines of the shards of dead
+workers are removed when the shards are merged.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+from file_scraper.batch import (dump_result, iter_files, read_manifest,
+                                scrape_batch)
+from file_scraper.config import (QUEUE_CLAIM_FILES, QUEUE_JOURNAL_MODE,
+                                 QUEUE_LEASE, QUEUE_MAX_ATTEMPTS,
+                                 QUEUE_POLL_INTERVAL)
+from file_scraper.utils import LazyModule, decode_path
+
+sqlite3 = LazyModule("sqlite3")  # pylint: disable=invalid-name
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    node TEXT,
+    expires REAL
+);
+CREATE INDEX IF NOT EXISTS items_todo ON items (done, expires);
+"""
+
+
+class WorkQueue(object):
+    """
+    Work queue of files shared by several nodes.
+
+    All the changes are made in immediate transactions, so the queue can be
+    used by any number of processes at the same time.
+    """
+
+    def __init__(self, path, node=None, lease=None, max_attempts=None,
+                 journal_mode=None):
+        """
+        Open the queue, creating it if it does not exist.
+
+        :path: Path of the queue database
+        :node: Name of this worker, by default host name and process ID
+        :lease: Time in seconds a claimed file is leased to a worker,
+                QUEUE_LEASE by default
+        :max_attempts: Maximum number of deliveries of a file,
+                       QUEUE_MAX_ATTEMPTS by default
+        :journal_mode: SQLite journal mode, QUEUE_JOURNAL_MODE by default
+        """
+        self.path = path
+        self.node = node or "{}-{}".format(socket.gethostname(), os.getpid())
+        self.lease = lease or QUEUE_LEASE
+        self.max_attempts = max_attempts or QUEUE_MAX_ATTEMPTS
+        self.journal_mode = journal_mode or QUEUE_JOURNAL_MODE
+        self._connection = sqlite3.connect(path, timeout=60,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode = {}".format(
+            self.journal_mode))
+        with self._transaction() as cursor:
+            for statement in _SCHEMA.split(";")[:-1]:
+                cursor.execute(statement)
+
+    def reopen(self):
+        """
+        Open the queue again as the same worker.
+
+        A connection can only be used in the thread that opened it, so the
+        other threads of the worker use their own.
+
+        :returns: WorkQueue instance
+        """
+        return WorkQueue(self.path, self.node, self.lease, self.max_attempts,
+                         self.journal_mode)
+
+    def _transaction(self):
+        """
+        Begin an immediate transaction.
+
+        :returns: Context manager giving a cursor, committing the
+                  transaction at exit or rolling it back on an exception
+        """
+        return _Transaction(self._connection)
+
+    def add(self, files):
+        """
+        Add files to the queue.
+
+        Files already in the queue are not added again.
+
+        :files: Iterable of tuples (path, size)
+        :returns: Number of the files added
+        """
+        with self._transaction() as cursor:
+            before = cursor.execute("SELECT COUNT(*) FROM items").fetchone()
+            cursor.executemany(
+                "INSERT OR IGNORE INTO items (path, size) VALUES (?, ?)",
+                ((decode_path(path), size) for (path, size) in files))
+            after = cursor.execute("SELECT COUNT(*) FROM items").fetchone()
+        return after[0] - before[0]
+
+    def claim(self, count=1):
+        """
+        Claim files from the queue.
+
+        The files neither done nor leased to a worker are claimed, including
+        the files whose lease has expired.
+
+        :count: Maximum number of files to claim
+        :returns: List of the claimed file paths, empty if there are no
+                  files to claim
+        """
+        now = time.time()
+        with self._transaction() as cursor:
+            rows = cursor.execute(
+                "SELECT id, path FROM items WHERE done = 0 "
+                "AND (expires IS NULL OR expires < ?) AND attempts < ? "
+                "ORDER BY id LIMIT ?",
+                (now, self.max_attempts, count)).fetchall()
+            cursor.executemany(
+                "UPDATE items SET node = ?, expires = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                [(self.node, now + self.lease, row[0]) for row in rows])
+        return [row[1] for row in rows]
+
+    def renew(self, paths):
+        """
+        Renew the leases of files claimed by this worker.
+
+        :paths: File paths
+        """
+        with self._transaction() as cursor:
+            cursor.executemany(
+                "UPDATE items SET expires = ? WHERE path = ? AND node = ? "
+                "AND done = 0",
+                [(time.time() + self.lease, path, self.node)
+                 for path in paths])
+
+    def complete(self, paths):
+        """
+        Mark files done.
+
+        :paths: File paths
+        """
+        with self._transaction() as cursor:
+            cursor.executemany(
+                "UPDATE items SET done = 1, expires = NULL WHERE path = ?",
+                [(path,) for path in paths])
+
+    def status(self):
+        """
+        Count the files in the queue by their state.
+
+        :returns: dict with keys "pending", "claimed", "done" and "failed",
+                  the failed files being those delivered the maximum number
+                  of times without being done
+        """
+        status = {"pending": 0, "claimed": 0, "done": 0, "failed": 0}
+        rows = self._connection.execute(
+            "SELECT CASE WHEN done THEN 'done' "
+            "WHEN expires >= ? THEN 'claimed' "
+            "WHEN attempts >= ? THEN 'failed' "
+            "ELSE 'pending' END AS state, COUNT(*) FROM items GROUP BY state",
+            (time.time(), self.max_attempts))
+        status.update(dict(rows))
+        return status
+
+    def close(self):
+        """Close the queue."""
+        self._connection.close()
+
+
+class _Transaction(object):
+    """Immediate SQLite transaction used as a context manager."""
+
+    def __init__(self, connection):
+        """
+        Initialize transaction.
+
+        :connection: sqlite3.Connection in autocommit mode
+        """
+        self._connection = connection
+        self._cursor = None
+
+    def __enter__(self):
+        """Begin the transaction, waiting for other writers."""
+        self._cursor = self._connection.cursor()
+        self._cursor.execute("BEGIN IMMEDIATE")
+        return self._cursor
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Commit or roll back the transaction."""
+        self._cursor.execute("ROLLBACK" if exc_type else "COMMIT")
+        self._cursor.close()
+
+
+def _open_shard(path):
+    """
+    Open a result shard for appending.
+
+    A partially written last line, left by a worker that died, is removed.
+
+    :path: Shard path
+    :returns: Binary file object
+    """
+    outfile = io.open(path, "a+b")
+    size = outfile.seek(0, os.SEEK_END)
+    if size:
+        outfile.seek(max(size - 65536, 0))
+        tail = outfile.read()
+        if not tail.endswith(b"\n"):
+            newline = tail.rfind(b"\n")
+            outfile.truncate(size - len(tail) + newline + 1
+                             if newline >= 0 else 0)
+    outfile.seek(0, os.SEEK_END)
+    return outfile
+
+
+class _Heartbeat(object):
+    """Thread renewing the leases of the unfinished files of a claim."""
+
+    def __init__(self, work_queue, paths, interval=None):
+        """
+        Initialize heartbeat.
+
+        :work_queue: WorkQueue instance of the worker
+        :paths: Paths of the claimed files
+        :interval: Seconds between the renewals, a third of the lease by
+                   default
+        """
+        self._work_queue = work_queue
+        self._unfinished = set(paths)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.interval = interval or work_queue.lease / 3.0
+
+    def __enter__(self):
+        """Start renewing the leases."""
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop renewing the leases."""
+        self._stopped.set()
+        self._thread.join()
+
+    def done(self, path):
+        """
+        Stop renewing the lease of a finished file.
+
+        :path: File path
+        """
+        with self._lock:
+            self._unfinished.discard(path)
+
+    def _run(self):
+        """Renew the leases of the unfinished files until stopped."""
+        work_queue = self._work_queue.reopen()
+        try:
+            while not self._stopped.wait(self.interval):
+                with self._lock:
+                    paths = list(self._unfinished)
+                if paths:
+                    work_queue.renew(paths)
+        finally:
+            work_queue.close()
+
+
+def work(work_queue, output, processes=1, claim_files=None,
+         poll_interval=None, **kwargs):
+    """
+    Scrape files claimed from the queue until all the files are done.
+
+    The files are claimed claim_files files per process at a time, and the
+    leases of the files not yet finished are renewed every third of the
+    lease while the claim is being scraped. When there are no files to
+    claim but files leased to other workers, the queue is polled until their
+    leases expire or they are done.
+
+    :work_queue: WorkQueue instance
+    :output: Path of the result shard of this worker
+    :processes: Number of worker processes
+    :claim_files: Number of files claimed per process, QUEUE_CLAIM_FILES by
+                  default
+    :poll_interval: Interval of polling the queue in seconds,
+                    QUEUE_POLL_INTERVAL by default
+    :kwargs: Arguments for scrape_one() and Scraper
+    :returns: Tuple of the numbers of the files scraped and of the files for
+              which scraping failed
+    """
+    claim_files = claim_files or QUEUE_CLAIM_FILES
+    if poll_interval is None:
+        poll_interval = QUEUE_POLL_INTERVAL
+    files = 0
+    errors = 0
+    with _open_shard(output) as outfile:
+        while True:
+            paths = work_queue.claim(claim_files * processes)
+            if not paths:
+                if not work_queue.status()["claimed"]:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            with _Heartbeat(work_queue, paths) as heartbeat:
+                for result in scrape_batch(paths, processes, **kwargs):
+                    outfile.write(dump_result(result))
+                    outfile.flush()
+                    heartbeat.done(result["filename"])
+                    files += 1
+                    errors += "error" in result
+            os.fsync(outfile.fileno())
+            work_queue.complete(paths)
+    return (files, errors)
+
+
+def merge_results(shards, outfile):
+    """
+    Merge result shards.
+
+    Only the first result of each file is kept, and the lines that are not
+    valid JSON, i.e. partially written by workers that died, are skipped.
+
+    :shards: Paths of the result shards
+    :outfile: Binary file object for the merged results
+    :returns: Number of the results written
+    """
+    seen = set()
+    for shard in shards:
+        with io.open(shard, "rb") as infile:
+            for line in infile:
+                try:
+                    filename = json.loads(line.decode("utf-8"))["filename"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if filename not in seen:
+                    seen.add(filename)
+                    outfile.write(line if line.endswith(b"\n")
+                                  else line + b"\n")
+    return len(seen)
+
+
+def _parse_args(argv):
+    """
+    Parse the command line arguments.
+
+    :argv: List of arguments without the program name
+    :returns: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(
+        prog="file-scraper-queue",
+        description="Scrape files on several nodes through a shared queue.")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    add = commands.add_parser("add", help="add files to the queue")
+    add.add_argument("queue", help="path of the queue database")
+    add.add_argument(
+        "paths", nargs="*", metavar="PATH",
+        help="file or directory to add, directories recursively")
+    add.add_argument(
+        "-m", "--manifest", action="append", default=[],
+        help="file listing one path to add per line, - for stdin")
+    add.add_argument(
+        "-i", "--include", action="append", default=[], metavar="GLOB",
+        help="add only the files matching one of these globs")
+    add.add_argument(
+        "-e", "--exclude", action="append", default=[], metavar="GLOB",
+        help="skip the files and directories matching these globs")
+
+    worker = commands.add_parser(
+        "work", help="scrape files from the queue until all are done")
+    worker.add_argument("queue", help="path of the queue database")
+    worker.add_argument(
+        "-o", "--output", required=True,
+        help="result shard of this worker, appended to")
+    worker.add_argument(
+        "-j", "--processes", type=int, default=1,
+        help="number of worker processes, 1 by default")
+    worker.add_argument(
+        "--detect-only", action="store_true",
+        help="only detect the file types, without scraping")
+    worker.add_argument(
+        "--no-wellformed", action="store_true",
+        help="skip the well-formed check")
+    worker.add_argument(
+        "--fail-fast", action="store_true",
+        help="stop scraping a file once it is known not to be well-formed")
+    worker.add_argument(
+        "--resource-usage", action="store_true",
+        help="include the resource usage in the results")
+
+    status = commands.add_parser("status", help="show the state of the queue")
+    status.add_argument("queue", help="path of the queue database")
+
+    merge = commands.add_parser("merge", help="merge result shards")
+    merge.add_argument("shards", nargs="+", metavar="SHARD",
+                       help="result shard")
+    merge.add_argument(
+        "-o", "--output", required=True, help="file for the merged results")
+
+    args = parser.parse_args(argv)
+    if args.command == "add" and not args.paths and not args.manifest:
+        parser.error("no paths or manifest given")
+    if args.command == "work" and args.processes < 1:
+        parser.error("the number of processes must be at least 1")
+    return args
+
+
+def main(argv=None):
+    """
+    Run a command of the distributed batch mode.
+
+    :argv: List of arguments without the program name, sys.argv by default
+    :returns: Exit status, 0 if the command succeeded
+    """
+    args = _parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.command == "merge":
+        with io.open(args.output, "wb") as outfile:
+            count = merge_results(args.shards, outfile)
+        print("Merged {} results".format(count), file=sys.stderr)
+        return 0
+
+    work_queue = WorkQueue(args.queue)
+    try:
+        if args.command == "add":
+            added = work_queue.add(iter_files(args.paths, args.include,
+                                              args.exclude))
+            for manifest in args.manifest:
+                added += work_queue.add(read_manifest(
+                    manifest, args.include, args.exclude))
+            print("Added {} files".format(added), file=sys.stderr)
+            return 0
+
+        if args.command == "status":
+            print(json.dumps(work_queue.status(), sort_keys=True))
+            return 0
+
+        kwargs = {"detect_only": args.detect_only,
+                  "check_wellformed": not args.no_wellformed,
+                  "fail_fast": args.fail_fast}
+        if args.resource_usage:
+            kwargs["resource_usage"] = True
+        start = time.time()
+        (files, errors) = work(work_queue, args.output, args.processes,
+                               **kwargs)
+        print("Scraped {} files in {:.1f} s".format(
+            files, time.time() - start), file=sys.stderr)
+        if errors:
+            print("Scraping failed for {} files".format(errors),
+                  file=sys.stderr)
+        return 1 if errors else 0
+    finally:
+        work_queue.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,3 +11,8 @@ class SkipElementException(Exception):
 class ImportantMetadataAlreadyDefined(Exception):
     """Exception to tell that the given key has already been defined as
     important."""
+
+
+class ShellTimeoutError(Exception):
+    """Exception to tell that an external command was terminated because it
+    did not finish within its timeout."""
@@ -5,14 +5,12 @@ import re
 import six
 
 from file_scraper.base import BaseScraper
+from file_scraper.config import SHELL_STDERR_LIMIT
 from file_scraper.shell import Shell
 from file_scraper.ffmpeg.ffmpeg_model import FFMpegSimpleMeta, FFMpegMeta
-from file_scraper.utils import ensure_text, encode_path
+from file_scraper.utils import ensure_text, encode_path, LazyModule
 
-try:
-    import ffmpeg
-except ImportError:
-    pass
+ffmpeg = LazyModule("ffmpeg")  # pylint: disable=invalid-name
 
 
 class FFMpegScraper(BaseScraper):
@@ -67,8 +65,12 @@ class FFMpegScraper(BaseScraper):
             self._errors.append("Error in analyzing file.")
             self._errors.append(ensure_text(err.stderr))
 
-        shell = Shell(["ffmpeg", "-v", "error", "-i",
-                               encode_path(self.filename), "-f", "null", "-"])
+        command = ["ffmpeg", "-v", "error"]
+        if self._params.get("fail_fast"):
+            # Stop decoding at the first error, as only the verdict is needed
+            command.append("-xerror")
+        command += ["-i", encode_path(self.filename), "-f", "null", "-"]
+        shell = Shell(command, stderr_limit=SHELL_STDERR_LIMIT)
 
         if shell.returncode == 0:
             self._messages.append("The file was analyzed successfully.")
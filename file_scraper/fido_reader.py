@@ -0,0 +1,124 @@
+"""Fido wrapper for the Fido detector.
+
+Fido loads its signature files when it is initialized, not when it is
+imported. FidoReader initializes Fido only for its first instance, and the
+later instances share the signatures cached in _SIGNATURES. This module is
+imported only when a file is first identified with Fido.
+"""
+from __future__ import unicode_literals
+
+import threading
+
+from fido.fido import Fido, defaults
+from fido.pronomutils import get_local_pronom_versions
+from file_scraper.defaults import (MIMETYPE_DICT, PRIORITY_PRONOM, PRONOM_DICT,
+                                   VERSION_DICT)
+from file_scraper.utils import decode_path
+
+FORMAT_FILES = ["formats-v94.xml", "format_extensions.xml"]
+
+# Signatures loaded by Fido, shared by the FidoReader instances. They are
+# only read when identifying files.
+_SIGNATURES = {}
+_SIGNATURES_LOCK = threading.Lock()
+
+
+class FidoReader(Fido):
+    """Fido wrapper to get pronom code, mimetype and version."""
+
+    # Global variable in Fido
+    # pylint: disable=invalid-name, global-statement
+    # pylint: disable=global-variable-not-assigned
+    global defaults
+
+    def __init__(self, filename):
+        """
+        Initialize the reader.
+
+        Fido is done with old-style python and does not inherit object,
+        so super() is not available.
+        :filename: File path
+        """
+        self.filename = filename  # File path
+        self.puid = None  # Identified pronom code
+        self.mimetype = None  # Identified mime type
+        self.version = None  # Identified file format version
+        if not _SIGNATURES:
+            with _SIGNATURES_LOCK:
+                if not _SIGNATURES:
+                    Fido.__init__(self, quiet=True, format_files=FORMAT_FILES)
+                    _SIGNATURES.update({
+                        "formats": self.formats,
+                        "puid_format_map": self.puid_format_map,
+                        "puid_has_priority_over_map":
+                            self.puid_has_priority_over_map})
+                    return
+
+        # Loading the signatures takes a lot longer than identifying a
+        # file, so they are loaded only once
+        Fido.__init__(self, quiet=True, format_files=[])
+        self.formats = _SIGNATURES["formats"]
+        self.puid_format_map = _SIGNATURES["puid_format_map"]
+        self.puid_has_priority_over_map = \
+            _SIGNATURES["puid_has_priority_over_map"]
+
+    def identify(self):
+        """Identify file format with using pronom registry."""
+        versions = get_local_pronom_versions()
+        defaults["xml_pronomSignature"] = versions.pronom_signature
+        defaults["containersignature_file"] = \
+            versions.pronom_container_signature
+        defaults["xml_fidoExtensionSignature"] = \
+            versions.fido_extension_signature
+        defaults["format_files"] = [defaults["xml_pronomSignature"]]
+        defaults["format_files"].append(
+            defaults["xml_fidoExtensionSignature"])
+        self.identify_file(
+            # Python's zipfile module used internally by FIDO doesn't support
+            # paths that are provided as byte strings
+            filename=decode_path(self.filename), extension=False
+        )
+
+    def print_matches(self, fullname, matches, delta_t, matchtype=""):
+        """
+        Get puid, mimetype and version.
+
+        :fullname: File path
+        :matches: Matches tuples in Fido
+        :delta_t: Not needed here, but originates from Fido
+        :matchtype: Not needed here, but originates from Fido
+        """
+        # pylint: disable=unused-argument
+        for (item, _) in matches:
+            self.puid = self.get_puid(item)
+            if self.puid in PRONOM_DICT:
+                (self.mimetype, self.version) = PRONOM_DICT[self.puid]
+                return
+
+        for (item, _) in matches:
+            self.puid = self.get_puid(item)
+            if self.puid in PRIORITY_PRONOM:
+                self._find_mime(item)
+                return
+
+        for (item, _) in matches:
+            if self.mimetype is None:
+                self.puid = self.get_puid(item)
+                self._find_mime(item)
+
+    def _find_mime(self, item):
+        """
+        Find mimetype and version in Fido.
+
+        :item: Fido result
+        """
+        mime = item.find("mime")
+        self.mimetype = mime.text if mime is not None else None
+        version = item.find("version")
+        self.version = version.text if version is not None else None
+        if self.mimetype in MIMETYPE_DICT:
+            self.mimetype = MIMETYPE_DICT[self.mimetype]
+        if self.mimetype in VERSION_DICT:
+            if self.version in VERSION_DICT[self.mimetype]:
+                self.version = \
+                    VERSION_DICT[self.mimetype][self.version]
@@ -2,33 +2,13 @@
 # flake8: noqa
 from __future__ import unicode_literals
 
-from file_scraper.csv.csv_scraper import CsvScraper
+import importlib
+import threading
+from collections import OrderedDict
+
+from file_scraper.base import BaseScraper
 from file_scraper.detectors import FidoDetector, MagicDetector, PredefinedDetector
-from file_scraper.dpx.dpx_scraper import DpxScraper
 from file_scraper.dummy.dummy_scraper import ScraperNotFound
-from file_scraper.ffmpeg.ffmpeg_scraper import FFMpegScraper
-from file_scraper.ghostscript.ghostscript_scraper import GhostscriptScraper
-from file_scraper.jhove.jhove_scraper import (JHoveGifScraper,
-                                              JHoveHtmlScraper,
-                                              JHoveJpegScraper,
-                                              JHovePdfScraper,
-                                              JHoveTiffScraper,
-                                              JHoveWavScraper)
-from file_scraper.lxml_scraper.lxml_scraper import LxmlScraper
-from file_scraper.magic_scraper.magic_scraper import MagicScraper
-from file_scraper.mediainfo.mediainfo_scraper import MediainfoScraper
-from file_scraper.office.office_scraper import OfficeScraper
-from file_scraper.pil.pil_scraper import PilScraper
-from file_scraper.pngcheck.pngcheck_scraper import PngcheckScraper
-from file_scraper.pspp.pspp_scraper import PsppScraper
-from file_scraper.schematron.schematron_scraper import SchematronScraper
-from file_scraper.verapdf.verapdf_scraper import VerapdfScraper
-from file_scraper.vnu.vnu_scraper import VnuScraper
-from file_scraper.wand.wand_scraper import WandScraper
-from file_scraper.warctools.warctools_scraper import (ArcWarctoolsScraper,
-                                                      GzipWarctoolsScraper,
-                                                      WarcWarctoolsScraper)
-from file_scraper.xmllint.xmllint_scraper import XmllintScraper
 
 
 def iter_detectors():
@@ -42,10 +22,151 @@ def iter_detectors():
         yield cls
 
 
+# Scrapers in the order they are run. The scraper modules are imported only
+# when the scrapers are first needed.
+SCRAPERS = [
+    "file_scraper.warctools.warctools_scraper.ArcWarctoolsScraper",
+    "file_scraper.warctools.warctools_scraper.GzipWarctoolsScraper",
+    "file_scraper.warctools.warctools_scraper.WarcWarctoolsScraper",
+    "file_scraper.csv.csv_scraper.CsvScraper",
+    "file_scraper.dpx.dpx_scraper.DpxScraper",
+    "file_scraper.ffmpeg.ffmpeg_scraper.FFMpegScraper",
+    "file_scraper.ghostscript.ghostscript_scraper.GhostscriptScraper",
+    "file_scraper.jhove.jhove_scraper.JHoveGifScraper",
+    "file_scraper.jhove.jhove_scraper.JHoveHtmlScraper",
+    "file_scraper.jhove.jhove_scraper.JHoveJpegScraper",
+    "file_scraper.jhove.jhove_scraper.JHovePdfScraper",
+    "file_scraper.jhove.jhove_scraper.JHoveTiffScraper",
+    "file_scraper.jhove.jhove_scraper.JHoveWavScraper",
+    "file_scraper.lxml_scraper.lxml_scraper.LxmlScraper",
+    "file_scraper.magic_scraper.magic_scraper.MagicScraper",
+    "file_scraper.mediainfo.mediainfo_scraper.MediainfoScraper",
+    "file_scraper.office.office_scraper.OfficeScraper",
+    "file_scraper.pil.pil_scraper.PilScraper",
+    "file_scraper.pngcheck.pngcheck_scraper.PngcheckScraper",
+    "file_scraper.pspp.pspp_scraper.PsppScraper",
+    "file_scraper.schematron.schematron_scraper.SchematronScraper",
+    "file_scraper.verapdf.verapdf_scraper.VerapdfScraper",
+    "file_scraper.vnu.vnu_scraper.VnuScraper",
+    "file_scraper.wand.wand_scraper.WandScraper",
+    "file_scraper.xmllint.xmllint_scraper.XmllintScraper"
+]
+
+# Index of the scraper candidates, built on first use. It is built under the
+# lock and published with one assignment, as the scrapers are selected in
+# several threads in the thread pool of Scraper and in the server.
+_DISPATCH = {}
+_DISPATCH_LOCK = threading.Lock()
+
+# Maximum number of memoized scraper selections. The versions come from the
+# detectors, so a long-running process could otherwise collect selections
+# for any number of made up versions.
+_SUPPORTED_LIMIT = 1024
+
+
+def _import_class(path):
+    """
+    Import a class by its full dotted path.
+
+    :path: Dotted path of the class, e.g.
+           "file_scraper.csv.csv_scraper.CsvScraper"
+    :returns: The class
+    """
+    module_name, class_name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def scraper_classes():
+    """
+    Return all scraper classes in the order they are run.
+
+    The scraper modules are imported on the first call.
+
+    :returns: List of scraper classes
+    """
+    return _dispatch()["scrapers"]
+
+
+def _dispatch():
+    """
+    Return the scraper candidate index, building it on the first call.
+
+    :returns: Index as returned by _build_dispatch()
+    """
+    global _DISPATCH  # pylint: disable=global-statement
+    if not _DISPATCH:
+        with _DISPATCH_LOCK:
+            if not _DISPATCH:
+                _DISPATCH = _build_dispatch()
+    return _DISPATCH
+
+
+def _selection_flags(dispatch, params):
+    """
+    Return the parameter keys that affect the scraper selection.
+
+    :dispatch: Scraper candidate index
+    :params: Extra parameters needed for the scraper
+    :returns: Sorted tuple of those keys in params that some scraper lists
+              in its _selection_params
+    """
+    if not params:
+        return ()
+    return tuple(sorted(key for key in dispatch["selection_params"]
+                        if key in params))
+
+
+def _build_dispatch():
+    """
+    Build the scraper candidate index from the metadata models.
+
+    A scraper is a candidate for a MIME type if one of its metadata models
+    lists the MIME type as supported. Scrapers overriding is_supported() may
+    accept other MIME types too, so they are candidates for every MIME type.
+    The candidate lists keep the order of SCRAPERS.
+
+    :returns: dict with the scraper classes, the candidates by MIME type,
+              the default candidates, the selection parameters and an empty
+              memo of the supported scrapers
+    """
+    # pylint: disable=protected-access
+    scrapers = [_import_class(path) for path in SCRAPERS]
+    default_is_supported = BaseScraper.is_supported.__func__
+    overriding = [scraper for scraper in scrapers
+                  if scraper.is_supported.__func__ is not
+                  default_is_supported]
+    mimetypes = set()
+    selection_params = set()
+    for scraper in scrapers:
+        selection_params.update(scraper._selection_params)
+        for md_class in scraper._supported_metadata:
+            mimetypes.update(md_class.supported_mimetypes())
+
+    candidates = {}
+    for mimetype in mimetypes:
+        candidates[mimetype] = [
+            scraper for scraper in scrapers
+            if scraper in overriding or any(
+                mimetype in md_class.supported_mimetypes()
+                for md_class in scraper._supported_metadata)]
+
+    return {"scrapers": scrapers,
+            "candidates": candidates,
+            "default_candidates": overriding,
+            "selection_params": selection_params,
+            "supported": OrderedDict()}
+
+
 def iter_scrapers(mimetype, version, check_wellformed=True, params=None):
     """
     Iterate scrapers.
 
+    The supported scrapers are looked up from an index of candidates by MIME
+    type. The result of the is_supported() checks is memoized for each
+    combination of MIME type, version, well-formed check and those parameter
+    keys that affect the selection, keeping the _SUPPORTED_LIMIT most
+    recently used combinations.
+
     :mimetype: Identified mimetype of the file
     :version: Identified file format version
     :check_wellformed: True for the full well-formed check, False for just
@@ -53,20 +174,26 @@ def iter_scrapers(mimetype, version, check_wellformed=True, params=None):
     :params: Extra parameters needed for the scraper
     :returns: scraper class
     """
-    scraper_found = False
-
-    scrapers = [ArcWarctoolsScraper, GzipWarctoolsScraper, WarcWarctoolsScraper,
-                CsvScraper, DpxScraper, FFMpegScraper, GhostscriptScraper,
-                JHoveGifScraper, JHoveHtmlScraper, JHoveJpegScraper,
-                JHovePdfScraper, JHoveTiffScraper, JHoveWavScraper,
-                LxmlScraper, MagicScraper, MediainfoScraper, OfficeScraper,
-                PilScraper, PngcheckScraper, PsppScraper, SchematronScraper,
-                VerapdfScraper, VnuScraper, WandScraper, XmllintScraper]
-
-    for scraper in scrapers:
-        if scraper.is_supported(mimetype, version, check_wellformed, params):
-            scraper_found = True
-            yield scraper
+    dispatch = _dispatch()
+    memo = dispatch["supported"]
+    key = (mimetype, version, check_wellformed,
+           _selection_flags(dispatch, params))
+    with _DISPATCH_LOCK:
+        supported = memo.pop(key, None)
+        if supported is not None:
+            memo[key] = supported
+    if supported is None:
+        candidates = dispatch["candidates"].get(
+            mimetype, dispatch["default_candidates"])
+        supported = [scraper for scraper in candidates
+                     if scraper.is_supported(mimetype, version,
+                                             check_wellformed, params)]
+        if not supported:
+            supported = [ScraperNotFound]
+        with _DISPATCH_LOCK:
+            memo[key] = supported
+            while len(memo) > _SUPPORTED_LIMIT:
+                memo.popitem(last=False)
 
-    if not scraper_found:
-        yield ScraperNotFound
+    for scraper in supported:
+        yield scraper
@@ -1,17 +1,15 @@
 """Scraper for gif, html, jpeg, tif, pdf and wav files using JHove."""
 from __future__ import unicode_literals
 
-try:
-    import lxml.etree
-except ImportError:
-    pass
-
 from file_scraper.base import BaseScraper
 from file_scraper.shell import Shell
 from file_scraper.jhove.jhove_model import (JHoveGifMeta, JHoveHtmlMeta,
                                             JHoveJpegMeta, JHoveTiffMeta,
                                             JHovePdfMeta, JHoveWavMeta,
                                             JHoveUtf8Meta, get_field)
+from file_scraper.utils import LazyModule
+
+lxml = LazyModule("lxml", ["lxml.etree"])  # pylint: disable=invalid-name
 
 
 class JHoveScraperBase(BaseScraper):
@@ -44,20 +42,23 @@ class JHoveScraperBase(BaseScraper):
 
         exec_cmd = ["jhove", "-h", "XML", "-m",
                     self._jhove_module, self.filename]
-        shell = Shell(exec_cmd)
-
-        if shell.returncode != 0:
-            self._errors.append("JHove returned error: %s\n%s" % (
-                shell.returncode, shell.stderr))
-
-        self._report = lxml.etree.fromstring(shell.stdout_raw)
-
-        status = get_field(self._report, "status")
-        self._messages.append(status)
-        if "Well-Formed and valid" not in status:
-            self._errors.append("Validator returned error.")
-            self._errors.append(shell.stdout)
-            self._errors.append(shell.stderr)
+        # The report of a large file can be huge, so it is parsed from the
+        # spooled output instead of a copy in memory. The spooled temporary
+        # files are removed when the shell is closed.
+        with Shell(exec_cmd, spool=True) as shell:
+            if shell.returncode != 0:
+                self._errors.append("JHove returned error: %s\n%s" % (
+                    shell.returncode, shell.stderr))
+
+            self._report = lxml.etree.parse(
+                shell.open_output("stdout")).getroot()
+
+            status = get_field(self._report, "status")
+            self._messages.append(status)
+            if "Well-Formed and valid" not in status:
+                self._errors.append("Validator returned error.")
+                self._errors.append(shell.stdout)
+                self._errors.append(shell.stderr)
 
         # If the MIME type is forced, use that, otherwise scrape the MIME type
         if self._given_mimetype:
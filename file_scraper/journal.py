@@ -0,0 +1,184 @@
+"""Progress journal for resuming interrupted batch runs.
+
+The journal is an append-only file recording the files whose results have
+been written to the output. A file is recorded by a hash of its path and
+identity, i.e. device, inode, size and modification time, so a file that
+has changed after it was scraped is scraped again.
+
+The files are recorded in batches. Before a batch is appended to the
+journal, the output is flushed to disk, and the batch ends with a checkpoint
+line containing the size of the output. On resume, the journal and the
+output are truncated to the last checkpoint, so the results of the files
+not recorded, e.g. those being scraped when the run was interrupted, are
+removed from the output and the files are scraped again. Each line of the
+journal is either a hash or a checkpoint, so loading even millions of
+entries only needs to split the file into lines.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import io
+import os
+import time
+
+from file_scraper.config import JOURNAL_SYNC_FILES, JOURNAL_SYNC_INTERVAL
+from file_scraper.utils import encode_path
+
+_CHECKPOINT = b"#"
+
+
+def file_key(path):
+    """
+    Return the journal key of a file.
+
+    :path: File path
+    :returns: Key as a byte string of 16 hexadecimal digits
+    """
+    identity = [encode_path(path)]
+    try:
+        stat = os.stat(path)
+        identity.extend(str(value).encode("ascii") for value in
+                        [stat.st_dev, stat.st_ino, stat.st_size,
+                         stat.st_mtime])
+    except OSError:
+        identity.append(b"missing")
+    return hashlib.sha1(b"\0".join(identity)).hexdigest()[:16].encode(
+        "ascii")
+
+
+class Journal(object):
+    """
+    Progress journal of a batch run.
+
+    The journal is used as::
+
+        journal = Journal("run.journal")
+        offset = journal.load()
+        # Truncate the output to offset and open it for appending
+        journal.open(outfile)
+        for filename in filenames:
+            if not journal.is_done(filename):
+                # Scrape the file and write the result to outfile
+                journal.done(filename)
+        journal.close()
+    """
+
+    def __init__(self, path, sync_files=None, sync_interval=None):
+        """
+        Initialize journal.
+
+        :path: Path of the journal file
+        :sync_files: Number of files recorded in one batch,
+                     JOURNAL_SYNC_FILES by default
+        :sync_interval: Maximum time in seconds between the batches,
+                        JOURNAL_SYNC_INTERVAL by default
+        """
+        self.path = path
+        self.sync_files = sync_files or JOURNAL_SYNC_FILES
+        if sync_interval is None:
+            sync_interval = JOURNAL_SYNC_INTERVAL
+        self.sync_interval = sync_interval
+        self._done = set()
+        self._count = 0
+        self._pending = []
+        self._synced = time.time()
+        self._journal = None
+        self._output = None
+
+    def load(self):
+        """
+        Read the journal and truncate it to its last checkpoint.
+
+        :returns: Size of the output at the last checkpoint, 0 if the
+                  journal does not exist
+        """
+        try:
+            with io.open(self.path, "rb") as infile:
+                data = infile.read()
+        except IOError:
+            return 0
+
+        # The last line is either empty or written only partially, and the
+        # lines after the last checkpoint belong to an unfinished batch
+        lines = data.split(b"\n")[:-1]
+        while lines and not lines[-1].startswith(_CHECKPOINT):
+            lines.pop()
+        if not lines:
+            self._truncate(0)
+            return 0
+
+        data = data[:len(b"\n".join(lines)) + 1]
+        self._truncate(len(data))
+        self._done = set(lines)
+        self._count = len(lines) - data.count(b"\n" + _CHECKPOINT) - \
+            data.startswith(_CHECKPOINT)
+        return int(lines[-1][len(_CHECKPOINT):])
+
+    def _truncate(self, size):
+        """
+        Truncate the journal file.
+
+        :size: New size in bytes
+        """
+        with io.open(self.path, "ab") as outfile:
+            outfile.truncate(size)
+
+    def open(self, output):
+        """
+        Open the journal for appending.
+
+        :output: Binary file object where the results are written. It is
+                 flushed to disk before each batch is recorded.
+        """
+        self._output = output
+        self._journal = io.open(self.path, "ab")
+        self._synced = time.time()
+
+    def __len__(self):
+        """Return the number of files recorded in the journal."""
+        return self._count
+
+    def is_done(self, path):
+        """
+        Find out whether a file has been recorded in the journal.
+
+        :path: File path
+        :returns: True if the unchanged file has been recorded
+        """
+        return file_key(path) in self._done
+
+    def done(self, path):
+        """
+        Record a file whose result has been written to the output.
+
+        The files are appended to the journal in batches.
+
+        :path: File path
+        """
+        self._pending.append(file_key(path))
+        if len(self._pending) >= self.sync_files or \
+                time.time() - self._synced >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """Flush the output to disk and append the pending files."""
+        self._synced = time.time()
+        if not self._pending:
+            return
+        self._output.flush()
+        os.fsync(self._output.fileno())
+        self._journal.write(b"".join(key + b"\n" for key in self._pending))
+        self._journal.write(_CHECKPOINT + str(self._output.tell()).encode(
+            "ascii") + b"\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._done.update(self._pending)
+        self._count += len(self._pending)
+        self._pending = []
+
+    def close(self):
+        """Record the pending files and close the journal."""
+        if self._journal is not None:
+            self.sync()
+            self._journal.close()
+            self._journal = None
@@ -1,13 +1,11 @@
 """Class for XML and HTML5 header encoding check with lxml. """
 from __future__ import unicode_literals
 
-try:
-    from lxml import etree
-except ImportError:
-    pass
-
 from file_scraper.base import BaseScraper
 from file_scraper.lxml_scraper.lxml_model import LxmlMeta
+from file_scraper.utils import LazyModule
+
+etree = LazyModule("lxml.etree")  # pylint: disable=invalid-name
 
 
 class LxmlScraper(BaseScraper):
@@ -16,6 +14,7 @@ class LxmlScraper(BaseScraper):
     # We use JHOVE for HTML4 and XHTML files.
     _supported_metadata = [LxmlMeta]
     _only_wellformed = True  # Only well-formed check
+    _selection_params = ["schematron"]
 
     @classmethod
     def is_supported(cls, mimetype, version=None,
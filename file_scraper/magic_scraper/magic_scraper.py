@@ -18,8 +18,6 @@ from file_scraper.magic_scraper.magic_model import (BaseMagicMeta,
                                                     Jp2FileMagicMeta,
                                                     TiffFileMagicMeta)
 
-MAGIC_LIB = magiclib()
-
 
 class MagicScraper(BaseScraper):
     """Scraper for scraping files using magic."""
@@ -37,15 +35,16 @@ class MagicScraper(BaseScraper):
 
         :returns: Python dict of the three fetched values from magic
         """
+        magic_lib = magiclib()
         magicdict = {
-            "magic_mime_type": MAGIC_LIB.MAGIC_MIME_TYPE,
-            "magic_none": MAGIC_LIB.MAGIC_NONE,
-            "magic_mime_encoding": MAGIC_LIB.MAGIC_MIME_ENCODING
+            "magic_mime_type": magic_lib.MAGIC_MIME_TYPE,
+            "magic_none": magic_lib.MAGIC_NONE,
+            "magic_mime_encoding": magic_lib.MAGIC_MIME_ENCODING
         }
 
         magic_result = {}
         for key in magicdict:
-            magic_result[key] = magic_analyze(MAGIC_LIB, magicdict[key],
+            magic_result[key] = magic_analyze(magic_lib, magicdict[key],
                                               self.filename)
         return magic_result
 
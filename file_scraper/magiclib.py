@@ -12,6 +12,8 @@ from file_scraper.shell import Shell
 from file_scraper.utils import encode_path
 from file_scraper.config import FILECMD_PATH, LD_LIBRARY_PATH, MAGIC_LIBRARY
 
+_MAGIC_LIB = {}
+
 
 def file_command(filename, parameters=None):
     """Use file command in shell.
@@ -50,6 +52,18 @@ def magiclib():
     """Resolve magic library from the configuration path, and if missing,
     from the system path.
 
+    The library is resolved only once per process.
+
+    :returns: Magic module
+    """
+    if "magic" not in _MAGIC_LIB:
+        _MAGIC_LIB["magic"] = _load_magiclib()
+    return _MAGIC_LIB["magic"]
+
+
+def _load_magiclib():
+    """Load the magic library and import the magic module.
+
     :returns: Magic module
     """
     try:
@@ -11,12 +11,9 @@ from file_scraper.mediainfo.mediainfo_model import (
     SimpleMediainfoMeta,
     WavMediainfoMeta,
     )
-from file_scraper.utils import decode_path
+from file_scraper.utils import decode_path, LazyModule
 
-try:
-    from pymediainfo import MediaInfo
-except ImportError:
-    pass
+pymediainfo = LazyModule("pymediainfo")  # pylint: disable=invalid-name
 
 
 class MediainfoScraper(BaseScraper):
@@ -46,7 +43,8 @@ class MediainfoScraper(BaseScraper):
                                  "dict containing key 'mimetype_guess'.")
 
         try:
-            mediainfo = MediaInfo.parse(decode_path(self.filename))
+            mediainfo = pymediainfo.MediaInfo.parse(
+                decode_path(self.filename))
         except Exception as e:  # pylint: disable=invalid-name, broad-except
             self._errors.append("Error in analyzing file.")
             self._errors.append(six.text_type(e))
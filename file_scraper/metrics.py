@@ -0,0 +1,421 @@
+"""Metrics of long-running scraping for the Prometheus textfile collector.
+
+When a registry is set, the counters and histograms of the scraped files,
+the detectors and scrapers, the external commands and the caches are kept
+in it, and a TextfileWriter writes them periodically in the Prometheus text
+format to a file read by the textfile collector of node_exporter::
+
+    registry = Registry()
+    writer = TextfileWriter(registry, "/var/lib/node_exporter/scraper.prom")
+    writer.start()
+    for result in scrape_batch(filenames, 8, registry=registry):
+        ...
+    writer.stop()
+
+The file is written under a temporary name and renamed, so that the
+collector never reads a partial file. The metrics are:
+
+    file_scraper_files_total            Files by MIME type and outcome
+    file_scraper_file_bytes_total       Bytes in the files by MIME type
+    file_scraper_file_duration_seconds  Histogram of the durations of files
+    file_scraper_tool_duration_seconds  Histogram of the durations of the
+                                        detectors and scrapers by class
+    file_scraper_subprocesses_total     External commands run by tool
+    file_scraper_subprocess_timeouts_total
+                                        External commands timed out by tool
+    file_scraper_cache_requests_total   Cache lookups by cache and result,
+                                        "hit" or "miss"
+    file_scraper_read_bytes_total       Bytes read by the Python processes,
+                                        if the resource usage is measured
+    file_scraper_server_rejected_total  Requests rejected by the server
+
+The outcome of a file is "well_formed", "not_well_formed", "unknown" for
+the files not checked, or "error" if scraping failed. Without a registry
+nothing is recorded.
+"""
+from __future__ import unicode_literals
+
+import bisect
+import errno
+import os
+import tempfile
+import threading
+import time
+
+import six
+from file_scraper.config import METRICS_BUCKETS, METRICS_INTERVAL
+
+# Types and descriptions of the metrics by name
+_METRICS = {
+    "file_scraper_files_total": (
+        "counter", "Files scraped by MIME type and outcome."),
+    "file_scraper_file_bytes_total": (
+        "counter", "Bytes in the scraped files by MIME type."),
+    "file_scraper_file_duration_seconds": (
+        "histogram", "Time spent scraping a file."),
+    "file_scraper_tool_duration_seconds": (
+        "histogram", "Time spent in a detector or a scraper."),
+    "file_scraper_subprocesses_total": (
+        "counter", "External commands run by tool."),
+    "file_scraper_subprocess_timeouts_total": (
+        "counter", "External commands terminated at their timeout by tool."),
+    "file_scraper_cache_requests_total": (
+        "counter", "Cache lookups by cache and result."),
+    "file_scraper_read_bytes_total": (
+        "counter", "Bytes read by the scraping processes."),
+    "file_scraper_server_rejected_total": (
+        "counter", "Requests rejected by the overloaded server."),
+}
+
+
+def _labels(labels):
+    """
+    Return labels in the form used as a key.
+
+    :labels: dict of the label values by name, or None
+    :returns: Tuple of (name, value) pairs sorted by name
+    """
+    if not labels:
+        return ()
+    return tuple(sorted((key, six.text_type(value))
+                        for (key, value) in six.iteritems(labels)))
+
+
+def _escape(value):
+    """
+    Escape a label value for the text format.
+
+    :value: Label value as text
+    :returns: Escaped text
+    """
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace(
+        "\n", "\\n")
+
+
+def _sample(name, labels, value):
+    """
+    Format a sample line of the text format.
+
+    :name: Name of the sample
+    :labels: Labels as returned by _labels()
+    :value: Number, or text for the special values
+    :returns: Line without the newline
+    """
+    if isinstance(value, float):
+        value = repr(value)
+    if labels:
+        name = "{}{{{}}}".format(name, ",".join(
+            "{}=\"{}\"".format(key, _escape(label)) for (key, label)
+            in labels))
+    return "{} {}".format(name, value)
+
+
+class Registry(object):
+    """Counters and histograms of a process."""
+
+    def __init__(self, buckets=None):
+        """
+        Initialize registry.
+
+        :buckets: Sorted upper bounds of the histogram buckets in seconds,
+                  METRICS_BUCKETS by default
+        """
+        self.buckets = list(buckets or METRICS_BUCKETS)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels=None, value=1):
+        """
+        Increase a counter.
+
+        :name: Name of the counter
+        :labels: dict of the label values by name, or None
+        :value: Amount of the increase
+        """
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        """
+        Add an observation to a histogram.
+
+        :name: Name of the histogram
+        :value: Observed value
+        :labels: dict of the label values by name, or None
+        """
+        key = (name, _labels(labels))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def take(self):
+        """
+        Return the recorded metrics and start recording anew.
+
+        :returns: Picklable state for merge()
+        """
+        with self._lock:
+            state = (self._counters, self._histograms)
+            self._counters = {}
+            self._histograms = {}
+        return state
+
+    def merge(self, state):
+        """
+        Add metrics recorded elsewhere, e.g. in another process.
+
+        :state: State as returned by take() of a registry with the same
+                buckets
+        """
+        (counters, histograms) = state
+        with self._lock:
+            for (key, value) in six.iteritems(counters):
+                self._counters[key] = self._counters.get(key, 0) + value
+            for (key, (counts, total, count)) in six.iteritems(histograms):
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = [
+                        [0] * (len(self.buckets) + 1), 0.0, 0]
+                histogram[0] = [own + other for (own, other)
+                                in zip(histogram[0], counts)]
+                histogram[1] += total
+                histogram[2] += count
+
+    def value(self, name, labels=None):
+        """
+        Return the value of a counter, or the count of a histogram.
+
+        :name: Name of the metric
+        :labels: dict of the label values by name, or None
+        :returns: Value, 0 if nothing has been recorded
+        """
+        key = (name, _labels(labels))
+        with self._lock:
+            if key in self._histograms:
+                return self._histograms[key][2]
+            return self._counters.get(key, 0)
+
+    def render(self):
+        """
+        Return the metrics in the Prometheus text format.
+
+        :returns: Text with a line per sample
+        """
+        with self._lock:
+            samples = {}
+            for ((name, labels), value) in six.iteritems(self._counters):
+                samples.setdefault(name, []).append(
+                    _sample(name, labels, value))
+            for ((name, labels), (counts, total, count)) in \
+                    six.iteritems(self._histograms):
+                lines = samples.setdefault(name, [])
+                cumulative = 0
+                bounds = [repr(float(bound)) for bound in self.buckets]
+                for (bound, bucket) in zip(bounds + ["+Inf"], counts):
+                    cumulative += bucket
+                    lines.append(_sample(name + "_bucket",
+                                         labels + (("le", bound),),
+                                         cumulative))
+                lines.append(_sample(name + "_sum", labels, total))
+                lines.append(_sample(name + "_count", labels, count))
+
+        lines = []
+        for name in sorted(samples):
+            (kind, description) = _METRICS.get(name, ("untyped", name))
+            lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} {}".format(name, kind))
+            lines.extend(sorted(samples[name]))
+        return "".join(line + "\n" for line in lines)
+
+
+def write_textfile(registry, path):
+    """
+    Write the metrics to a file atomically.
+
+    The metrics are written to a temporary file in the same directory, which
+    is then renamed. The file is made readable to all, as node_exporter
+    usually runs as another user.
+
+    :registry: Registry instance
+    :path: Path of the file, ending in .prom for the textfile collector
+    """
+    text = registry.render().encode("utf-8")
+    (fd, partial) = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        try:
+            os.write(fd, text)
+            os.fchmod(fd, 0o644)
+        finally:
+            os.close(fd)
+        os.rename(partial, path)
+    except OSError:
+        try:
+            os.remove(partial)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+        raise
+
+
+class TextfileWriter(object):
+    """Thread writing the metrics to a file periodically."""
+
+    def __init__(self, registry, path, interval=METRICS_INTERVAL):
+        """
+        Initialize writer.
+
+        :registry: Registry instance
+        :path: Path of the file
+        :interval: Seconds between the writes
+        """
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start writing the metrics in a background thread."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and write the final metrics."""
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+        write_textfile(self.registry, self.path)
+
+    def _run(self):
+        """Write the metrics until stopped."""
+        while not self._stopped.wait(self.interval):
+            write_textfile(self.registry, self.path)
+
+
+_REGISTRY = None
+
+
+def set_registry(registry):
+    """
+    Set the registry of the process.
+
+    :registry: Registry instance, or None to disable the metrics
+    :returns: The previous registry
+    """
+    global _REGISTRY  # pylint: disable=global-statement
+    (previous, _REGISTRY) = (_REGISTRY, registry)
+    return previous
+
+
+def inc(name, labels=None, value=1):
+    """
+    Increase a counter of the registry of the process, if set.
+
+    :name: Name of the counter
+    :labels: dict of the label values by name, or None
+    :value: Amount of the increase
+    """
+    if _REGISTRY is not None:
+        _REGISTRY.inc(name, labels, value)
+
+
+def observe(name, value, labels=None):
+    """
+    Add an observation to a histogram of the registry of the process, if set.
+
+    :name: Name of the histogram
+    :value: Observed value
+    :labels: dict of the label values by name, or None
+    """
+    if _REGISTRY is not None:
+        _REGISTRY.observe(name, value, labels)
+
+
+def _outcome(result):
+    """
+    Return the outcome of a file.
+
+    :result: Results of file_scraper.batch.scrape_one()
+    :returns: "error", "well_formed", "not_well_formed" or "unknown"
+    """
+    if "error" in result:
+        return "error"
+    if result["well_formed"] is True:
+        return "well_formed"
+    if result["well_formed"] is False:
+        return "not_well_formed"
+    return "unknown"
+
+
+def record_file(filename, result, duration):
+    """
+    Record a scraped file in the registry of the process, if set.
+
+    :filename: File path
+    :result: Results of file_scraper.batch.scrape_one()
+    :duration: Time spent scraping the file in seconds
+    """
+    if _REGISTRY is None:
+        return
+    mimetype = result.get("mimetype") or "(:unav)"
+    _REGISTRY.inc("file_scraper_files_total",
+                  {"mimetype": mimetype, "outcome": _outcome(result)})
+    try:
+        _REGISTRY.inc("file_scraper_file_bytes_total",
+                      {"mimetype": mimetype}, os.path.getsize(filename))
+    except OSError:
+        pass
+    _REGISTRY.observe("file_scraper_file_duration_seconds", duration)
+    usage = (result.get("resource_usage") or {}).get("total") or {}
+    if usage.get("bytes_read") is not None:
+        _REGISTRY.inc("file_scraper_read_bytes_total", None,
+                      usage["bytes_read"])
+
+
+def timed(name, labels=None):
+    """
+    Return a context manager observing the duration of a with block.
+
+    :name: Name of the histogram
+    :labels: dict of the label values by name, or None
+    :returns: Context manager
+    """
+    return _Timer(name, labels)
+
+
+class _Timer(object):
+    """Context observing its duration in a histogram."""
+
+    def __init__(self, name, labels):
+        """
+        Initialize timer.
+
+        :name: Name of the histogram
+        :labels: dict of the label values by name, or None
+        """
+        self.name = name
+        self.labels = labels
+        self._start = None
+
+    def __enter__(self):
+        """Start timing."""
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Observe the duration."""
+        observe(self.name, time.time() - self._start, self.labels)
@@ -4,12 +4,9 @@ from __future__ import unicode_literals
 import six
 
 from file_scraper.base import BaseMeta
-from file_scraper.utils import metadata
+from file_scraper.utils import metadata, LazyModule
 
-try:
-    import PIL.Image
-except ImportError:
-    pass
+PIL = LazyModule("PIL", ["PIL.Image"])
 
 
 SAMPLES_PER_PIXEL = {"1": "1", "L": "1", "P": "1", "RGB": "3", "YCbCr": "3",
@@ -5,11 +5,9 @@ import six
 
 from file_scraper.base import BaseScraper
 from file_scraper.pil.pil_model import ImagePilMeta, JpegPilMeta, TiffPilMeta
+from file_scraper.utils import LazyModule
 
-try:
-    import PIL.Image
-except ImportError:
-    pass
+PIL = LazyModule("PIL", ["PIL.Image"])
 
 
 class PilScraper(BaseScraper):
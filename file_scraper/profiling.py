@@ -0,0 +1,116 @@
+"""Profiling of the scraping of single files.
+
+Scraper(filename, profile_dir=directory) runs Scraper.scrape() and
+Scraper.detect_filetype() under cProfile, and writes the profile to the
+directory as a .pstats file if the run took longer than the threshold, or
+if the file was picked into the sampled fraction of the files. The profiles
+are read with the pstats module or with tools like snakeviz::
+
+    python -m pstats profiles/example.pdf.0123456789ab.scrape.pstats
+
+Every run of an enabled profiler is profiled, as its duration is known
+only at its end, so enabling profiling slows down all the files. cProfile
+sees only the calling thread, so with concurrency over one the tools run in
+the worker threads are not included, and the asyncio API is not profiled.
+"""
+from __future__ import unicode_literals
+
+import cProfile
+import errno
+import hashlib
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+
+from file_scraper.config import PROFILE_SAMPLE, PROFILE_THRESHOLD
+from file_scraper.utils import encode_path, ensure_text
+
+
+def profile_path(directory, filename, operation):
+    """
+    Return the path of the profile of a file.
+
+    The name of the profile contains the name of the file and a digest of
+    its path, so the files with the same name in different directories get
+    their own profiles, and a new profile of a file replaces the old one.
+
+    :directory: Directory of the profiles
+    :filename: Path of the profiled file
+    :operation: Profiled operation, "scrape" or "detect"
+    :returns: Path of the profile
+    """
+    filename = encode_path(filename)
+    name = re.sub(r"[^\w.-]", "_", ensure_text(
+        os.path.basename(filename), errors="replace"), flags=re.UNICODE)
+    digest = hashlib.sha1(filename).hexdigest()[:12]
+    return os.path.join(directory, "{}.{}.{}.pstats".format(
+        name[:64], digest, operation))
+
+
+class FileProfiler(object):
+    """Profiler of the runs of a Scraper."""
+
+    def __init__(self, filename, directory=None, threshold=PROFILE_THRESHOLD,
+                 sample=PROFILE_SAMPLE):
+        """
+        Initialize profiler.
+
+        :filename: Path of the profiled file
+        :directory: Directory of the profiles, or None to not profile
+        :threshold: Duration in seconds from which the profile of a run is
+                    written, or None to write only the sampled profiles
+        :sample: Fraction of the runs whose profiles are written regardless
+                 of their duration
+        """
+        self.filename = filename
+        self.directory = directory
+        self.threshold = threshold
+        self.sample = sample
+        self.path = None
+
+    @contextmanager
+    def profile(self, operation):
+        """
+        Profile a run, and write the profile if it is slow or sampled.
+
+        The profile is written also if the run raises an exception. Its path
+        is then stored in the attribute path, which is None if no profile
+        was written.
+
+        :operation: Name of the profiled operation, "scrape" or "detect"
+        """
+        self.path = None
+        if self.directory is None:
+            yield
+            return
+
+        sampled = random.random() < self.sample
+        profiler = cProfile.Profile()
+        start = time.time()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            slow = self.threshold is not None and \
+                time.time() - start >= self.threshold
+            if sampled or slow:
+                self._write(profiler, operation)
+
+    def _write(self, profiler, operation):
+        """
+        Write a profile.
+
+        :profiler: Disabled cProfile.Profile instance
+        :operation: Name of the profiled operation
+        """
+        try:
+            os.makedirs(self.directory)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+        path = profile_path(self.directory, self.filename, operation)
+        profiler.dump_stats(path)
+        self.path = path
@@ -0,0 +1,195 @@
+"""Statistical profiling of batch runs by sampling the Python stack.
+
+A StackSampler interrupts the process with SIGPROF every SAMPLING_INTERVAL
+seconds of CPU time, and counts the stack of the main thread at each
+interrupt. The stacks are tagged with the detector or scraper being run and
+the MIME type of the file, so that the hot spots of the tools can be told
+apart. The counts of several processes are merged with merge(), and written
+in the collapsed stack format of flamegraph.pl and speedscope::
+
+    sampler = StackSampler()
+    for result in scrape_batch(filenames, 8, sampler=sampler):
+        ...
+    with io.open("run.collapsed", "wt") as outfile:
+        sampler.write(outfile)
+
+    flamegraph.pl run.collapsed > run.svg
+
+The samples are taken in CPU time, so the time spent waiting for the
+external tools does not appear in them; see the resource usage of the
+Scraper for that. Only the main thread is sampled, so with concurrency over
+one the detectors and scrapers run in the thread pool are not seen. The
+sampler must be started and stopped in the main thread.
+"""
+from __future__ import unicode_literals
+
+import os
+import signal
+
+import six
+from file_scraper.config import SAMPLING_INTERVAL
+from file_scraper.scraper import Scraper
+
+# Root frame of the stacks sampled outside the detectors and scrapers
+NO_TOOL = "(no tool)"
+
+# Methods of Scraper running a tool, and the name of their argument
+# holding the tool, by the id of their code object. Code objects are looked
+# up by id, since hashing them hashes all their constants.
+_TOOL_FRAMES = dict(
+    (id(six.get_function_code(six.get_unbound_function(method))), argument)
+    for (method, argument) in [(Scraper._run_detector, "tool"),
+                               (Scraper._run_scraper, "scraper")])
+
+
+def _label(code):
+    """
+    Return the name of a function in the stacks.
+
+    :code: Code object of the function
+    :returns: Name with the directory and the file name of the module, e.g.
+              "jhove/jhove_scraper.py:scrape_file"
+    """
+    (directory, name) = os.path.split(code.co_filename)
+    return "{}/{}:{}".format(os.path.basename(directory), name, code.co_name)
+
+
+def _tag(frame, argument):
+    """
+    Return the tag of the stacks sampled in a tool.
+
+    :frame: Frame of the Scraper method running the tool
+    :argument: Name of the argument holding the tool
+    :returns: Name of the tool's class and the MIME type of the file
+    """
+    local_vars = frame.f_locals
+    tool = local_vars.get(argument)
+    mimetype = getattr(local_vars.get("self"), "mimetype", None)
+    return "{} {}".format(tool.__class__.__name__, mimetype or "(:unav)")
+
+
+class StackSampler(object):
+    """Sampler counting the stacks of the main thread."""
+
+    def __init__(self, interval=SAMPLING_INTERVAL):
+        """
+        Initialize sampler.
+
+        :interval: Sampling interval in seconds of CPU time
+        """
+        self.interval = interval
+        self.counts = {}
+        self._labels = {}
+        self._previous = None
+
+    def start(self):
+        """Start sampling."""
+        if self._previous is not None:
+            return
+        self._previous = signal.signal(signal.SIGPROF, self._sample)
+        # The system calls interrupted by the samples are restarted
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        """Stop sampling."""
+        if self._previous is None:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous)
+        self._previous = None
+
+    def __enter__(self):
+        """Start sampling for the with block."""
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop sampling."""
+        self.stop()
+
+    def _sample(self, signum, frame):
+        """
+        Count the interrupted stack.
+
+        :signum: Signal number
+        :frame: Interrupted frame
+        """
+        # pylint: disable=unused-argument
+        stack = []
+        tag = NO_TOOL
+        tagged = False
+        while frame is not None:
+            code = frame.f_code
+            key = id(code)
+            label = self._labels.get(key)
+            if label is None:
+                # The code object is kept so that its id is not reused
+                label = self._labels[key] = (code, _label(code))
+            stack.append(label[1])
+            if not tagged and key in _TOOL_FRAMES:
+                tag = _tag(frame, _TOOL_FRAMES[key])
+                tagged = True
+            frame = frame.f_back
+        stack.append(tag)
+        stack = tuple(reversed(stack))
+        self.counts[stack] = self.counts.get(stack, 0) + 1
+
+    @property
+    def total(self):
+        """Number of samples counted."""
+        return sum(self.counts.values())
+
+    def take(self):
+        """
+        Return the counted stacks and start counting anew.
+
+        :returns: dict of the sample counts by stack, a tuple of the tag and
+                  the functions from the outermost to the innermost
+        """
+        (counts, self.counts) = (self.counts, {})
+        return counts
+
+    def merge(self, counts):
+        """
+        Add stacks counted elsewhere, e.g. in another process.
+
+        :counts: dict of the sample counts by stack, as returned by take()
+        """
+        for (stack, count) in six.iteritems(counts):
+            stack = tuple(stack)
+            self.counts[stack] = self.counts.get(stack, 0) + count
+
+    def hot_spots(self, limit=20):
+        """
+        Return the functions found in the most samples.
+
+        :limit: Maximum number of functions
+        :returns: List of tuples (function, inclusive samples, own samples),
+                  sorted by the inclusive samples, where a function is
+                  counted in a sample if it is anywhere in the stack, and
+                  its own samples are those where it is innermost
+        """
+        inclusive = {}
+        own = {}
+        for (stack, count) in six.iteritems(self.counts):
+            for function in set(stack[1:]):
+                inclusive[function] = inclusive.get(function, 0) + count
+            if len(stack) > 1:
+                own[stack[-1]] = own.get(stack[-1], 0) + count
+        ordered = sorted(inclusive.items(),
+                         key=lambda item: (-item[1], item[0]))
+        return [(function, count, own.get(function, 0))
+                for (function, count) in ordered[:limit]]
+
+    def write(self, stream):
+        """
+        Write the stacks in the collapsed stack format.
+
+        Each line has the frames of a stack separated by semicolons, from the
+        tag to the innermost function, and the number of its samples.
+
+        :stream: Text stream
+        """
+        for (stack, count) in sorted(self.counts.items()):
+            stream.write("{} {}\n".format(";".join(stack), count))
@@ -0,0 +1,286 @@
+"""Scheduling of the scrapers by their cost learned from the history.
+
+The scrapers chosen for a file are by default run in the order given by
+iter_scrapers(). CostScheduler runs them in the order where the scrapers
+that are cheap and likely to find the file not well-formed come first, which
+pays off with fail-fast scraping. The order is learned per MIME type from a
+history of the durations and results of the scrapers, persisted in a JSON
+file shared by all processes.
+
+The execution order affects only which scrapers run first. The results are
+always merged in the canonical order of iter_scrapers(), so the scraping
+results do not depend on the execution order.
+
+The recorded runs are kept in memory and added to the history file by
+checkpoint() after SCHEDULER_SAVE_FILES files or SCHEDULER_SAVE_INTERVAL
+seconds, and by save(). The schedulers of default_scheduler() are saved
+when the process exits, and file_scraper.batch.scrape_batch() saves them
+at the end of the batch.
+"""
+from __future__ import unicode_literals
+
+import atexit
+import errno
+import fcntl
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+import six
+
+from file_scraper.config import (SCHEDULER_HISTORY_PATH, SCHEDULER_MIN_RUNS,
+                                 SCHEDULER_SAVE_FILES,
+                                 SCHEDULER_SAVE_INTERVAL)
+
+_DEFAULT_SCHEDULERS = {}
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_scheduler():
+    """
+    Return the scheduler using the history in SCHEDULER_HISTORY_PATH.
+
+    The scheduler is shared by all Scraper instances of the process, and
+    its recorded runs are saved when the process exits.
+
+    :returns: CostScheduler instance
+    """
+    path = os.path.expanduser(SCHEDULER_HISTORY_PATH)
+    with _DEFAULT_LOCK:
+        if path not in _DEFAULT_SCHEDULERS:
+            if not _DEFAULT_SCHEDULERS:
+                atexit.register(save_default_schedulers)
+            _DEFAULT_SCHEDULERS[path] = CostScheduler(path)
+        return _DEFAULT_SCHEDULERS[path]
+
+
+def save_default_schedulers():
+    """Save the recorded runs of the schedulers of default_scheduler()."""
+    with _DEFAULT_LOCK:
+        schedulers = list(_DEFAULT_SCHEDULERS.values())
+    for scheduler in schedulers:
+        scheduler.save()
+
+
+def _add_stats(history, mimetype, name, stats):
+    """
+    Add the statistics of a scraper to a history.
+
+    :history: History as dict of MIME types, containing dicts of scraper
+              names, containing dicts with keys "runs", "time" and
+              "failures"
+    :mimetype: MIME type of the scraped files
+    :name: Class name of the scraper
+    :stats: dict with keys "runs", "time" and "failures" to add
+    """
+    total = history.setdefault(mimetype, {}).setdefault(
+        name, {"runs": 0, "time": 0.0, "failures": 0})
+    for key in total:
+        total[key] += stats.get(key, 0)
+
+
+def _merge(history, other):
+    """
+    Add the statistics of another history to a history.
+
+    :history: History dict to update
+    :other: History dict to add
+    """
+    for (mimetype, names) in six.iteritems(other):
+        for (name, stats) in six.iteritems(names):
+            _add_stats(history, mimetype, name, stats)
+
+
+class CostScheduler(object):
+    """
+    Scheduler ordering the scrapers by expected cost of finding a failure.
+
+    For each MIME type and scraper, the number of runs, their total duration
+    and the number of runs finding the file not well-formed are recorded.
+    Scrapers with enough runs are ordered by the mean duration divided by the
+    estimated failure rate, which minimizes the expected time to the first
+    failure. Scrapers with less than SCHEDULER_MIN_RUNS runs are run first,
+    in the canonical order, so that their cost gets known.
+    """
+
+    def __init__(self, path=None, min_runs=None, save_files=None,
+                 save_interval=None):
+        """
+        Initialize scheduler.
+
+        :path: Path of the history file, or None to keep the history only in
+               memory
+        :min_runs: Number of runs needed before a scraper is ordered by its
+                   cost, SCHEDULER_MIN_RUNS by default
+        :save_files: Number of files after which checkpoint() saves the
+                     recorded runs, SCHEDULER_SAVE_FILES by default
+        :save_interval: Seconds after which checkpoint() saves the recorded
+                        runs, SCHEDULER_SAVE_INTERVAL by default
+        """
+        self.path = path
+        if min_runs is None:
+            min_runs = SCHEDULER_MIN_RUNS
+        self.min_runs = min_runs
+        if save_files is None:
+            save_files = SCHEDULER_SAVE_FILES
+        self.save_files = save_files
+        if save_interval is None:
+            save_interval = SCHEDULER_SAVE_INTERVAL
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._history = {}
+        self._pending = {}
+        self._files = 0
+        self._saved = time.time()
+        if path is not None:
+            self._history = self._load()
+
+    def _load(self):
+        """
+        Read the history file.
+
+        :returns: History dict, empty if the file does not exist
+        """
+        try:
+            with io.open(self.path, "rt", encoding="utf-8") as infile:
+                return json.load(infile).get("mimetypes", {})
+        except IOError as error:
+            if error.errno == errno.ENOENT:
+                return {}
+            raise
+        except ValueError:
+            # A corrupted history is rebuilt from scratch
+            return {}
+
+    def stats(self, mimetype, name):
+        """
+        Return the recorded statistics of a scraper.
+
+        :mimetype: MIME type of the scraped files
+        :name: Class name of the scraper
+        :returns: dict with keys "runs", "time" and "failures"
+        """
+        stats = {"runs": 0, "time": 0.0, "failures": 0}
+        with self._lock:
+            for history in [self._history, self._pending]:
+                recorded = history.get(mimetype, {}).get(name, {})
+                for key in stats:
+                    stats[key] += recorded.get(key, 0)
+        return stats
+
+    def cost(self, mimetype, name):
+        """
+        Return the expected cost of finding a failure with a scraper.
+
+        The failure rate is estimated with Laplace smoothing, so that a
+        scraper that has never failed still gets a finite cost.
+
+        :mimetype: MIME type of the scraped files
+        :name: Class name of the scraper
+        :returns: Mean duration in seconds divided by the estimated failure
+                  rate, or None if the scraper has not run often enough
+        """
+        stats = self.stats(mimetype, name)
+        if stats["runs"] < max(self.min_runs, 1):
+            return None
+        mean_time = stats["time"] / stats["runs"]
+        failure_rate = (stats["failures"] + 1.0) / (stats["runs"] + 2.0)
+        return mean_time / failure_rate
+
+    def order(self, mimetype, scrapers):
+        """
+        Return the execution order of scrapers.
+
+        :mimetype: MIME type of the file
+        :scrapers: Scraper instances in the canonical order
+        :returns: List of the scraper instances in the execution order
+        """
+        def key(indexed):
+            """Sort scrapers with unknown cost first, then by cost."""
+            (index, scraper) = indexed
+            cost = self.cost(mimetype, scraper.__class__.__name__)
+            if cost is None:
+                return (0, 0.0, index)
+            return (1, cost, index)
+
+        return [scraper for (_, scraper)
+                in sorted(enumerate(scrapers), key=key)]
+
+    def record(self, mimetype, scraper, duration):
+        """
+        Record a run of a scraper.
+
+        :mimetype: MIME type of the file
+        :scraper: Scraper instance that has run
+        :duration: Duration of the run in seconds
+        """
+        with self._lock:
+            _add_stats(self._pending, mimetype, scraper.__class__.__name__,
+                       {"runs": 1, "time": duration,
+                        "failures": int(scraper.well_formed is False)})
+
+    def checkpoint(self):
+        """
+        Count a scraped file, and save the recorded runs when due.
+
+        The runs are saved after save_files files or save_interval seconds
+        since the previous save, whichever comes first. Until then they are
+        kept in memory, where they are already used for the ordering.
+        """
+        with self._lock:
+            self._files += 1
+            due = (self._files >= self.save_files or
+                   time.time() - self._saved >= self.save_interval)
+        if due:
+            self.save()
+
+    def save(self):
+        """
+        Add the recorded runs to the history file.
+
+        The file is locked while it is updated, so processes sharing the
+        history do not lose each other's runs.
+        """
+        with self._lock:
+            (pending, self._pending) = (self._pending, {})
+            self._files = 0
+            self._saved = time.time()
+        if self.path is None:
+            with self._lock:
+                _merge(self._history, pending)
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+        with io.open(self.path + ".lock", "ab") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            history = self._load()
+            _merge(history, pending)
+            self._write(history, directory)
+        with self._lock:
+            self._history = history
+
+    def _write(self, history, directory):
+        """
+        Replace the history file atomically.
+
+        :history: History dict
+        :directory: Directory of the history file
+        """
+        (handle, temp_path) = tempfile.mkstemp(dir=directory,
+                                               suffix=".tmp")
+        try:
+            with io.open(handle, "wt", encoding="utf-8") as outfile:
+                outfile.write(six.text_type(json.dumps(
+                    {"mimetypes": history}, indent=1, sort_keys=True)))
+            os.rename(temp_path, self.path)
+        except Exception:
+            os.remove(temp_path)
+            raise
@@ -5,12 +5,15 @@ import os
 import shutil
 import tempfile
 
-import lxml.etree as etree
+from file_scraper import metrics
 from file_scraper.base import BaseScraper
 from file_scraper.shell import Shell
 from file_scraper.config import SCHEMATRON_DIRNAME
 from file_scraper.schematron.schematron_model import SchematronMeta
-from file_scraper.utils import encode_path, hexdigest, ensure_text
+from file_scraper.utils import (encode_path, hexdigest, ensure_text,
+                                LazyModule)
+
+etree = LazyModule("lxml.etree")  # pylint: disable=invalid-name
 
 
 class SchematronScraper(BaseScraper):
@@ -18,6 +21,7 @@ class SchematronScraper(BaseScraper):
 
     _supported_metadata = [SchematronMeta]
     _only_wellformed = True
+    _selection_params = ["schematron"]
 
     def __init__(self, filename, check_wellformed=True, params=None):
         """
@@ -174,7 +178,11 @@ class SchematronScraper(BaseScraper):
 
         if self._cache:
             if os.path.isfile(xslt_filename):
+                metrics.inc("file_scraper_cache_requests_total",
+                            {"cache": "schematron", "result": "hit"})
                 return xslt_filename
+            metrics.inc("file_scraper_cache_requests_total",
+                        {"cache": "schematron", "result": "miss"})
 
         try:
             self._compile_phase(
@@ -1,12 +1,31 @@
 """File metadata scraper."""
 from __future__ import unicode_literals
 
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import six
+
+from file_scraper import metrics, tracing
+from file_scraper.accounting import (PythonPeak, ResourceUsage,
+                                     current_measurement)
+from file_scraper.config import (DETECTION_SHORT_CIRCUIT, PROFILE_SAMPLE,
+                                 PROFILE_THRESHOLD)
 from file_scraper.detectors import VerapdfDetector
 from file_scraper.dummy.dummy_scraper import FileExists
+from file_scraper.exceptions import ShellTimeoutError
 from file_scraper.iterator import iter_detectors, iter_scrapers
 from file_scraper.jhove.jhove_scraper import JHoveUtf8Scraper
+from file_scraper.profiling import FileProfiler
+from file_scraper.scheduler import default_scheduler
 from file_scraper.textfile.textfile_scraper import TextfileScraper
-from file_scraper.utils import encode_path, generate_metadata_dict, hexdigest
+from file_scraper.utils import (LazyModule, decode_path, encode_path,
+                                generate_metadata_dict, hexdigest)
+
+# pylint: disable=invalid-name
+multiprocessing = LazyModule("multiprocessing", ["multiprocessing.pool"])
 
 LOSE = (None, "(:unav)", "")
 
@@ -29,25 +48,160 @@ class Scraper(object):
         self.streams = None
         self.well_formed = None
         self.info = None
+        self.resource_usage = None
         self._params = kwargs
+        self._measure = self._params.get("resource_usage", False)
+        self._memory = self._params.get("memory_usage", False)
+        self._concurrency = self._params.get("concurrency", 1)
+        self._fail_fast = False
+        self._short_circuit = DETECTION_SHORT_CIRCUIT
+        self._scheduler = self._params.get("scheduler", None)
+        if self._scheduler is True:
+            self._scheduler = default_scheduler()
+        self._usage = {}
         self._scraper_results = []
         self._given_mimetype = self._params.get("mimetype", None)
         self._given_version = self._params.get("version", None)
+        self._profiler = FileProfiler(
+            filename, self._params.get("profile_dir", None),
+            self._params.get("profile_threshold", PROFILE_THRESHOLD),
+            self._params.get("profile_sample", PROFILE_SAMPLE))
 
     def _identify(self):
-        """Identify file format and version."""
+        """Identify file format and version.
+
+        With DETECTION_SHORT_CIRCUIT, the detectors are run one by one until
+        a detector gives a final result, and the remaining detectors are
+        recorded in info as skipped.
+        """
         self.info = {}
-        for detector in iter_detectors():
-            tool = detector(self.filename, self._given_mimetype,
-                            self._given_version)
-            self._update_filetype(tool)
-
-        # Unless version is given by the user, PDF files should be scrutinized
-        # further to determine if they are PDF/A
-        if (self.mimetype == "application/pdf" and
-                not (self._given_mimetype and self._given_version)):
-            vera_detector = VerapdfDetector(self.filename)
-            self._update_filetype(vera_detector)
+        with tracing.span("detection") as span:
+            detectors = self._detectors()
+            if not self._short_circuit:
+                self._run_all(self._run_detector, self._collect_detector,
+                              detectors)
+            else:
+                usages = {}
+                for detector in self._detection_order(detectors):
+                    usages[id(detector)] = self._run_detector(detector)
+                    if detector.is_final():
+                        break
+                self._collect_detectors(detectors, usages)
+
+            if self._needs_verapdf():
+                vera_detector = VerapdfDetector(self.filename)
+                self._update_filetype(vera_detector)
+            span.set_attribute("file_scraper.mimetype", self.mimetype)
+            span.set_attribute("file_scraper.version", self.version)
+
+    def _run_all(self, run, collect, tools, fail_fast=False, order=None):
+        """
+        Run detectors or scrapers and collect their results.
+
+        With concurrency over one, the tools run in a thread pool. The tools
+        are started in the execution order, but the results are always
+        collected in the order of the tools, i.e. the canonical merge order,
+        so that they do not depend on the concurrency or execution order.
+
+        :run: Method running a tool
+        :collect: Method collecting the results of a tool
+        :tools: List of detector or scraper instances
+        :fail_fast: True to skip the scrapers not yet started once the file
+                    is known not to be well-formed
+        :order: Execution order of the tools, by default the order of tools
+        """
+        if order is None:
+            order = tools
+
+        # The worker threads have no measurements or spans of their own
+        parent = current_measurement()
+        parent_span = tracing.current_span()
+        failed = threading.Event()
+        if fail_fast and self.well_formed is False:
+            failed.set()
+
+        def run_unless_failed(tool):
+            """Run the tool unless the file is known not to be well-formed."""
+            if failed.is_set():
+                return None
+            with tracing.activate(parent_span):
+                usage = run(tool, parent)
+            if fail_fast and tool.well_formed is False:
+                failed.set()
+            return usage
+
+        if self._concurrency <= 1 or len(tools) <= 1:
+            usages = [run_unless_failed(tool) for tool in order]
+        else:
+            pool = multiprocessing.pool.ThreadPool(
+                min(self._concurrency, len(tools)))
+            try:
+                usages = pool.map(run_unless_failed, order)
+            finally:
+                pool.close()
+
+        usages = dict(zip([id(tool) for tool in order], usages))
+        for tool in tools:
+            if usages[id(tool)] is None:
+                self._skip_scraper(tool)
+            else:
+                collect(tool, usages[id(tool)])
+
+    def _detectors(self):
+        """
+        Return the detectors in the canonical order.
+
+        :returns: List of detector instances
+        """
+        return [detector(self.filename, self._given_mimetype,
+                         self._given_version)
+                for detector in iter_detectors()]
+
+    @staticmethod
+    def _detection_order(detectors):
+        """
+        Return the order in which the detectors are run one by one.
+
+        The detectors known to give a final result already before running
+        are run first, otherwise the canonical order is kept.
+
+        :detectors: List of detector instances in the canonical order
+        :returns: List of the detector instances in the execution order
+        """
+        return sorted(detectors, key=lambda detector: not detector.is_final())
+
+    def _collect_detectors(self, detectors, usages):
+        """
+        Collect the results of the detectors that have run.
+
+        The results are collected in the canonical order, and the detectors
+        that have not run are recorded in info as skipped.
+
+        :detectors: List of detector instances in the canonical order
+        :usages: dict of ResourceUsage instances by the id of the detectors
+                 that have run
+        """
+        for detector in detectors:
+            if id(detector) in usages:
+                self._collect_detector(detector, usages[id(detector)])
+            else:
+                self._add_info({"class": detector.__class__.__name__,
+                                "messages": ["Skipping detector: The file "
+                                             "format is already known."],
+                                "errors": []},
+                               ResourceUsage(self._measure))
+
+    def _skip_scraper(self, scraper):
+        """
+        Record a scraper skipped in fail-fast scraping.
+
+        :scraper: Scraper instance
+        """
+        self._add_info({"class": scraper.__class__.__name__,
+                        "messages": ["Skipping scraper: The file is already "
+                                     "known not to be well-formed."],
+                        "errors": []},
+                       ResourceUsage(self._measure))
 
     def _update_filetype(self, tool):
         """
@@ -57,8 +211,42 @@ class Scraper(object):
         present in the LOSE list or the new one is marked important by the
         detector.
         """
-        tool.detect()
-        self.info[len(self.info)] = tool.info
+        self._collect_detector(tool, self._run_detector(tool))
+
+    def _run_detector(self, tool, parent=None):
+        """
+        Run the detector.
+
+        :tool: Detector instance
+        :parent: Parent measurement of the resource usage, by default the
+                 current measurement of the thread
+        :returns: ResourceUsage of the detector
+        """
+        usage = ResourceUsage(self._measure, parent)
+        with usage, tracing.span("detector") as span, metrics.timed(
+                "file_scraper_tool_duration_seconds",
+                {"tool": tool.__class__.__name__}):
+            try:
+                tool.detect()
+            except ShellTimeoutError as error:
+                tool.info = {"class": tool.__class__.__name__,
+                             "messages": [],
+                             "errors": [six.text_type(error)]}
+            if span.recording:
+                span.set_attribute("file_scraper.tool",
+                                   tool.__class__.__name__)
+                span.set_attribute("file_scraper.mimetype", tool.mimetype)
+                span.set_attribute("file_scraper.version", tool.version)
+        return usage
+
+    def _collect_detector(self, tool, usage):
+        """
+        Update the file type based on the results of a detector that has run.
+
+        :tool: Detector instance
+        :usage: ResourceUsage of the detector
+        """
+        self._add_info(tool.info, usage)
         important = tool.get_important()
         if self.mimetype in LOSE:
             self.mimetype = tool.mimetype
@@ -72,28 +260,146 @@ class Scraper(object):
                 important["version"] is not None:
             self.version = important["version"]
 
+    def _needs_verapdf(self):
+        """
+        Find out whether the file should be run through VerapdfDetector.
+
+        Unless version is given by the user, PDF files should be scrutinized
+        further to determine if they are PDF/A.
+
+        :returns: True if VerapdfDetector is needed
+        """
+        return (self.mimetype == "application/pdf" and
+                not (self._given_mimetype and self._given_version))
+
     def _scrape_file(self, scraper):
         """Scrape with the given scraper.
         :scraper: Scraper instance
         """
-        scraper.scrape_file()
+        self._collect_scraper(scraper, self._run_scraper(scraper))
+
+    def _run_scraper(self, scraper, parent=None):
+        """Run the given scraper.
+        :scraper: Scraper instance
+        :parent: Parent measurement of the resource usage, by default the
+                 current measurement of the thread
+        :returns: ResourceUsage of the scraper
+        """
+        usage = ResourceUsage(self._measure or self._memory, parent)
+        peak = PythonPeak(self._memory)
+        with usage, peak, tracing.span("scraper") as span, metrics.timed(
+                "file_scraper_tool_duration_seconds",
+                {"tool": scraper.__class__.__name__}):
+            try:
+                scraper.scrape_file()
+            except ShellTimeoutError as error:
+                # pylint: disable=protected-access
+                scraper._errors.append(six.text_type(error))
+            if span.recording:
+                span.set_attribute("file_scraper.tool",
+                                   scraper.__class__.__name__)
+                span.set_attribute("file_scraper.well_formed",
+                                   scraper.well_formed)
+        if self._memory:
+            usage.memory = {"python_peak": peak.peak,
+                            "child_maxrss": usage.child_maxrss}
+        return usage
+
+    def _collect_scraper(self, scraper, usage):
+        """Collect the results of a scraper that has run.
+        :scraper: Scraper instance
+        :usage: ResourceUsage of the scraper
+        """
         if scraper.streams:
             self._scraper_results.append(scraper.streams)
-        self.info[len(self.info)] = scraper.info()
+        self._add_info(scraper.info(), usage)
         if scraper.well_formed is not None:
             if self.well_formed in [None, True]:
                 self.well_formed = scraper.well_formed
 
+    def _add_info(self, info, usage):
+        """
+        Add detector or scraper info to the info dict.
+
+        :info: Info dict of the detector or scraper
+        :usage: ResourceUsage of the detector or scraper, added to the info
+                under key "resource_usage" if resource usage is measured,
+                and its peak memory under key "memory_usage" if memory
+                usage is measured
+        """
+        if self._measure and usage.enabled:
+            info = dict(info)
+            info["resource_usage"] = usage.as_dict()
+        if usage.memory is not None:
+            info = dict(info)
+            info["memory_usage"] = usage.memory
+        self.info[len(self.info)] = info
+
+    def _stage(self, name, parent=None):
+        """
+        Return the resource usage measurement of a scraping stage.
+
+        Measurements of a stage entered more than once are accumulated.
+
+        :name: Name of the stage
+        :parent: Parent measurement, by default the current measurement of
+                 the thread when the stage is entered
+        :returns: ResourceUsage instance to be used as a context manager
+        """
+        if name not in self._usage:
+            self._usage[name] = ResourceUsage(self._measure, parent)
+        return self._usage[name]
+
+    @contextmanager
+    def _traced(self, name):
+        """
+        Trace a run of the Scraper as the span of the file.
+
+        :name: Name of the span
+        """
+        with tracing.span(name, self._params.get("traceparent")) as span:
+            if span.recording and self.filename is not None:
+                span.set_attribute("file.path", decode_path(self.filename))
+                if os.path.isfile(self.filename):
+                    span.set_attribute("file.size",
+                                       os.path.getsize(self.filename))
+            try:
+                yield
+            finally:
+                span.set_attribute("file_scraper.mimetype", self.mimetype)
+                span.set_attribute("file_scraper.version", self.version)
+                span.set_attribute("file_scraper.well_formed",
+                                   self.well_formed)
+
+    def _store_resource_usage(self):
+        """Store the measured resource usage of the stages, if measured."""
+        if self._measure:
+            self.resource_usage = dict(
+                (name, usage.as_dict())
+                for name, usage in six.iteritems(self._usage))
+
     def _check_utf8(self, check_wellformed):
         """
         UTF-8 check only for UTF-8.
 
         We know the charset after actual scraping.
         """
+        scraper = self._utf8_scraper(check_wellformed)
+        if scraper is not None:
+            self._run_all(self._run_scraper, self._collect_scraper, [scraper],
+                          self._fail_fast)
+
+    def _utf8_scraper(self, check_wellformed):
+        """
+        Return the scraper for the UTF-8 check, if the check is needed.
+
+        :check_wellformed: True, full scraping; False, skip well-formed check.
+        :returns: JHoveUtf8Scraper instance or None
+        """
         if "charset" in self.streams[0] and \
                 self.streams[0]["charset"] == "UTF-8":
-            scraper = JHoveUtf8Scraper(self.filename, check_wellformed)
-            self._scrape_file(scraper)
+            return JHoveUtf8Scraper(self.filename, check_wellformed)
+        return None
 
     def _check_mimetype_version(self):
         """
@@ -111,27 +417,107 @@ class Scraper(object):
         elif self.version:
             self.streams[0]["version"] = self.version
 
-    def scrape(self, check_wellformed=True):
+    def scrape(self, check_wellformed=True, fail_fast=False):
         """Scrape file and collect metadata.
         :check_wellformed: True, full scraping; False, skip well-formed check.
+        :fail_fast: True to stop scraping once the file is known not to be
+                    well-formed. The remaining scrapers are recorded in info
+                    as skipped.
+        """
+        self._fail_fast = fail_fast
+        self._usage = {}
+        with self._profiler.profile("scrape"), \
+                self._traced("Scraper.scrape"), self._stage("total"):
+            self._scrape(check_wellformed)
+        self._store_resource_usage()
+        if self._scheduler is not None:
+            self._scheduler.checkpoint()
+
+    def _scrape(self, check_wellformed):
+        """Detect the file type and scrape the file.
+        :check_wellformed: True, full scraping; False, skip well-formed check.
         """
-        self.detect_filetype()
+        self._detect_filetype()
 
         # File not found or MIME type could not be determined
         if not self.mimetype:
             self.streams = {}
             return
 
+        with self._stage("scraping"):
+            scrapers = self._scrapers(check_wellformed)
+            self._run_all(self._scheduled_run, self._collect_scraper,
+                          scrapers, self._fail_fast,
+                          self._execution_order(scrapers))
+        with self._stage("merge"), tracing.span("merge") as span:
+            self.streams = generate_metadata_dict(self._scraper_results,
+                                                  LOSE)
+            span.set_attribute("file_scraper.streams", len(self.streams))
+        with self._stage("utf8"), tracing.span("utf8"):
+            self._check_utf8(check_wellformed)
+        with self._stage("merge"):
+            self._check_mimetype_version()
+
+    def _scrapers(self, check_wellformed):
+        """
+        Return the scrapers for the detected file type.
+
+        :check_wellformed: True, full scraping; False, skip well-formed check.
+        :returns: List of scraper instances in the order of scraping
+        """
         self._params["mimetype_guess"] = self.mimetype
-        for scraper_class in iter_scrapers(
-                mimetype=self.mimetype, version=self.version,
-                check_wellformed=check_wellformed, params=self._params):
-            scraper = scraper_class(self.filename, check_wellformed,
-                                    self._params)
-            self._scrape_file(scraper)
-        self.streams = generate_metadata_dict(self._scraper_results, LOSE)
-        self._check_utf8(check_wellformed)
-        self._check_mimetype_version()
+        self._params["fail_fast"] = self._fail_fast
+        return [scraper_class(self.filename, check_wellformed, self._params)
+                for scraper_class in iter_scrapers(
+                    mimetype=self.mimetype, version=self.version,
+                    check_wellformed=check_wellformed, params=self._params)]
+
+    def _execution_order(self, scrapers):
+        """
+        Return the execution order of the scrapers.
+
+        :scrapers: List of scraper instances in the canonical order
+        :returns: List of the scraper instances in the order given by the
+                  scheduler, or in the canonical order without scheduler
+        """
+        if self._scheduler is None:
+            return scrapers
+        return self._scheduler.order(self.mimetype, scrapers)
+
+    def _scheduled_run(self, scraper, parent=None):
+        """Run the given scraper, recording the run for the scheduler.
+        :scraper: Scraper instance
+        :parent: Parent measurement of the resource usage
+        :returns: ResourceUsage of the scraper
+        """
+        if self._scheduler is None:
+            return self._run_scraper(scraper, parent)
+        start = time.time()
+        usage = self._run_scraper(scraper, parent)
+        self._scheduler.record(self.mimetype, scraper, time.time() - start)
+        return usage
+
+    def scrape_async(self, check_wellformed=True, concurrency=None,
+                     fail_fast=False):
+        """Scrape file and collect metadata in an asyncio event loop.
+
+        The results are the same as with scrape(). The detectors and the
+        scrapers for the file run concurrently, with their external tools
+        run as asynchronous subprocesses of the event loop. Requires
+        Python 3.
+
+        :check_wellformed: True, full scraping; False, skip well-formed check.
+        :concurrency: Maximum number of detectors and scrapers running at the
+                      same time, ASYNC_CONCURRENCY by default
+        :fail_fast: True to stop scraping once the file is known not to be
+                    well-formed, as in scrape()
+        :returns: Coroutine to be awaited
+        """
+        if six.PY2:
+            raise NotImplementedError(
+                "Asynchronous scraping requires Python 3.")
+        from file_scraper.aio import scrape_async
+        return scrape_async(self, check_wellformed, concurrency, fail_fast)
 
     def detect_filetype(self):
         """
@@ -145,19 +531,42 @@ class Scraper(object):
         that differs from the one obtained by the full scraper due to full
         scraping using a more comprehensive set of tools.
         """
+        self._usage = {}
+        with self._profiler.profile("detect"), \
+                self._traced("Scraper.detect_filetype"), self._stage("total"):
+            self._detect_filetype()
+        self._store_resource_usage()
+
+    def _detect_filetype(self):
+        """Find out the MIME type and version of the file."""
+        self._reset()
+
+        with self._stage("detection"):
+            file_exists = FileExists(self.filename, None)
+            self._scrape_file(file_exists)
+
+            if file_exists.well_formed is False:
+                return
+
+            self._identify()
+
+    def _reset(self):
+        """Erase the results of previous scraping or file type detection."""
         self.mimetype = None
         self.version = None
         self.streams = None
         self.info = {}
         self.well_formed = None
 
-        file_exists = FileExists(self.filename, None)
-        self._scrape_file(file_exists)
-
-        if file_exists.well_formed is False:
-            return
+    @property
+    def profile(self):
+        """
+        Path of the profile written of the last run.
 
-        self._identify()
+        :returns: Path of the .pstats file, or None if the last run of
+                  scrape() or detect_filetype() was not profiled
+        """
+        return self._profiler.path
 
     def is_textfile(self):
         """Find out if file is a text file.
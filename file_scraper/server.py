@@ -0,0 +1,380 @@
+"""HTTP server for scraping files with warm state.
+
+A short-lived process scraping one file spends most of its time importing
+the scrapers and loading the Fido signatures. The server keeps them loaded
+and scrapes the files of its requests in a fixed pool of worker threads::
+
+    file-scraper-server --socket /run/file-scraper.sock
+    curl --unix-socket /run/file-scraper.sock \\
+        -d '{"path": "/data/file.pdf"}' http://localhost/scrape
+
+The requests waiting for a worker are kept in a bounded queue. When the
+queue is full, new requests are answered at once with 503 Service
+Unavailable, so that the clients can retry later instead of the requests
+piling up.
+
+Endpoints:
+
+    POST /scrape   Scrape a file, as Scraper.scrape()
+    POST /detect   Detect the file type, as Scraper.detect_filetype()
+    GET /health    Status of the server
+
+The request body of /scrape and /detect is a JSON object with the key
+"path", and optionally "check_wellformed", "fail_fast", "mimetype",
+"version", "resource_usage" and "memory_usage". The response is the JSON
+object of file_scraper.batch.scrape_one().
+
+With --metrics-file, the metrics of the scraped files and the rejected
+requests are written periodically for the Prometheus textfile collector, see
+file_scraper.metrics.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import os
+import signal
+import stat
+import sys
+import threading
+
+import six
+from six.moves import BaseHTTPServer, queue, socketserver
+
+from file_scraper import metrics
+from file_scraper.batch import scrape_one
+from file_scraper.config import (METRICS_INTERVAL, SERVER_QUEUE_SIZE,
+                                 SERVER_WORKERS)
+from file_scraper.fido_reader import FidoReader
+from file_scraper.iterator import scraper_classes
+from file_scraper.magiclib import magiclib
+from file_scraper.scheduler import save_default_schedulers
+
+# Maximum size of a request body in bytes
+_MAX_BODY = 64 * 1024
+
+# Time in seconds to wait for the client when reading a request, and when
+# reading a request that is rejected in load shedding
+_REQUEST_TIMEOUT = 60.0
+_SHED_TIMEOUT = 1.0
+
+
+def warm_up():
+    """
+    Load the state needed for scraping files.
+
+    The scraper modules are imported, and the magic library and the Fido
+    signatures are loaded.
+    """
+    scraper_classes()
+    magiclib()
+    FidoReader(None)
+
+
+class _ScrapeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handler of the scraping requests."""
+
+    protocol_version = "HTTP/1.0"
+    server_version = "file-scraper"
+    timeout = _REQUEST_TIMEOUT
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handle a GET request."""
+        if self.path != "/health":
+            self._respond(404, {"error": "Not found"})
+            return
+        self._respond(200, {"status": "ok",
+                            "workers": self.server.workers,
+                            "queued": self.server.queued()})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handle a POST request."""
+        try:
+            request = self._read_request()
+        except ValueError as error:
+            self._respond(400, {"error": six.text_type(error)})
+            return
+        if self.path not in ["/scrape", "/detect"]:
+            self._respond(404, {"error": "Not found"})
+            return
+
+        kwargs = {"detect_only": self.path == "/detect"}
+        for key in ["check_wellformed", "fail_fast", "mimetype", "version",
+                    "resource_usage", "memory_usage"]:
+            if key in request:
+                kwargs[key] = request[key]
+        result = scrape_one(request["path"], **kwargs)
+        self._respond(500 if "error" in result else 200, result)
+
+    def _read_request(self):
+        """
+        Read the JSON body of a request.
+
+        :returns: Request as a dict with at least the key "path"
+        :raises: ValueError if the request is not valid
+        """
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > _MAX_BODY:
+            raise ValueError("Request too large")
+        body = self.rfile.read(length)
+        try:
+            request = json.loads(body.decode("utf-8"))
+        except ValueError:
+            raise ValueError("Request is not valid JSON")
+        if not isinstance(request, dict) or \
+                not isinstance(request.get("path"), six.string_types):
+            raise ValueError("Request has no path")
+        return request
+
+    def _respond(self, status, content, headers=None):
+        """
+        Send a JSON response.
+
+        :status: HTTP status code
+        :content: JSON serializable content
+        :headers: dict of extra headers
+        """
+        body = json.dumps(content, sort_keys=True, ensure_ascii=False,
+                          default=six.text_type).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for (name, value) in six.iteritems(headers or {}):
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        """Return the client address, also for Unix sockets."""
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        # pylint: disable=redefined-builtin
+        """Log the requests only if the server is verbose."""
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(
+                self, format, *args)
+
+
+class _OverloadedHandler(_ScrapeHandler):
+    """Handler rejecting the requests when the queue is full."""
+
+    timeout = _SHED_TIMEOUT
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Reject a GET request."""
+        self._overloaded()
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Reject a POST request after reading it."""
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(min(length, _MAX_BODY))
+        self._overloaded()
+
+    def _overloaded(self):
+        """Respond that the server is overloaded."""
+        metrics.inc("file_scraper_server_rejected_total")
+        self._respond(503, {"error": "Server overloaded"},
+                      {"Retry-After": "1"})
+
+
+class _WorkerPoolMixIn(object):
+    """
+    Server mixin handling the requests in a pool of worker threads.
+
+    The accepted requests wait for a worker in a bounded queue, and the
+    requests arriving when the queue is full are rejected.
+    """
+
+    workers = None
+    verbose = False
+    _queue = None
+
+    def start_workers(self, workers, queue_size):
+        """
+        Start the worker threads.
+
+        :workers: Number of worker threads
+        :queue_size: Maximum number of requests waiting for a worker
+        """
+        self.workers = workers
+        self._queue = queue.Queue(queue_size)
+        for _ in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+
+    def stop_workers(self):
+        """Stop the worker threads after the queued requests."""
+        for _ in range(self.workers):
+            self._queue.put(None)
+
+    def queued(self):
+        """Return the number of requests waiting for a worker."""
+        return self._queue.qsize()
+
+    def process_request(self, request, client_address):
+        """
+        Queue a request, or reject it if the queue is full.
+
+        :request: Socket of the request
+        :client_address: Address of the client
+        """
+        try:
+            self._queue.put_nowait((request, client_address))
+        except queue.Full:
+            try:
+                _OverloadedHandler(request, client_address, self)
+            except Exception:  # pylint: disable=broad-except
+                self.handle_error(request, client_address)
+            self.shutdown_request(request)
+
+    def _work(self):
+        """Handle the queued requests until stopped."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            (request, client_address) = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:  # pylint: disable=broad-except
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+
+class ScrapeServer(_WorkerPoolMixIn, BaseHTTPServer.HTTPServer):
+    """Scraping server listening on a TCP address."""
+
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class UnixScrapeServer(_WorkerPoolMixIn, socketserver.UnixStreamServer):
+    """Scraping server listening on a Unix socket."""
+
+    request_queue_size = 128
+
+
+def make_server(address, workers=None, queue_size=None, verbose=False):
+    """
+    Create a scraping server and start its workers.
+
+    The server is run with serve_forever() and stopped with shutdown() and
+    stop_workers().
+
+    :address: Tuple (host, port) to listen on TCP, or the path of a Unix
+              socket
+    :workers: Number of worker threads, SERVER_WORKERS by default
+    :queue_size: Maximum number of requests waiting for a worker,
+                 SERVER_QUEUE_SIZE by default
+    :verbose: True to log the requests to stderr
+    :returns: ScrapeServer or UnixScrapeServer instance
+    :raises: ValueError if the path of the Unix socket exists and is not a
+             socket
+    """
+    if isinstance(address, tuple):
+        server = ScrapeServer(address, _ScrapeHandler)
+    else:
+        # A socket left by a previous server is replaced, but nothing else
+        if os.path.exists(address):
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                raise ValueError("{} exists and is not a socket".format(
+                    address))
+            os.remove(address)
+        server = UnixScrapeServer(address, _ScrapeHandler)
+    server.verbose = verbose
+    server.start_workers(workers or SERVER_WORKERS,
+                         queue_size or SERVER_QUEUE_SIZE)
+    return server
+
+
+def _stop_on_sigterm(server):
+    """
+    Shut down a server on SIGTERM, e.g. when its service is stopped.
+
+    shutdown() waits for serve_forever() to return, so it is called in
+    another thread than the signal handler.
+
+    :server: Server run with serve_forever() in the main thread
+    :returns: The previous handler of SIGTERM
+    """
+    def handler(signum, frame):  # pylint: disable=unused-argument
+        """Shut down the server in a thread."""
+        thread = threading.Thread(target=server.shutdown)
+        thread.daemon = True
+        thread.start()
+
+    return signal.signal(signal.SIGTERM, handler)
+
+
+def main(argv=None):
+    """
+    Run the scraping server until interrupted or terminated.
+
+    :argv: List of arguments without the program name, sys.argv by default
+    :returns: Exit status
+    """
+    parser = argparse.ArgumentParser(
+        prog="file-scraper-server",
+        description="Serve scraping requests over HTTP.")
+    parser.add_argument(
+        "--socket", help="path of a Unix socket to listen on")
+    parser.add_argument(
+        "--host", default="127.0.0.1",
+        help="address to listen on, 127.0.0.1 by default")
+    parser.add_argument(
+        "--port", type=int, default=8080,
+        help="TCP port to listen on, 8080 by default")
+    parser.add_argument(
+        "--workers", type=int, default=SERVER_WORKERS,
+        help="number of worker threads")
+    parser.add_argument(
+        "--queue-size", type=int, default=SERVER_QUEUE_SIZE,
+        help="maximum number of requests waiting for a worker")
+    parser.add_argument(
+        "--metrics-file", metavar="FILE",
+        help="write the metrics of the server to FILE for the Prometheus "
+             "textfile collector every {} seconds".format(METRICS_INTERVAL))
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="log the requests")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    warm_up()
+    address = args.socket or (args.host, args.port)
+    try:
+        server = make_server(address, args.workers, args.queue_size,
+                             args.verbose)
+    except ValueError as error:
+        parser.error(six.text_type(error))
+    writer = None
+    if args.metrics_file:
+        registry = metrics.Registry()
+        metrics.set_registry(registry)
+        writer = metrics.TextfileWriter(registry, args.metrics_file)
+        writer.start()
+    previous = _stop_on_sigterm(server)
+    print("Serving on {}".format(args.socket or "http://{}:{}".format(
+        args.host, args.port)), file=sys.stderr)
+    sys.stderr.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        server.server_close()
+        server.stop_workers()
+        save_default_schedulers()
+        if args.socket:
+            os.remove(args.socket)
+        if writer is not None:
+            writer.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,39 +1,411 @@
 """Wrapper for calling external commands"""
 
+import errno
+import fcntl
+import io
 import os
+import select
+import signal
 import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 
 import six
+from file_scraper import metrics, tracing
+from file_scraper.accounting import record_subprocess
+from file_scraper.config import (SHELL_CONCURRENCY, SHELL_DEFAULT_TIMEOUT,
+                                 SHELL_FIXTURE_DIR, SHELL_FIXTURE_LATENCY,
+                                 SHELL_FIXTURE_MODE, SHELL_KILL_GRACE,
+                                 SHELL_LOCK_DIR, SHELL_SPOOL_THRESHOLD,
+                                 SHELL_TIMEOUTS)
+from file_scraper.exceptions import ShellTimeoutError
+from file_scraper.shell_fixtures import (FixtureStore, record_runner,
+                                         replay_runner)
 from file_scraper.utils import ensure_text
 
 
+# Appended to a capped output in place of the omitted bytes
+TRUNCATED_MARKER = b"\n[Output truncated: %d bytes omitted]\n"
+
+_CHUNK_SIZE = 65536
+
+# Seconds between the checks of the readers of the pipes for being stopped
+_READ_POLL_INTERVAL = 0.1
+
+_LOCAL = threading.local()
+
+
+def _cut(data, size):
+    """
+    Cut bytes to the given size without splitting a UTF-8 character.
+
+    :data: Byte string
+    :size: Maximum size in bytes
+    :returns: Byte string
+    """
+    # Move back over the continuation bytes of a character that would be cut
+    while 0 < size < len(data) and 0x80 <= six.indexbytes(data, size) < 0xC0:
+        size -= 1
+    return data[:size]
+
+
+class _Capture(object):
+    """
+    Storage of one output of a command, optionally capped.
+
+    If the output is capped, the bytes over the limit are dropped and
+    replaced with TRUNCATED_MARKER when the capture is closed.
+    """
+
+    def __init__(self, output, limit=None):
+        """
+        Initialize capture.
+
+        :output: Writable file object where the output is stored
+        :limit: Maximum number of bytes to store, or None for no limit
+        """
+        self.output = output
+        self.limit = limit
+        self.stored = 0
+        self.omitted = 0
+
+    def feed(self, chunk):
+        """
+        Store a chunk of the output.
+
+        :chunk: Byte string
+        """
+        if self.omitted:
+            self.omitted += len(chunk)
+            return
+        if self.limit is not None and self.stored + len(chunk) > self.limit:
+            kept = _cut(chunk, self.limit - self.stored)
+            self.omitted = len(chunk) - len(kept)
+            chunk = kept
+        self.output.write(chunk)
+        self.stored += len(chunk)
+
+    def close(self):
+        """
+        Finish the output, adding the truncation marker if needed.
+
+        :returns: Number of omitted bytes
+        """
+        if self.omitted:
+            self.output.write(TRUNCATED_MARKER % self.omitted)
+        return self.omitted
+
+
+def _read_pipe(pipe, capture, stopped):
+    """
+    Read a pipe until EOF or until stopped, and close it.
+
+    The pipe is read to the end even if the output is capped, so that the
+    command does not block. The pipe is polled, so that the reader can be
+    stopped when a process that has left the process group of the command
+    keeps the pipe open.
+
+    :pipe: Pipe file object
+    :capture: _Capture instance where the output is stored
+    :stopped: threading.Event set to stop reading
+    """
+    fd = pipe.fileno()
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
+    try:
+        while not stopped.is_set():
+            if not poller.poll(_READ_POLL_INTERVAL * 1000):
+                continue
+            chunk = os.read(fd, _CHUNK_SIZE)
+            if not chunk:
+                break
+            capture.feed(chunk)
+    finally:
+        pipe.close()
+
+
+def _returncode(status):
+    """
+    Convert a wait status to a returncode as reported by subprocess.
+
+    :status: Status returned by os.wait4()
+    :returns: Exit status, or negative signal number if the process was
+              killed by a signal
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _remaining(deadline):
+    """
+    Return the time left before the deadline.
+
+    :deadline: Deadline as time.time() value, or None for no deadline
+    :returns: Seconds left, at least zero, or None if there is no deadline
+    """
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), 0)
+
+
+def _input_size(command):
+    """
+    Return the size of the largest input file of a command.
+
+    All arguments of the command naming an existing file are considered.
+
+    :command: Command as list
+    :returns: Size in bytes
+    """
+    sizes = [0]
+    for argument in command[1:]:
+        try:
+            if os.path.isfile(argument):
+                sizes.append(os.path.getsize(argument))
+        except (TypeError, ValueError):
+            pass
+    return max(sizes)
+
+
+def _lock_dir():
+    """
+    Return the directory of the concurrency lock files, creating it if needed.
+
+    :returns: Path of the directory
+    """
+    directory = SHELL_LOCK_DIR
+    if directory is None:
+        directory = os.path.join(tempfile.gettempdir(), "file-scraper-locks")
+    try:
+        os.makedirs(directory)
+        # The slots are shared by all users running file-scraper
+        os.chmod(directory, 0o1777)
+    except OSError as error:
+        if error.errno != errno.EEXIST:
+            raise
+    return directory
+
+
+class ToolSlot(object):
+    """
+    Slot for running one instance of a tool with limited concurrency.
+
+    The slots of a tool are lock files locked with flock(), so the limit in
+    SHELL_CONCURRENCY is shared by all processes and threads on the machine.
+    A slot is released when the lock file is closed, also if the process
+    holding it dies. The lock files are opened read-only, so that the files
+    created by other users can be locked too, and a tool whose lock files
+    cannot be opened at all is run without a slot.
+    """
+
+    def __init__(self, tool):
+        """
+        Initialize slot.
+
+        :tool: Name of the tool
+        """
+        self.tool = tool
+        self.limit = SHELL_CONCURRENCY.get(tool)
+        self._fd = None
+
+    def __enter__(self):
+        """Wait until a slot of the tool is free and reserve it."""
+        delay = 0.01
+        while not self.acquire_nowait():
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Release the slot."""
+        self.release()
+
+    def acquire_nowait(self):
+        """
+        Reserve a free slot of the tool without waiting.
+
+        :returns: True if a slot was reserved, the tool is not limited or its
+                  lock files cannot be opened, False if all slots are in
+                  use
+        """
+        if not self.limit:
+            return True
+        try:
+            directory = _lock_dir()
+        except OSError:
+            return True
+        usable = False
+        for index in range(self.limit):
+            try:
+                if self._try_lock(os.path.join(
+                        directory, "%s.%d.lock" % (self.tool, index))):
+                    return True
+            except OSError:
+                # The lock file is not accessible to this user
+                continue
+            usable = True
+        return not usable
+
+    def release(self):
+        """Release the reserved slot."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _try_lock(self, path):
+        """
+        Try to lock the given slot file without waiting.
+
+        :path: Path of the lock file
+        :returns: True if the slot was reserved, False if it is in use
+        :raises: OSError if the lock file cannot be opened
+        """
+        # flock() does not need write access, and a read-only lock file
+        # created by another user with their umask can still be locked
+        fd = os.open(path, os.O_RDONLY | os.O_CREAT, 0o666)
+        # The lock must not be inherited by the tool or its children
+        fcntl.fcntl(fd, fcntl.F_SETFD,
+                    fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError) as error:
+            os.close(fd)
+            if error.errno in (errno.EAGAIN, errno.EACCES):
+                return False
+            raise
+        self._fd = fd
+        return True
+
+
+def _fixture_runner():
+    """
+    Return the runner of the commands set in SHELL_FIXTURE_MODE.
+
+    :returns: Function running the command of a Shell, or None to run the
+              commands normally
+    """
+    if SHELL_FIXTURE_MODE is None:
+        return None
+    store = FixtureStore(SHELL_FIXTURE_DIR)
+    if SHELL_FIXTURE_MODE == "record":
+        return record_runner(store)
+    if SHELL_FIXTURE_MODE == "replay":
+        return replay_runner(store, SHELL_FIXTURE_LATENCY)
+    raise ValueError("Unknown SHELL_FIXTURE_MODE: %s" % SHELL_FIXTURE_MODE)
+
+
+@contextmanager
+def subprocess_runner(runner):
+    """
+    Run the commands of Shell in the current thread with the given function.
+
+    This allows the commands of synchronous scrapers run in a worker thread
+    to be executed elsewhere, e.g. in an asyncio event loop.
+
+    :runner: Function called with the Shell instance, which must run the
+             command and store its results in the instance
+    """
+    previous = getattr(_LOCAL, "runner", None)
+    _LOCAL.runner = runner
+    try:
+        yield
+    finally:
+        _LOCAL.runner = previous
+
+
 class Shell(object):
     """Shell command handler for non-Python 3rd party software."""
 
+    # pylint: disable=too-many-instance-attributes
+
     def __init__(self, command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                 env=None):
+                 env=None, tool=None, timeout=None, spool=False,
+                 stderr_limit=None):
         """
         Initialize instance.
 
+        The command is run in its own session. If it does not finish within
+        the timeout, its whole process group is terminated and
+        ShellTimeoutError is raised when the results are accessed. If the
+        concurrency of the tool is limited in SHELL_CONCURRENCY, the command
+        is started only when a slot of the tool is free. The command is
+        recorded or replayed instead of run as set in SHELL_FIXTURE_MODE.
+
+        In the spooled mode the piped outputs are stored in temporary files
+        once they grow over SHELL_SPOOL_THRESHOLD bytes. They can then be
+        processed without loading them into memory with iter_chunks(),
+        iter_lines() and open_output().
+
         :command: Command to execute as list
         :output_file: Output file handle
         :env: Environment variables
+        :tool: Name of the tool, used for looking up its timeout in
+               SHELL_TIMEOUTS and its concurrency limit in
+               SHELL_CONCURRENCY. Defaults to the name of the executable.
+        :timeout: Timeout in seconds. Defaults to the timeout configured for
+                  the tool, scaled by the size of the input file.
+        :spool: True to spool large outputs to temporary files
+        :stderr_limit: Maximum number of stderr bytes to store. The rest of
+                       the output is replaced with TRUNCATED_MARKER. None
+                       stores all of it.
         """
         self.command = command
 
-        self._stdout = None
-        self._stderr = None
+        self._outputs = {"stdout": None, "stderr": None}
+        self._texts = {}
         self._returncode = None
+        self._rusage = None
+        self.timed_out = False
+        self.stderr_truncated = 0
 
         self.stdout_file = stdout
         self.stderr_file = stderr
+        self.spool = spool
+        self.stderr_limit = stderr_limit
+
+        if tool is None:
+            tool = os.path.basename(ensure_text(command[0]))
+        self.tool = tool
+        if timeout is None:
+            timeout = self._configured_timeout()
+        self.timeout = timeout
 
         self._env = os.environ.copy()
+        self.extra_env = env or {}
 
         if env:
             for key, value in six.iteritems(env):
                 self._env[key] = value
 
+    def __enter__(self):
+        """Return the instance, to be closed at the end of with block."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the stored outputs."""
+        self.close()
+
+    def close(self):
+        """Close the stored outputs, removing the spooled temporary files."""
+        for output in self._outputs.values():
+            if output is not None:
+                output.close()
+
+    def _configured_timeout(self):
+        """
+        Return the configured timeout of the tool for this command.
+
+        :returns: Timeout in seconds, or None for no timeout
+        """
+        timeout = SHELL_TIMEOUTS.get(self.tool, SHELL_DEFAULT_TIMEOUT)
+        if timeout is None:
+            return None
+        (base, per_megabyte) = timeout
+        return base + per_megabyte * _input_size(self.command) / 1024.0**2
+
     @property
     def returncode(self):
         """
@@ -41,29 +413,30 @@ class Shell(object):
 
         :returns: Returncode
         """
-        return self.popen()["returncode"]
+        self._run()
+        return self._returncode
 
     @property
     def stderr(self):
         """
         Standard error output from the command.
 
+        The decoded text is cached.
+
         :returns: Stderr as unicode string
         """
-        if self.stderr_raw is None:
-            return None
-        return ensure_text(self.stderr_raw)
+        return self._text("stderr")
 
     @property
     def stdout(self):
         """
         Command standard error output.
 
+        The decoded text is cached.
+
         :returns: Stdout as unicode string
         """
-        if self.stdout_raw is None:
-            return None
-        return ensure_text(self.stdout_raw)
+        return self._text("stdout")
 
     @property
     def stderr_raw(self):
@@ -72,7 +445,7 @@ class Shell(object):
 
         :returns: Stderr as byte string
         """
-        return self.popen()["stderr"]
+        return self._raw("stderr")
 
     @property
     def stdout_raw(self):
@@ -81,29 +454,296 @@ class Shell(object):
 
         :returns: Stdout as byte string
         """
-        return self.popen()["stdout"]
+        return self._raw("stdout")
+
+    def _text(self, name):
+        """
+        Return an output of the command as text, decoding it only once.
+
+        :name: "stdout" or "stderr"
+        :returns: Output as unicode string, or None if it was not piped
+        """
+        if name not in self._texts:
+            raw = self._raw(name)
+            self._texts[name] = None if raw is None else ensure_text(raw)
+        return self._texts[name]
+
+    def _raw(self, name):
+        """
+        Return an output of the command as bytes.
+
+        :name: "stdout" or "stderr"
+        :returns: Output as byte string, or None if it was not piped
+        """
+        output = self.open_output(name)
+        if output is None:
+            return None
+        if isinstance(output, io.BytesIO):
+            return output.getvalue()
+        return output.read()
+
+    def open_output(self, name):
+        """
+        Return an output of the command as a binary file object.
+
+        The file object is rewound to the beginning. It is shared by all
+        readers of the output, so the output should not be read in several
+        places at the same time.
+
+        :name: "stdout" or "stderr"
+        :returns: File object, or None if the output was not piped
+        """
+        self._run()
+        output = self._outputs[name]
+        if output is not None:
+            output.seek(0)
+        return output
+
+    def iter_chunks(self, name="stdout", size=_CHUNK_SIZE):
+        """
+        Iterate over an output of the command in chunks of bytes.
+
+        :name: "stdout" or "stderr"
+        :size: Maximum chunk size in bytes
+        :returns: Iterator of byte strings
+        """
+        output = self.open_output(name)
+        if output is None:
+            return iter([])
+        return iter(lambda: output.read(size), b"")
+
+    def iter_lines(self, name="stdout"):
+        """
+        Iterate over the lines of an output of the command.
+
+        :name: "stdout" or "stderr"
+        :returns: Iterator of unicode strings including the line endings
+        """
+        output = self.open_output(name)
+        if output is None:
+            return iter([])
+        return (ensure_text(line) for line in output)
 
     def popen(self):
         """
         Run the command and store results to class attributes for caching.
 
         :returns: Returncode, stdout, stderr as dictionary
+        :raises: ShellTimeoutError if the command timed out
         """
+        self._run()
+        return {
+            "returncode": self._returncode,
+            "stderr": self.stderr_raw,
+            "stdout": self.stdout_raw
+            }
+
+    def _run(self):
+        """
+        Run the command unless it has already been run.
 
+        :raises: ShellTimeoutError if the command timed out
+        """
         if self._returncode is None:
+            with tracing.span("subprocess") as span:
+                if span.recording:
+                    span.set_attribute("process.executable.name", self.tool)
+                    span.set_attribute(
+                        "process.command_args",
+                        [ensure_text(argument, errors="replace")
+                         for argument in self.command])
+                runner = getattr(_LOCAL, "runner", None) or \
+                    _fixture_runner()
+                if runner is None:
+                    self._execute()
+                else:
+                    runner(self)
+                span.set_attribute("process.exit_code", self._returncode)
+                span.set_attribute("file_scraper.timed_out", self.timed_out)
+            record_subprocess(self._rusage)
+            metrics.inc("file_scraper_subprocesses_total", {"tool": self.tool})
+            if self.timed_out:
+                metrics.inc("file_scraper_subprocess_timeouts_total",
+                            {"tool": self.tool})
+
+        self._check_timeout()
+
+    def _check_timeout(self):
+        """
+        Check that the command finished in time.
+
+        :raises: ShellTimeoutError if the command timed out
+        """
+        if self.timed_out:
+            raise ShellTimeoutError(
+                "%s did not finish within %.0f seconds and was terminated." %
+                (self.tool, self.timeout))
 
+    def _execute(self):
+        """Run the command in a subprocess and store the results."""
+        if six.PY2:
+            session = {"preexec_fn": os.setsid}
+        else:
+            session = {"start_new_session": True}
+
+        with ToolSlot(self.tool):
             proc = subprocess.Popen(
                 args=self.command,
                 stdout=self.stdout_file,
                 stderr=self.stderr_file,
                 shell=False,
-                env=self._env)
+                env=self._env,
+                **session)
 
-            (self._stdout, self._stderr) = proc.communicate()
-            self._returncode = proc.returncode
+            self._communicate(proc)
 
-        return {
-            "returncode": self._returncode,
-            "stderr": self._stderr,
-            "stdout": self._stdout
-            }
+    def _new_output(self):
+        """
+        Return a new file object for storing an output of the command.
+
+        :returns: In-memory or spooled file object
+        """
+        if self.spool:
+            return tempfile.SpooledTemporaryFile(
+                max_size=SHELL_SPOOL_THRESHOLD)
+        return io.BytesIO()
+
+    def _communicate(self, proc):
+        """
+        Read the outputs of the process and wait for it to finish.
+
+        The process is reaped with os.wait4() so that its resource usage is
+        known. If the timeout expires, the process group is terminated, and
+        the outputs are read for at most SHELL_KILL_GRACE seconds more. The
+        process group is terminated also if the waiting is interrupted, as
+        the command runs in its own session and would not get e.g. the
+        SIGINT of the terminal.
+
+        :proc: Popen instance
+        """
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+
+        readers = []
+        stopped = threading.Event()
+        captures = self._new_captures(proc)
+        for (name, capture) in six.iteritems(captures):
+            reader = threading.Thread(
+                target=_read_pipe,
+                args=(getattr(proc, name), capture, stopped))
+            reader.daemon = True
+            reader.start()
+            readers.append(reader)
+
+        try:
+            # The pipes are closed when the process group has exited
+            for reader in readers:
+                reader.join(_remaining(deadline))
+            if any(reader.is_alive() for reader in readers):
+                status = None
+            else:
+                status = self._wait(proc, deadline)
+
+            if status is None:
+                self.timed_out = True
+                status = self._kill(proc)
+                # A process that has left the process group can keep the
+                # pipes open
+                grace = time.time() + SHELL_KILL_GRACE
+                for reader in readers:
+                    reader.join(_remaining(grace))
+        except BaseException:
+            stopped.set()
+            # The process is not killed if it has already been reaped
+            if self._rusage is None:
+                self._kill(proc)
+            raise
+        finally:
+            stopped.set()
+            for reader in readers:
+                reader.join()
+
+        self._returncode = _returncode(status)
+        proc.returncode = self._returncode
+        self._close_captures(captures)
+
+    def _new_captures(self, proc):
+        """
+        Create the storage for the piped outputs of the process.
+
+        :proc: Process with attributes stdout and stderr, which are None for
+               the outputs not piped
+        :returns: dict of _Capture instances by output name
+        """
+        captures = {}
+        for (name, limit) in [("stdout", None),
+                              ("stderr", self.stderr_limit)]:
+            if getattr(proc, name) is not None:
+                self._outputs[name] = self._new_output()
+                captures[name] = _Capture(self._outputs[name], limit)
+        return captures
+
+    def _close_captures(self, captures):
+        """
+        Finish the captured outputs.
+
+        :captures: dict of _Capture instances by output name
+        """
+        for (name, capture) in six.iteritems(captures):
+            omitted = capture.close()
+            if name == "stderr":
+                self.stderr_truncated = omitted
+
+    def _wait(self, proc, deadline):
+        """
+        Wait for the process to exit.
+
+        :proc: Popen instance
+        :deadline: Deadline as time.time() value, or None to wait forever
+        :returns: Wait status, or None if the deadline passed
+        """
+        if deadline is None:
+            (_, status, self._rusage) = os.wait4(proc.pid, 0)
+            return status
+
+        delay = 0.001
+        while True:
+            (pid, status, rusage) = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                self._rusage = rusage
+                return status
+            if _remaining(deadline) == 0:
+                return None
+            time.sleep(min(delay, _remaining(deadline)))
+            delay = min(delay * 2, 0.05)
+
+    def _kill(self, proc):
+        """
+        Terminate the process group of the process.
+
+        SIGTERM is sent first and SIGKILL after a grace period.
+
+        :proc: Popen instance
+        :returns: Wait status of the process
+        """
+        self._signal_group(proc, signal.SIGTERM)
+        status = self._wait(proc, time.time() + SHELL_KILL_GRACE)
+        self._signal_group(proc, signal.SIGKILL)
+        if status is None:
+            status = self._wait(proc, None)
+        return status
+
+    @staticmethod
+    def _signal_group(proc, signum):
+        """
+        Send a signal to the process group of the process.
+
+        :proc: Popen instance
+        :signum: Signal number
+        """
+        try:
+            os.killpg(proc.pid, signum)
+        except OSError:
+            # The process group has already exited
+            pass
@@ -0,0 +1,367 @@
+"""Record and replay of the external commands run with Shell.
+
+In the record mode the commands are run normally, and their returncodes,
+outputs and resource usage are stored as fixtures in a directory. In the
+replay mode the commands are not run, but their results are served from
+the fixtures, optionally after a delay simulating the recorded run time.
+This allows benchmarking and testing the Python side of scraping on
+machines without the external tools.
+
+A fixture is keyed by the name of the tool, its arguments, and the extra
+environment variables given to Shell. The arguments naming existing files
+are replaced by the SHA-1 digests of the files, so that the fixtures do not
+depend on the location of the scraped files or on the names of temporary
+files. The temporary directories named by the arguments and the
+environment, e.g. the output directory of a conversion, are replaced by
+placeholders in the order they appear. The files the command writes
+directly in these directories are recorded, and written to the directories
+of the replayed command, so that the scrapers find the converted files.
+The fixtures are used either for the commands of the current thread with
+subprocess_runner()::
+
+    with subprocess_runner(record_runner(FixtureStore(directory))):
+        scraper.scrape()
+
+or for all the commands, also in the worker processes of the batch mode,
+with SHELL_FIXTURE_MODE in file_scraper.config.
+"""
+from __future__ import unicode_literals
+
+import base64
+import errno
+import hashlib
+import io
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import six
+from file_scraper.utils import ensure_text, hexdigest
+
+# The functions here store and restore the state of Shell
+# pylint: disable=protected-access
+
+
+class _RecordedUsage(object):
+    """Resource usage of a replayed command, as returned by os.wait4()."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, utime, stime, maxrss):
+        """
+        Initialize usage.
+
+        :utime: User CPU time in seconds
+        :stime: System CPU time in seconds
+        :maxrss: Peak resident set size in kilobytes
+        """
+        self.ru_utime = utime
+        self.ru_stime = stime
+        self.ru_maxrss = maxrss
+
+
+def _temporary(path):
+    """
+    Find out whether a path is in the temporary directory.
+
+    :path: Path as text
+    :returns: True if the path is absolute and in the temporary directory
+    """
+    return os.path.isabs(path) and \
+        path.startswith(os.path.join(tempfile.gettempdir(), ""))
+
+
+def _placeholder(directory, directories):
+    """
+    Return the placeholder of a temporary directory.
+
+    :directory: Path of the directory
+    :directories: List of the temporary directories of the command, to
+                  which a new directory is appended
+    :returns: Placeholder, e.g. "<tmp0>"
+    """
+    if directory not in directories:
+        directories.append(directory)
+    return "<tmp{}>".format(directories.index(directory))
+
+
+def _argument_key(argument, directories):
+    """
+    Return the part of the fixture key for a command argument.
+
+    :argument: Argument or environment value as text or bytes
+    :directories: List of the temporary directories of the command, to
+                  which the new directories named by the argument are
+                  appended
+    :returns: Digest of the file named by the argument, the argument with
+              the temporary directory replaced by its placeholder, or the
+              argument as text
+    """
+    try:
+        if os.path.isfile(argument):
+            return "sha1:" + hexdigest(argument)
+    except (TypeError, ValueError):
+        pass
+    text = ensure_text(argument)
+    if not _temporary(text):
+        return text
+    if os.path.isdir(text):
+        return _placeholder(os.path.normpath(text), directories)
+    (directory, name) = os.path.split(text)
+    if os.path.isdir(directory):
+        return "{}/{}".format(_placeholder(os.path.normpath(directory),
+                                           directories), name)
+    return text
+
+
+def _identity(shell):
+    """
+    Return the identity of a command, used as the key of its fixture.
+
+    :shell: Shell instance
+    :returns: Tuple of the identity as dict and the list of the temporary
+              directories of the command, the directory of placeholder
+              "<tmpN>" at index N
+    """
+    directories = []
+    identity = {
+        "tool": shell.tool,
+        "arguments": [_argument_key(argument, directories)
+                      for argument in shell.command[1:]],
+        "env": dict((ensure_text(key), _argument_key(value, directories))
+                    for (key, value) in sorted(
+                        six.iteritems(shell.extra_env)))
+    }
+    return (identity, directories)
+
+
+def _snapshot(directories):
+    """
+    Return the state of the files in temporary directories.
+
+    :directories: List of directory paths
+    :returns: dict of (modification time, size) by file path
+    """
+    state = {}
+    for directory in directories:
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                state[path] = (stat.st_mtime, stat.st_size)
+    return state
+
+
+def _encode(data):
+    """
+    Encode an output for storing in JSON.
+
+    :data: Byte string or None
+    :returns: Base64 encoded text or None
+    """
+    if data is None:
+        return None
+    return base64.b64encode(data).decode("ascii")
+
+
+def _decode(data):
+    """
+    Decode an output stored in JSON.
+
+    :data: Base64 encoded text or None
+    :returns: Byte string or None
+    """
+    if data is None:
+        return None
+    return base64.b64decode(data.encode("ascii"))
+
+
+class FixtureStore(object):
+    """Directory of the recorded results of the commands."""
+
+    def __init__(self, directory):
+        """
+        Initialize store.
+
+        :directory: Path of the directory, created when needed
+        """
+        self.directory = os.path.expanduser(directory)
+
+    def key(self, shell):
+        """
+        Return the key of the fixture of a command.
+
+        :shell: Shell instance
+        :returns: Hexadecimal digest of the tool, the arguments and the
+                  extra environment variables
+        """
+        identity = _identity(shell)[0]
+        return hashlib.sha1(json.dumps(
+            identity, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def path(self, shell):
+        """
+        Return the path of the fixture of a command.
+
+        :shell: Shell instance
+        :returns: Path of the JSON file
+        """
+        return os.path.join(self.directory, shell.tool,
+                            self.key(shell) + ".json")
+
+    def save(self, shell, wall_time, before=None):
+        """
+        Store the results of a command that has been run.
+
+        The fixture is written under a temporary name and renamed, so that
+        processes recording the same command do not see partial files.
+
+        :shell: Shell instance
+        :wall_time: Run time of the command in seconds
+        :before: Snapshot of the command taken before it was run, as
+                 returned by snapshot(). The fixture is then stored under
+                 the key of the command before it was run, as the command
+                 may create files named by its arguments, and the files
+                 created or changed by the command in its temporary
+                 directories are stored.
+        """
+        if before is None:
+            before = (self.path(shell), [], {})
+        (path, directories, state) = before
+        rusage = shell._rusage
+        fixture = {
+            "argv": [ensure_text(argument) for argument in shell.command],
+            "env": dict((ensure_text(key), ensure_text(value))
+                        for (key, value) in six.iteritems(shell.extra_env)),
+            "returncode": shell._returncode,
+            "timed_out": shell.timed_out,
+            "stderr_truncated": shell.stderr_truncated,
+            "wall_time": wall_time,
+            "rusage": None if rusage is None else [
+                rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss]
+        }
+        for name in ["stdout", "stderr"]:
+            output = shell._outputs[name]
+            data = None
+            if output is not None:
+                output.seek(0)
+                data = output.read()
+            fixture[name] = _encode(data)
+        fixture["files"] = {}
+        for (filepath, current) in six.iteritems(_snapshot(directories)):
+            if state.get(filepath) == current:
+                continue
+            (directory, name) = os.path.split(filepath)
+            with io.open(filepath, "rb") as infile:
+                fixture["files"]["{}/{}".format(_placeholder(
+                    directory, directories), name)] = _encode(infile.read())
+
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+        (fd, partial) = tempfile.mkstemp(dir=directory, suffix=".part")
+        with io.open(fd, "wt", encoding="utf-8") as outfile:
+            outfile.write(ensure_text(json.dumps(fixture, sort_keys=True)))
+        os.rename(partial, path)
+
+    def load(self, shell):
+        """
+        Read the fixture of a command.
+
+        :shell: Shell instance
+        :returns: Fixture as dict, or None if the command has not been
+                  recorded
+        """
+        try:
+            with io.open(self.path(shell), "rt", encoding="utf-8") as infile:
+                return json.load(infile)
+        except IOError as error:
+            if error.errno == errno.ENOENT:
+                return None
+            raise
+
+    def snapshot(self, shell):
+        """
+        Return the state of a command before it is run.
+
+        :shell: Shell instance
+        :returns: Tuple of the path of the fixture, the temporary
+                  directories of the command and the state of the files in
+                  them, for save()
+        """
+        directories = _identity(shell)[1]
+        return (self.path(shell), directories, _snapshot(directories))
+
+    @staticmethod
+    def restore(shell, fixture):
+        """
+        Store the recorded results of a command in a Shell instance, and
+        write the files written by the command.
+
+        :shell: Shell instance
+        :fixture: Fixture as returned by load()
+        """
+        directories = _identity(shell)[1]
+        for (name, data) in six.iteritems(fixture.get("files", {})):
+            (placeholder, filename) = name.split("/", 1)
+            directory = directories[int(placeholder[len("<tmp"):-1])]
+            with io.open(os.path.join(directory, filename), "wb") as outfile:
+                outfile.write(_decode(data))
+        for name in ["stdout", "stderr"]:
+            if getattr(shell, name + "_file") != subprocess.PIPE:
+                continue
+            output = shell._new_output()
+            output.write(_decode(fixture[name]) or b"")
+            shell._outputs[name] = output
+        shell._returncode = fixture["returncode"]
+        shell.timed_out = fixture["timed_out"]
+        shell.stderr_truncated = fixture["stderr_truncated"]
+        if fixture["rusage"] is not None:
+            shell._rusage = _RecordedUsage(*fixture["rusage"])
+
+
+def record_runner(store):
+    """
+    Return a Shell runner recording the commands it runs.
+
+    :store: FixtureStore instance
+    :returns: Function for subprocess_runner()
+    """
+    def run(shell):
+        """Run the command and store its results."""
+        before = store.snapshot(shell)
+        start = time.time()
+        shell._execute()
+        store.save(shell, time.time() - start, before)
+    return run
+
+
+def replay_runner(store, latency=0.0):
+    """
+    Return a Shell runner serving the commands from recorded fixtures.
+
+    :store: FixtureStore instance
+    :latency: Fraction of the recorded run time of a command to wait before
+              its results are served, 0 for none and 1 for all of it
+    :returns: Function for subprocess_runner()
+    """
+    def run(shell):
+        """
+        Serve the recorded results of the command.
+
+        :raises: OSError with errno ENOENT, as for a missing tool, if the
+                 command has not been recorded
+        """
+        fixture = store.load(shell)
+        if fixture is None:
+            raise OSError(errno.ENOENT, "No recorded fixture for the command",
+                          ensure_text(shell.command[0]))
+        if latency:
+            time.sleep(latency * fixture["wall_time"])
+        store.restore(shell, fixture)
+    return run
@@ -0,0 +1,364 @@
+"""Tracing of the scraping phases as OpenTelemetry compatible spans.
+
+When a tracer is set, Scraper.scrape() and Scraper.detect_filetype() are
+traced as a span per file, with child spans for the detection, each
+detector and scraper, the merge and the UTF-8 check, and for each external
+command run with Shell. The spans carry attributes such as the file size,
+the MIME type, the class of the tool, and the arguments and the exit code
+of the commands. A Scraper given a W3C traceparent, e.g. that of the
+pipeline step scraping the file, continues that trace::
+
+    set_tracer(Tracer(JsonFileExporter("spans.jsonl")))
+    Scraper(filename, traceparent=request_traceparent).scrape()
+
+The finished spans of a file are passed to the exporter at once when the
+span of the file ends. An exporter is any object with a method
+export(spans) taking a list of Span instances. JsonFileExporter appends
+them to a file in the OTLP JSON format of the OpenTelemetry file exporter,
+one export request per line, which the OpenTelemetry Collector reads with
+its otlpjsonfile receiver. TRACE_FILE in file_scraper.config sets the tracer
+for all processes.
+
+Without a tracer, span() returns a shared span that records nothing, so the
+tracing costs next to nothing when it is not used. The attributes that are
+expensive to compute should be set only if span.recording is True.
+"""
+from __future__ import unicode_literals
+
+import binascii
+import json
+import os
+import re
+import threading
+import time
+
+import six
+from file_scraper.config import TRACE_FILE
+
+_LOCAL = threading.local()
+
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-"
+                          r"[0-9a-f]{2}$")
+
+# OTLP span kind and status codes
+_SPAN_KIND_INTERNAL = 1
+_STATUS_CODE_ERROR = 2
+
+
+def _random_id(size):
+    """
+    Return a random trace or span ID.
+
+    :size: Size of the ID in bytes
+    :returns: ID as hexadecimal text
+    """
+    return binascii.hexlify(os.urandom(size)).decode("ascii")
+
+
+def _now():
+    """Return the current time in nanoseconds since the epoch."""
+    return int(time.time() * 1e9)
+
+
+def _stack():
+    """Return the stack of the active spans of the current thread."""
+    if not hasattr(_LOCAL, "stack"):
+        _LOCAL.stack = []
+    return _LOCAL.stack
+
+
+def current_span():
+    """
+    Return the innermost active span of the current thread.
+
+    :returns: Span instance, or None if no span is active
+    """
+    stack = getattr(_LOCAL, "stack", None)
+    if stack:
+        return stack[-1]
+    return None
+
+
+class _NoSpan(object):
+    """Span recording nothing, used when tracing is disabled."""
+
+    recording = False
+
+    def __enter__(self):
+        """Return the span."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Do nothing."""
+
+    def set_attribute(self, key, value):
+        """Do nothing."""
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Span(object):
+    """Traced operation, active in the with block."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    recording = True
+
+    def __init__(self, tracer, name, trace_id, parent_id=None, root=None):
+        """
+        Initialize span.
+
+        :tracer: Tracer of the span
+        :name: Name of the operation
+        :trace_id: Trace ID as 32 hexadecimal digits
+        :parent_id: Span ID of the parent, or None for a root span
+        :root: Span of this process whose spans are exported together with
+               this span, or None if this is such a span
+        """
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _random_id(8)
+        self.parent_id = parent_id
+        self.root = root or self
+        self.attributes = {}
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+
+    def __enter__(self):
+        """Start the span and make it the current span of the thread."""
+        self.start_time = _now()
+        _stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """End the span, recording the exception if one was raised."""
+        self.end_time = _now()
+        _stack().remove(self)
+        if exc_type is not None:
+            self.error = "{}: {}".format(exc_type.__name__,
+                                         six.text_type(exc_value))
+        self.tracer.finish(self)
+
+    def set_attribute(self, key, value):
+        """
+        Set an attribute of the span.
+
+        :key: Name of the attribute, e.g. "file.size"
+        :value: Text, number, boolean or list of them. None is not recorded.
+        """
+        if value is not None:
+            self.attributes[key] = value
+
+    @property
+    def traceparent(self):
+        """W3C traceparent of the span, for continuing its trace elsewhere."""
+        return "00-{}-{}-01".format(self.trace_id, self.span_id)
+
+
+class _Activation(object):
+    """Context making a span the current span of a thread."""
+
+    def __init__(self, span):
+        """
+        Initialize activation.
+
+        :span: Span instance
+        """
+        self.span = span
+
+    def __enter__(self):
+        """Make the span the current span."""
+        _stack().append(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Restore the previous current span."""
+        _stack().pop()
+
+
+def activate(span):
+    """
+    Make a span the current span of the thread in a with block.
+
+    This continues a span in a worker thread, so that the spans of the
+    thread become its children.
+
+    :span: Span instance, or None to do nothing
+    :returns: Context manager
+    """
+    if span is None:
+        return _NO_SPAN
+    return _Activation(span)
+
+
+class Tracer(object):
+    """Creator of the spans, collecting them for the exporter."""
+
+    def __init__(self, exporter):
+        """
+        Initialize tracer.
+
+        :exporter: Object with method export(spans)
+        """
+        self.exporter = exporter
+        self._finished = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, traceparent=None):
+        """
+        Create a span, a child of the current span of the thread.
+
+        :name: Name of the operation
+        :traceparent: W3C traceparent of the parent of a span without a
+                      current span, or None to start a new trace
+        :returns: Span instance, started by the with statement
+        """
+        parent = current_span()
+        if parent is not None:
+            return Span(self, name, parent.trace_id, parent.span_id,
+                        parent.root)
+        match = _TRACEPARENT.match(traceparent or "")
+        if match:
+            return Span(self, name, match.group(1), match.group(2))
+        return Span(self, name, _random_id(16))
+
+    def finish(self, span):
+        """
+        Collect an ended span, exporting the spans of its root if it is one.
+
+        :span: Span instance
+        """
+        with self._lock:
+            spans = self._finished.setdefault(id(span.root), [])
+            spans.append(span)
+            if span.root is not span:
+                return
+            del self._finished[id(span)]
+        self.exporter.export(spans)
+
+
+def _otlp_value(value):
+    """
+    Convert an attribute value to OTLP JSON.
+
+    :value: Text, number, boolean or list of them
+    :returns: AnyValue as dict
+    """
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, six.integer_types):
+        return {"intValue": six.text_type(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item)
+                                          for item in value]}}
+    return {"stringValue": six.text_type(value)}
+
+
+def _otlp_attributes(attributes):
+    """
+    Convert attributes to OTLP JSON.
+
+    :attributes: dict of the attribute values by name
+    :returns: List of KeyValue dicts sorted by name
+    """
+    return [{"key": key, "value": _otlp_value(value)}
+            for (key, value) in sorted(attributes.items())]
+
+
+def otlp_span(span):
+    """
+    Convert a span to OTLP JSON.
+
+    :span: Ended Span instance
+    :returns: Span as dict
+    """
+    result = {"traceId": span.trace_id,
+              "spanId": span.span_id,
+              "name": span.name,
+              "kind": _SPAN_KIND_INTERNAL,
+              "startTimeUnixNano": six.text_type(span.start_time),
+              "endTimeUnixNano": six.text_type(span.end_time),
+              "attributes": _otlp_attributes(span.attributes),
+              "status": {}}
+    if span.parent_id is not None:
+        result["parentSpanId"] = span.parent_id
+    if span.error is not None:
+        result["status"] = {"code": _STATUS_CODE_ERROR,
+                            "message": span.error}
+    return result
+
+
+class JsonFileExporter(object):
+    """Exporter appending the spans to a file as OTLP JSON lines."""
+
+    def __init__(self, path, service_name="file-scraper"):
+        """
+        Initialize exporter.
+
+        :path: Path of the file
+        :service_name: Name of the service in the resource of the spans
+        """
+        self.path = path
+        self.resource = {"attributes": _otlp_attributes(
+            {"service.name": service_name})}
+
+    def export(self, spans):
+        """
+        Append the spans to the file as one line.
+
+        The line is written with one system call to a file opened for
+        appending, so the lines of several processes are not mixed.
+
+        :spans: List of ended Span instances
+        """
+        request = {"resourceSpans": [{
+            "resource": self.resource,
+            "scopeSpans": [{"scope": {"name": "file_scraper"},
+                            "spans": [otlp_span(span) for span in spans]}]
+        }]}
+        line = (json.dumps(request, sort_keys=True) + "\n").encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                     0o666)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+_TRACER = None
+
+
+def set_tracer(tracer):
+    """
+    Set the tracer of the process.
+
+    :tracer: Tracer instance, or None to disable tracing
+    :returns: The previous tracer
+    """
+    global _TRACER  # pylint: disable=global-statement
+    (previous, _TRACER) = (_TRACER, tracer)
+    return previous
+
+
+def span(name, traceparent=None):
+    """
+    Create a span with the tracer of the process.
+
+    :name: Name of the operation
+    :traceparent: W3C traceparent of the parent of a span without a current
+                  span, or None to start a new trace
+    :returns: Span to be used as a context manager, recording nothing if
+              tracing is disabled
+    """
+    if _TRACER is None:
+        return _NO_SPAN
+    return _TRACER.span(name, traceparent)
+
+
+if TRACE_FILE is not None:
+    set_tracer(Tracer(JsonFileExporter(TRACE_FILE)))
@@ -2,6 +2,7 @@
 from __future__ import unicode_literals
 
 import hashlib
+import importlib
 import string
 import sys
 import unicodedata
@@ -26,6 +27,37 @@ def is_metadata(func):
     return callable(func) and getattr(func, "is_metadata", False)
 
 
+class LazyModule(object):
+    """
+    Module that is imported when one of its attributes is first accessed.
+
+    Heavy third party libraries are imported through this so that importing
+    a scraper module does not load them before a file actually needs them.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, name, submodules=()):
+        """
+        Initialize the lazy module.
+
+        :name: Name of the module, e.g. "PIL"
+        :submodules: Submodules accessed as attributes of the module, which
+                     must be imported too, e.g. ["PIL.Image"]
+        """
+        self._name = name
+        self._submodules = submodules
+        self._module = None
+
+    def __getattr__(self, attr):
+        """Import the module if needed and return its attribute."""
+        if self._module is None:
+            module = importlib.import_module(self._name)
+            for submodule in self._submodules:
+                importlib.import_module(submodule)
+            self._module = module
+        return getattr(self._module, attr)
+
+
 def encode_path(filename):
     """Encode Unicode filenames."""
     if isinstance(filename, six.text_type):
@@ -1,16 +1,13 @@
 """PDF/A scraper."""
 from __future__ import unicode_literals
 
-try:
-    import lxml.etree as ET
-except ImportError:
-    pass
-
 from file_scraper.base import BaseScraper
 from file_scraper.shell import Shell
 from file_scraper.config import VERAPDF_PATH
 from file_scraper.verapdf.verapdf_model import VerapdfMeta
-from file_scraper.utils import encode_path
+from file_scraper.utils import encode_path, LazyModule
+
+ET = LazyModule("lxml.etree")
 
 
 class VerapdfScraper(BaseScraper):
@@ -21,7 +21,7 @@ class VnuScraper(BaseScraper):
             return
         shell = Shell([
             "java", "-jar", VNU_PATH, "--verbose",
-            self.filename])
+            self.filename], tool="vnu")
 
         if shell.stderr:
             self._errors.append(shell.stderr)
@@ -10,18 +10,53 @@ Checks well-formedess by testing if ImageMagick can open and read then
 file. More complete well-formedness test is required by specific validator
 tool.
 
+When the well-formedness is not checked, the file is only pinged: ImageMagick
+reads the image headers but does not decode the pixel data.
+
 """
 from __future__ import unicode_literals
 
+import threading
+
 import six
 
 from file_scraper.base import BaseScraper
+from file_scraper.config import WAND_RESOURCE_LIMITS
+from file_scraper.utils import LazyModule
 from file_scraper.wand.wand_model import WandImageMeta, WandTiffMeta
 
-try:
-    import wand.image
-except ImportError:
-    pass
+wand = LazyModule(  # pylint: disable=invalid-name
+    "wand", ["wand.image", "wand.resource"])
+
+# The ImageMagick resource limits are global to the process, so the limits of
+# the configuration are set once, when the first image is read
+_LIMITS_LOCK = threading.Lock()
+_LIMITS_CONFIGURED = False
+
+
+def _set_limits(limits):
+    """
+    Set ImageMagick resource limits.
+
+    :limits: dict of the limits by resource, None for the limits left as
+             they are
+    :returns: dict of the previous values of the changed limits
+    """
+    previous = {}
+    for resource, limit in six.iteritems(limits):
+        if limit is not None:
+            previous[resource] = wand.resource.limits[resource]
+            wand.resource.limits[resource] = limit
+    return previous
+
+
+def _configure_limits():
+    """Set the limits of WAND_RESOURCE_LIMITS, once in the process."""
+    global _LIMITS_CONFIGURED  # pylint: disable=global-statement
+    with _LIMITS_LOCK:
+        if not _LIMITS_CONFIGURED:
+            _set_limits(WAND_RESOURCE_LIMITS)
+            _LIMITS_CONFIGURED = True
 
 
 class WandScraper(BaseScraper):
@@ -29,6 +64,45 @@ class WandScraper(BaseScraper):
 
     _supported_metadata = [WandTiffMeta, WandImageMeta]
 
+    def __init__(self, filename, check_wellformed=True, params=None):
+        """
+        Initialize scraper.
+
+        In addition to the normal parameters, the following keys in params
+        are used:
+
+            * wand_ping: True to read only the image headers, False to decode
+              the full image. By default the image is decoded only when the
+              well-formedness is checked. The image is always decoded with
+              Wand versions without Image.ping().
+            * wand_limits: dict of ImageMagick resource limits overriding
+              WAND_RESOURCE_LIMITS from the configuration while the image
+              is read. The limits are global to the process, so they apply
+              to the images read in other threads at the same time too.
+
+        :filename: File path
+        :check_wellformed: True for the full well-formed check, False for just
+                           detection and metadata scraping
+        :params: Extra parameters needed for the scraper
+        """
+        super(WandScraper, self).__init__(filename, check_wellformed, params)
+        self._ping = self._params.get("wand_ping", not check_wellformed)
+        self._limits = self._params.get("wand_limits", {})
+
+    def _read_image(self):
+        """
+        Read the file with ImageMagick.
+
+        :returns: Wand Image object, pixel data decoded only if not pinged
+        """
+        if self._ping:
+            if hasattr(wand.image.Image, "ping"):
+                return wand.image.Image.ping(filename=self.filename)
+            # Image.ping() is missing from the older Wand versions, which
+            # can only decode the full image
+            self._ping = False
+        return wand.image.Image(filename=self.filename)
+
     def scrape_file(self):
         """
         Populate streams with supported metadata objects.
@@ -41,7 +115,12 @@ class WandScraper(BaseScraper):
                                   "Well-formed check not used.")
             return
         try:
-            wandresults = wand.image.Image(filename=self.filename)
+            _configure_limits()
+            previous = _set_limits(self._limits)
+            try:
+                wandresults = self._read_image()
+            finally:
+                _set_limits(previous)
         except Exception as e:  # pylint: disable=broad-except, invalid-name
             self._errors.append("Error in analyzing file")
             self._errors.append(six.text_type(e))
@@ -54,3 +133,6 @@ class WandScraper(BaseScraper):
                                                  self._given_version))
             self._check_supported(allow_unav_version=True)
             self._messages.append("The file was analyzed successfully.")
+            if self._ping:
+                self._messages.append("Only image headers were read, pixel "
+                                      "data was not decoded.")
@@ -9,13 +9,11 @@ import six
 
 from file_scraper.base import BaseScraper
 from file_scraper.shell import Shell
-from file_scraper.utils import ensure_text, decode_path, encode_path
+from file_scraper.utils import (ensure_text, decode_path, encode_path,
+                                LazyModule)
 from file_scraper.xmllint.xmllint_model import XmllintMeta
 
-try:
-    from lxml import etree
-except ImportError:
-    pass
+etree = LazyModule("lxml.etree")  # pylint: disable=invalid-name
 
 
 XSI = "http://www.w3.org/2001/XMLSchema-instance"
@@ -43,6 +41,7 @@ class XmllintScraper(BaseScraper):
 
     _supported_metadata = [XmllintMeta]
     _only_wellformed = True  # Only well-formed check
+    _selection_params = ["schematron"]
 
     def __init__(self, filename, check_wellformed=True, params=None):
         """
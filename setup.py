@@ -6,10 +6,14 @@ from version import get_version
 
 setup(
     name='file_scraper',
-    packages=find_packages(exclude=['tests', 'tests.*']),
+    packages=find_packages(exclude=['tests', 'tests.*', 'benchmarks',
+                                    'benchmarks.*']),
     include_package_data=True,
     version=get_version(),
     entry_points={'console_scripts': [
+        'file-scraper=file_scraper.cmdline:main',
+        'file-scraper-queue=file_scraper.distributed:main',
+        'file-scraper-server=file_scraper.server:main',
         'scraper=file_scraper.cmdline:main']},
     zip_safe=False,
     tests_require=['pytest'],
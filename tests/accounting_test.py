@@ -0,0 +1,162 @@
+"""
+Tests for resource usage accounting.
+
+This module tests that:
+    - A disabled measurement collects nothing.
+    - Wall time and CPU time of the measured block are collected.
+    - Subprocesses run with Shell are charged to the innermost measurement,
+      including their CPU time and peak memory, and the figures are added to
+      the parent measurement when the inner measurement ends.
+    - Subprocesses are not charged to anything when nothing is measured.
+    - PythonPeak measures the peak of the Python allocations in the block,
+      starting tracemalloc for the block only if it is not already tracing,
+      and keeping the traces of a tracing session started elsewhere.
+    - The peaks of overlapping PythonPeak blocks are not known, also when
+      the blocks run in different threads.
+"""
+from __future__ import unicode_literals
+
+import sys
+import threading
+
+import pytest
+
+from file_scraper.accounting import (PythonPeak, ResourceUsage,
+                                     current_measurement)
+from file_scraper.shell import Shell
+
+# Allowance for the other allocations freed during a measured block, which
+# lower the peak counted from the memory traced at the start of the block
+SLACK = 10**4
+
+BUSY_LOOP = [sys.executable, "-c",
+             "import time\nstart = time.time()\n"
+             "while time.time() - start < 0.2: pass"]
+
+
+def test_disabled():
+    """Test that a disabled measurement collects nothing."""
+    usage = ResourceUsage(enabled=False)
+    with usage:
+        assert current_measurement() is None
+        assert Shell(["true"]).returncode == 0
+    assert usage.as_dict() == {"wall_time": 0.0,
+                               "cpu_time": 0.0,
+                               "child_utime": 0.0,
+                               "child_stime": 0.0,
+                               "child_maxrss": 0,
+                               "bytes_read": None,
+                               "subprocesses": 0}
+
+
+def test_time():
+    """Test that the wall time and CPU time are collected."""
+    usage = ResourceUsage()
+    with usage:
+        sum(range(10**6))
+    assert usage.wall_time > 0
+    assert usage.cpu_time > 0
+    assert usage.subprocesses == 0
+
+
+def test_subprocesses():
+    """Test that subprocesses are charged to the innermost measurement."""
+    outer = ResourceUsage()
+    inner = ResourceUsage()
+    with outer:
+        assert Shell(["true"]).returncode == 0
+        with inner:
+            assert current_measurement() is inner
+            assert Shell(BUSY_LOOP).returncode == 0
+        assert current_measurement() is outer
+
+    assert inner.subprocesses == 1
+    assert inner.child_utime + inner.child_stime > 0.1
+    assert inner.child_maxrss > 0
+    assert inner.wall_time >= 0.2
+    assert inner.cpu_time < 0.1
+
+    assert outer.subprocesses == 2
+    assert outer.child_utime >= inner.child_utime
+    assert outer.child_maxrss >= inner.child_maxrss
+    assert outer.wall_time >= inner.wall_time
+
+
+def test_not_measured():
+    """Test that running a subprocess without measurement works."""
+    assert current_measurement() is None
+    assert Shell(["true"]).returncode == 0
+
+
+def test_python_peak():
+    """Test measuring the peak of the Python allocations."""
+    tracemalloc = pytest.importorskip("tracemalloc")
+    assert not tracemalloc.is_tracing()
+    kept = bytearray(10**6)
+    with PythonPeak() as first:
+        assert tracemalloc.is_tracing()
+        data = bytearray(20 * 10**6)
+        del data
+    assert not tracemalloc.is_tracing()
+    with PythonPeak() as second:
+        data = bytearray(5 * 10**6)
+        del data
+    assert 20 * 10**6 - SLACK <= first.peak < 21 * 10**6
+    assert 5 * 10**6 - SLACK <= second.peak < 6 * 10**6
+    del kept
+
+    tracemalloc.start()
+    try:
+        traced = bytearray(100)
+        with PythonPeak() as peak:
+            data = bytearray(10**6)
+            del data
+        assert tracemalloc.is_tracing()
+        # The traces of the session of the caller are kept
+        assert tracemalloc.get_object_traceback(traced) is not None
+    finally:
+        tracemalloc.stop()
+    if hasattr(tracemalloc, "reset_peak"):
+        assert 10**6 - SLACK <= peak.peak < 2 * 10**6
+    else:
+        assert peak.peak is None
+
+    with PythonPeak(enabled=False) as peak:
+        assert not tracemalloc.is_tracing()
+    assert peak.peak is None
+
+
+def test_python_peak_overlapping():
+    """Test that the peaks of overlapping blocks are not known."""
+    tracemalloc = pytest.importorskip("tracemalloc")
+    with PythonPeak() as outer:
+        with PythonPeak() as inner:
+            data = bytearray(10**6)
+            del data
+        assert tracemalloc.is_tracing()
+    assert not tracemalloc.is_tracing()
+    assert inner.peak is None
+    assert outer.peak is None
+
+    started = threading.Event()
+    finished = threading.Event()
+
+    def measure():
+        """Measure a block until the main thread has measured its block."""
+        with PythonPeak():
+            started.set()
+            finished.wait(10)
+
+    thread = threading.Thread(target=measure)
+    thread.start()
+    started.wait(10)
+    with PythonPeak() as peak:
+        data = bytearray(10**6)
+        del data
+    finished.set()
+    thread.join()
+    assert peak.peak is None
+
+    with PythonPeak() as peak:
+        pass
+    assert peak.peak is not None
@@ -0,0 +1,191 @@
+"""
+Tests for the asyncio API.
+
+This module tests that:
+    - AsyncShell runs commands as asyncio subprocesses, so that several
+      commands overlap in one event loop, and refuses to run synchronously.
+    - AsyncShell terminates commands exceeding their timeout and caps stderr
+      like Shell.
+    - Scraper.scrape_async() and scrape_many_async() give the same results as
+      Scraper.scrape().
+    - The Shell commands of the scrapers of several files overlap, limited
+      by the given concurrency, and they are counted in the resource usage.
+    - In fail-fast scraping, the scrapers not started before the file is
+      found not well-formed are skipped.
+    - The scheduler orders the scrapers, while the results are collected
+      in the canonical order.
+"""
+from __future__ import unicode_literals
+
+import asyncio
+import time
+
+import pytest
+
+import file_scraper.scraper
+from file_scraper.aio import AsyncShell, scrape_many_async
+from file_scraper.base import BaseScraper
+from file_scraper.exceptions import ShellTimeoutError
+from file_scraper.scheduler import CostScheduler
+from file_scraper.scraper import Scraper
+from file_scraper.shell import Shell
+
+FILES = ["tests/data/text_plain/valid__utf8.txt",
+         "tests/data/image_png/valid_1.2.png",
+         "tests/data/application_pdf/valid_1.4.pdf",
+         "tests/data/text_xml/valid_1.0_well_formed.xml",
+         "tests/data/image_gif/valid_1989a.gif",
+         "nonexistent"]
+
+
+def _run(awaitable):
+    """
+    Run an awaitable in a new event loop.
+
+    :awaitable: Coroutine or future
+    :returns: Result of the awaitable
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(awaitable)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def _results(scraper):
+    """
+    Return the results of a scraper.
+
+    :scraper: Scraper instance
+    :returns: Tuple of the result attributes
+    """
+    return (scraper.mimetype, scraper.version, scraper.streams,
+            scraper.well_formed, scraper.info)
+
+
+def test_async_shell():
+    """Test that AsyncShell commands overlap in the event loop."""
+    shells = [AsyncShell(["sh", "-c", "sleep 0.3; echo done"])
+              for _ in range(3)]
+
+    async def run_all():
+        """Run the commands together."""
+        await asyncio.gather(*[shell.run() for shell in shells])
+
+    start = time.time()
+    _run(run_all())
+    assert time.time() - start < 0.9
+    assert [shell.stdout for shell in shells] == ["done\n"] * 3
+    assert [shell.returncode for shell in shells] == [0] * 3
+
+    with pytest.raises(RuntimeError):
+        assert AsyncShell(["true"]).returncode
+
+
+def test_async_shell_timeout():
+    """Test that AsyncShell terminates commands that do not finish in time."""
+    shell = AsyncShell(["sleep", "10"], timeout=0.2)
+    start = time.time()
+    with pytest.raises(ShellTimeoutError):
+        _run(shell.run())
+    assert time.time() - start < 5
+    assert shell.timed_out
+
+    shell = _run(AsyncShell(["sh", "-c", "printf abcdef >&2"],
+                            stderr_limit=2).run())
+    assert shell.stderr == "ab\n[Output truncated: 4 bytes omitted]\n"
+
+
+@pytest.mark.parametrize("check_wellformed", [True, False])
+def test_scrape_async(check_wellformed):
+    """Test that asynchronous scraping gives the same results."""
+    expected = []
+    for filename in FILES:
+        scraper = Scraper(filename)
+        scraper.scrape(check_wellformed)
+        expected.append(_results(scraper))
+
+    scraper = Scraper(FILES[0])
+    _run(scraper.scrape_async(check_wellformed))
+    assert _results(scraper) == expected[0]
+
+    scrapers = _run(scrape_many_async(FILES, check_wellformed))
+    assert [_results(scraper) for scraper in scrapers] == expected
+
+
+class _SleepScraper(BaseScraper):
+    """Scraper running a slow command."""
+
+    def scrape_file(self):
+        """Run a slow command."""
+        self._messages.append(Shell(["sh", "-c", "sleep 0.3; echo slept"],
+                                    tool="sleep").stdout)
+
+
+@pytest.mark.parametrize(["concurrency", "min_time", "max_time"],
+                         [(1, 0.9, 60), (3, 0, 0.9)])
+def test_scrape_many_concurrency(monkeypatch, concurrency, min_time,
+                                 max_time):
+    """Test that the commands of scrapers overlap up to the concurrency."""
+    monkeypatch.setattr(file_scraper.scraper, "iter_scrapers",
+                        lambda **kwargs: [_SleepScraper])
+    start = time.time()
+    scrapers = _run(scrape_many_async(
+        ["tests/data/text_plain/valid__utf8.txt"] * 3,
+        concurrency=concurrency, resource_usage=True))
+    assert min_time <= time.time() - start < max_time
+
+    for scraper in scrapers:
+        info = [info for info in scraper.info.values()
+                if info["class"] == "_SleepScraper"][0]
+        assert info["messages"] == ["slept\n"]
+        assert info["resource_usage"]["subprocesses"] == 1
+        assert scraper.resource_usage["scraping"]["subprocesses"] == 1
+        assert scraper.resource_usage["total"]["subprocesses"] >= 1
+
+
+class _FailingScraper(BaseScraper):
+    """Scraper finding the file not well-formed."""
+
+    def scrape_file(self):
+        """Report an error."""
+        self._messages.append("Scraped.")
+        self._errors.append("Not well-formed.")
+
+
+def test_fail_fast(monkeypatch):
+    """Test that fail-fast scraping skips the remaining scrapers."""
+    monkeypatch.setattr(file_scraper.scraper, "iter_scrapers",
+                        lambda **kwargs: [_FailingScraper, _SleepScraper])
+    scrapers = _run(scrape_many_async(
+        ["tests/data/text_plain/valid__utf8.txt"] * 2, concurrency=1,
+        fail_fast=True))
+    for scraper in scrapers:
+        assert scraper.well_formed is False
+        info = [info for info in scraper.info.values()
+                if info["class"] == "_SleepScraper"][0]
+        assert info["messages"][0].startswith("Skipping scraper")
+
+
+def test_scheduler(monkeypatch):
+    """Test that the scheduler orders the scrapers of scrape_async()."""
+    monkeypatch.setattr(file_scraper.scraper, "iter_scrapers",
+                        lambda **kwargs: [_SleepScraper, _FailingScraper])
+    scheduler = CostScheduler(min_runs=1)
+    for (scraper_class, duration) in [(_SleepScraper, 1.0),
+                                      (_FailingScraper, 0.01)]:
+        scheduler.record("text/plain",
+                         scraper_class("tests/data/text_plain/"
+                                       "valid__utf8.txt"), duration)
+    scraper = Scraper("tests/data/text_plain/valid__utf8.txt",
+                      scheduler=scheduler)
+    _run(scraper.scrape_async(concurrency=1, fail_fast=True))
+    assert scraper.well_formed is False
+    infos = [info for info in scraper.info.values()
+             if info["class"] in ["_SleepScraper", "_FailingScraper"]]
+    assert [info["class"] for info in infos] == ["_SleepScraper",
+                                                 "_FailingScraper"]
+    assert infos[0]["messages"][0].startswith("Skipping scraper")
+    assert scheduler.stats("text/plain", "_FailingScraper")["runs"] == 2
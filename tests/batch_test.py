@@ -0,0 +1,160 @@
+"""
+Tests for scraping batches of files.
+
+This module tests that:
+    - iter_files() walks the directories in the order of the file names,
+      reports the file sizes and applies the include and exclude globs, also
+      to directories.
+    - read_manifest() lists the files of a manifest and applies the globs.
+    - scrape_one() returns the results of a Scraper and reports errors
+      instead of raising them.
+    - scrape_batch() gives the same results with worker processes as when
+      scraping in this process.
+    - the peak memory of the scrapers is reported in the memory usage mode,
+      and MemorySummary keeps the largest peaks by scraper and MIME type.
+"""
+from __future__ import unicode_literals
+
+import io
+import os
+
+import pytest
+
+from file_scraper.batch import (MemorySummary, iter_files, read_manifest,
+                                scrape_batch, scrape_one)
+from file_scraper.scraper import Scraper
+from file_scraper.utils import encode_path
+from file_scraper.xmllint.xmllint_scraper import XmllintScraper
+
+
+@pytest.fixture
+def tree(tmpdir):
+    """
+    Create a directory tree of files.
+
+    :returns: Path of the root directory
+    """
+    for (path, content) in [("b.txt", "bb"), ("a.txt", "a"),
+                            ("sub/c.pdf", "ccc"), ("sub/d.txt", "dddd"),
+                            ("skip/e.txt", "eeeee")]:
+        tmpdir.join(path).write(content, ensure=True)
+    return str(tmpdir)
+
+
+def _relative(files, root):
+    """
+    Return the paths of the files relative to the root directory.
+
+    :files: List of tuples (path, size)
+    :root: Root directory
+    :returns: List of tuples (relative path, size)
+    """
+    return [(os.path.relpath(path, root), size) for (path, size) in files]
+
+
+def test_iter_files(tree):
+    """Test walking directories with globs."""
+    assert _relative(iter_files([tree]), tree) == [
+        ("a.txt", 1), ("b.txt", 2), ("skip/e.txt", 5), ("sub/c.pdf", 3),
+        ("sub/d.txt", 4)]
+    assert _relative(iter_files([tree], include=["*.txt"],
+                                exclude=["skip", "b.*"]), tree) == [
+                                    ("a.txt", 1), ("sub/d.txt", 4)]
+    assert _relative(iter_files([tree], include=["*/sub/*"]), tree) == [
+        ("sub/c.pdf", 3), ("sub/d.txt", 4)]
+    assert _relative(iter_files([os.path.join(tree, "a.txt"),
+                                 os.path.join(tree, "missing")]), tree) == [
+                                     ("a.txt", 1), ("missing", 0)]
+
+
+def test_read_manifest(tree):
+    """Test listing the files of a manifest."""
+    manifest = os.path.join(tree, "manifest.txt")
+    with io.open(manifest, "wt", encoding="utf-8") as outfile:
+        outfile.write("{0}/sub/c.pdf\n\n{0}/a.txt\n".format(tree))
+    assert _relative(read_manifest(manifest), tree) == [
+        ("sub/c.pdf", 3), ("a.txt", 1)]
+    assert _relative(read_manifest(manifest, exclude=["*.pdf"]), tree) == [
+        ("a.txt", 1)]
+
+
+def test_scrape_one(monkeypatch):
+    """Test scraping a file into a result dict."""
+    filename = "tests/data/text_plain/valid__utf8.txt"
+    scraper = Scraper(filename)
+    scraper.scrape(False)
+    assert scrape_one(filename, check_wellformed=False) == {
+        "filename": filename, "mimetype": scraper.mimetype,
+        "version": scraper.version, "well_formed": scraper.well_formed,
+        "streams": scraper.streams, "info": scraper.info}
+
+    result = scrape_one(filename, detect_only=True, resource_usage=True)
+    assert result["streams"] is None
+    assert result["mimetype"] == "text/plain"
+    assert "total" in result["resource_usage"]
+
+    def fail(self):
+        """Fail the detection."""
+        raise ValueError("Broken.")
+
+    monkeypatch.setattr(Scraper, "detect_filetype", fail)
+    assert scrape_one(filename, detect_only=True) == {
+        "filename": filename, "error": "ValueError: Broken."}
+
+
+def test_scrape_batch():
+    """Test that worker processes give the same results."""
+    filenames = ["tests/data/text_plain/valid__utf8.txt",
+                 "tests/data/text_plain/valid__ascii.txt",
+                 "tests/data/image_png/valid_1.2.png",
+                 "nonexistent"]
+    results = [list(scrape_batch(filenames, processes, detect_only=True))
+               for processes in [1, 2]]
+    assert [result["filename"] for result in results[0]] == filenames
+    assert sorted(results[0], key=lambda result: result["filename"]) == \
+        sorted(results[1], key=lambda result: result["filename"])
+
+
+def test_memory_usage():
+    """Test reporting the peak memory of the scrapers."""
+    filename = "tests/data/image_png/valid_1.2.png"
+    result = scrape_one(filename, check_wellformed=False, memory_usage=True)
+    scrapers = [info for info in result["info"].values()
+                if info["class"].endswith("Scraper")]
+    assert scrapers
+    for info in scrapers:
+        assert "resource_usage" not in info
+        assert set(info["memory_usage"]) == {"python_peak", "child_maxrss"}
+        assert info["memory_usage"]["python_peak"] >= 0
+    assert "memory_usage" not in scrape_one(
+        filename, check_wellformed=False)["info"][0]
+
+    # The peak memory of the tools run by the scraper
+    filename = "tests/data/text_xml/valid_1.0_dtd.xml"
+    scraper = Scraper(filename, memory_usage=True)
+    usage = scraper._run_scraper(XmllintScraper(
+        encode_path(filename), True, {"mimetype_guess": "text/xml"}))
+    assert usage.memory["child_maxrss"] > 0
+
+
+def test_memory_summary():
+    """Test keeping the largest peaks of the scrapers."""
+    def result(mimetype, python_peak, child_maxrss):
+        """Return the result of a file scraped with WandScraper."""
+        return {"mimetype": mimetype,
+                "info": {0: {"class": "MagicDetector"},
+                         1: {"class": "WandScraper", "memory_usage": {
+                             "python_peak": python_peak,
+                             "child_maxrss": child_maxrss}}}}
+
+    summary = MemorySummary()
+    summary.add(result("image/tiff", 100, 4 * 1024**2))
+    summary.add(result("image/tiff", 200, 1024))
+    summary.add(result("image/png", None, 10))
+    summary.add({"filename": "broken", "error": "ValueError: Broken."})
+    assert summary.largest() == [
+        ("WandScraper", "image/tiff",
+         {"files": 2, "python_peak": 200, "child_maxrss": 4 * 1024**2}),
+        ("WandScraper", "image/png",
+         {"files": 1, "python_peak": None, "child_maxrss": 10})]
+    assert len(summary.largest(1)) == 1
@@ -0,0 +1,111 @@
+"""
+Tests for the micro-benchmarks of the detectors and scrapers.
+
+This module tests that:
+    - the valid files of the test data are listed by MIME type.
+    - the latency and the peak memory of the detectors and scrapers are
+      measured for each tool and MIME type.
+    - the tools whose executables are missing are skipped, also when the
+      scraper catches the error.
+    - the medians growing more than the threshold are reported as
+      regressions, and the exit status tells whether there were any.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+
+import pytest
+
+from benchmarks.micro import (SkipTool, benchmark, compare, corpus, main,
+                              percentile, run_tool)
+from file_scraper.base import BaseScraper
+from file_scraper.shell import Shell
+
+
+class MissingToolScraper(BaseScraper):
+    """Scraper running a tool that does not exist."""
+
+    def scrape_file(self):
+        """Run the tool, catching the error like many scrapers do."""
+        try:
+            Shell(["file-scraper-nonexistent-tool"]).returncode
+        except OSError as error:
+            self._errors.append(str(error))
+
+
+def test_corpus():
+    """Test listing the files of the test data."""
+    files = corpus(mimetypes=["text/plain", "image/png"])
+    assert ("text/plain", "tests/data/text_plain/valid__utf8.txt") in files
+    assert {mimetype for (mimetype, _) in files} == {"text/plain",
+                                                      "image/png"}
+    assert all("/valid_" in filename for (_, filename) in files)
+
+
+def test_benchmark():
+    """Test measuring the tools."""
+    results = benchmark(corpus(mimetypes=["text/plain"])[:2], repeats=3)
+    result = results["results"]["MagicDetector text/plain"]
+    assert result["runs"] == 6
+    assert 0 < result["median"] <= result["p95"]
+    assert result["child_maxrss"] == 0
+    assert "MagicScraper text/plain" in results["results"]
+
+
+def test_missing_tool():
+    """Test that a missing tool is skipped."""
+    def create():
+        """Create the scraper."""
+        return MissingToolScraper(b"tests/data/text_plain/valid__utf8.txt",
+                                  True)
+    with pytest.raises(SkipTool) as error:
+        run_tool(create)
+    assert str(error.value) == \
+        "Missing tool: file-scraper-nonexistent-tool"
+
+
+@pytest.mark.parametrize(["samples", "median", "p95"], [
+    ([1], 1, 1),
+    ([3, 1, 2], 2, 3),
+    (list(range(1, 101)), 50, 95),
+])
+def test_percentile(samples, median, p95):
+    """Test the nearest-rank percentiles."""
+    assert percentile(samples, 0.5) == median
+    assert percentile(samples, 0.95) == p95
+
+
+def test_compare(tmpdir, capsys):
+    """Test finding regressions."""
+    baseline = {"results": {"A x/y": {"median": 0.020},
+                            "B x/y": {"median": 0.010},
+                            "C x/y": {"median": 0.0001},
+                            "D x/y": {"median": 0.010}}}
+    results = {"results": {"A x/y": {"median": 0.023},
+                           "B x/y": {"median": 0.0130},
+                           "C x/y": {"median": 0.0010},
+                           "E x/y": {"median": 1.0}}}
+    assert compare(results, baseline) == [("B x/y", 0.010, 0.013)]
+    assert compare(results, baseline, threshold=0.1) == [
+        ("A x/y", 0.020, 0.023), ("B x/y", 0.010, 0.013)]
+
+    path = str(tmpdir.join("baseline.json"))
+    output = str(tmpdir.join("results.json"))
+    args = ["-m", "text/plain", "-n", "1", "-o", output]
+    assert main(args) == 0
+    with io.open(output, "rt", encoding="utf-8") as infile:
+        saved = json.load(infile)
+    assert "MagicDetector text/plain" in capsys.readouterr().out
+
+    for result in saved["results"].values():
+        result["median"] = 100.0
+    with io.open(path, "wt", encoding="utf-8") as outfile:
+        outfile.write(json.dumps(saved))
+    assert main(args + ["-b", path]) == 0
+
+    saved["results"]["FidoDetector text/plain"]["median"] = 0.0
+    with io.open(path, "wt", encoding="utf-8") as outfile:
+        outfile.write(json.dumps(saved))
+    assert main(args + ["-b", path]) == 1
+    assert "Regression: FidoDetector text/plain" in capsys.readouterr().out
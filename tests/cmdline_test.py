@@ -0,0 +1,148 @@
+"""
+Tests for the command line tool.
+
+This module tests that:
+    - the results of the given files, directories and manifests are written
+      as JSON Lines to the output file, and the throughput is reported.
+    - detection-only and full scraping are chosen with the arguments.
+    - the exit status tells whether scraping failed for some files.
+    - a run with a journal is resumed by scraping only the files not yet
+      recorded, and the results of the interrupted run are removed.
+    - Progress reports the throughput and the estimated time left.
+    - the largest peak memory of the scrapers is reported with
+      --memory-usage.
+    - invalid arguments are rejected.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+
+import pytest
+
+from file_scraper.cmdline import Progress, main
+from file_scraper.scraper import Scraper
+
+
+def _results(path):
+    """
+    Read the results written by the tool.
+
+    :path: Output file path
+    :returns: dict of the results by file name
+    """
+    with io.open(path, "rt", encoding="utf-8") as infile:
+        results = [json.loads(line) for line in infile]
+    return {result["filename"]: result for result in results}
+
+
+@pytest.mark.parametrize("processes", ["1", "2"])
+def test_main(tmpdir, capsys, processes):
+    """Test scraping files and writing the results."""
+    output = str(tmpdir.join("results.jsonl"))
+    manifest = str(tmpdir.join("manifest.txt"))
+    tmpdir.join("manifest.txt").write("tests/data/image_png/valid_1.2.png\n")
+    assert main(["-j", processes, "--detect-only", "-o", output,
+                 "-m", manifest, "-i", "valid__*", "-i", "*.png",
+                 "tests/data/text_plain"]) == 0
+    results = _results(output)
+    assert sorted(results) == [
+        "tests/data/image_png/valid_1.2.png",
+        "tests/data/text_plain/valid__ascii.txt",
+        "tests/data/text_plain/valid__iso8859.txt",
+        "tests/data/text_plain/valid__utf8.txt"]
+    result = results["tests/data/text_plain/valid__utf8.txt"]
+    assert result["mimetype"] == "text/plain"
+    assert result["streams"] is None
+    assert "Scraped 4 files" in capsys.readouterr().err
+
+    assert main(["-q", "--no-wellformed", "-o", output,
+                 "tests/data/text_plain/valid__utf8.txt"]) == 0
+    result = _results(output)["tests/data/text_plain/valid__utf8.txt"]
+    assert result["streams"]["0"]["mimetype"] == "text/plain"
+    assert result["well_formed"] is None
+    assert capsys.readouterr().err == ""
+
+
+def test_main_error(tmpdir, monkeypatch):
+    """Test that failed scraping is reported in the exit status."""
+    def fail(self):
+        """Fail the detection."""
+        raise ValueError("Broken.")
+
+    monkeypatch.setattr(Scraper, "detect_filetype", fail)
+    output = str(tmpdir.join("results.jsonl"))
+    assert main(["-q", "--detect-only", "-o", output,
+                 "tests/data/text_plain/valid__utf8.txt"]) == 1
+    assert _results(output) == {
+        "tests/data/text_plain/valid__utf8.txt": {
+            "filename": "tests/data/text_plain/valid__utf8.txt",
+            "error": "ValueError: Broken."}}
+
+
+def test_resume(tmpdir):
+    """Test that a resumed run scrapes only the remaining files."""
+    output = str(tmpdir.join("results.jsonl"))
+    journal = str(tmpdir.join("journal"))
+    filenames = ["tests/data/text_plain/valid__utf8.txt",
+                 "tests/data/text_plain/valid__ascii.txt",
+                 "tests/data/image_png/valid_1.2.png"]
+    assert main(["-q", "--detect-only", "-o", output, "--journal", journal,
+                 filenames[0]]) == 0
+
+    # Results and journal entries of an interrupted run are removed
+    with io.open(output, "ab") as outfile:
+        outfile.write(b'{"filename": "interrupted"}\n{"file')
+    with io.open(journal, "ab") as outfile:
+        outfile.write(b"0123456789abcdef\n")
+
+    manifest = tmpdir.join("manifest.txt")
+    manifest.write("\n".join(filenames))
+    assert main(["-q", "--detect-only", "-o", output, "--journal", journal,
+                 "-m", str(manifest)]) == 0
+    with io.open(output, "rt", encoding="utf-8") as infile:
+        lines = infile.read().splitlines()
+    assert sorted(json.loads(line)["filename"] for line in lines) == \
+        sorted(filenames)
+
+    assert main(["-q", "--detect-only", "-o", output, "--journal", journal,
+                 "-m", str(manifest)]) == 0
+    assert len(_results(output)) == 3
+
+    tmpdir.join("results.jsonl").write("")
+    assert main(["-q", "--detect-only", "-o", output, "--journal", journal,
+                 "-m", str(manifest)]) == 2
+
+
+def test_memory_usage(tmpdir, capsys):
+    """Test reporting the peak memory of the scrapers."""
+    output = str(tmpdir.join("results.jsonl"))
+    assert main(["--no-wellformed", "--memory-usage", "-o", output,
+                 "tests/data/image_png/valid_1.2.png"]) == 0
+    result = _results(output)["tests/data/image_png/valid_1.2.png"]
+    assert "memory_usage" in result["info"]["3"]
+    err = capsys.readouterr().err
+    assert "Peak memory by scraper and MIME type:" in err
+    assert "  PilScraper image/png: Python " in err
+
+
+def test_progress():
+    """Test reporting the progress."""
+    stream = io.StringIO()
+    progress = Progress(4, 4000, stream, interval=0)
+    progress.update(1000)
+    assert stream.getvalue().startswith("\r1/4 files, 1.0 kB/4.0 kB, ")
+    assert ", ETA " in stream.getvalue()
+    for _ in range(3):
+        progress.update(1000)
+    assert "\r4/4 files, 4.0 kB/4.0 kB, " in stream.getvalue()
+    assert progress.summary()["files"] == 4
+    assert progress.summary()["bytes"] == 4000
+
+
+@pytest.mark.parametrize("argv", [[], ["-j", "0", "tests"],
+                                  ["--journal", "journal", "tests"]])
+def test_invalid_arguments(argv):
+    """Test that invalid arguments are rejected."""
+    with pytest.raises(SystemExit):
+        main(argv)
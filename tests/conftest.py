@@ -5,8 +5,12 @@ import tempfile
 import shutil
 
 import pytest
+import six
 from tests.common import partial_message_included
 
+# The asyncio API requires Python 3
+collect_ignore = ["aio_test.py"] if six.PY2 else []  # pylint: disable=invalid-name
+
 
 @pytest.yield_fixture(scope="function")
 def testpath():
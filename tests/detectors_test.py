@@ -7,12 +7,15 @@ This module tests that:
       certain mimetypes and MagicDetector returns certain mimetypes.
     - VerapdfDetector detects PDF/A MIME types and versions but no others.
     - VerapdfDetector results are important for PDF/A files.
+    - FidoDetector results are final for the PRONOM codes of PRONOM_DICT and
+      PredefinedDetector results when both MIME type and version are given.
 """
 from __future__ import unicode_literals
 
 import pytest
 
-from file_scraper.detectors import FidoDetector, MagicDetector, VerapdfDetector
+from file_scraper.detectors import (FidoDetector, MagicDetector,
+                                    PredefinedDetector, VerapdfDetector)
 from tests.common import get_files
 
 CHANGE_FIDO = {
@@ -137,3 +140,23 @@ def test_important_other(detector_class, mimetype):
         assert detector.get_important() == {}
     else:
         assert detector.get_important() == {"mimetype": mimetype}
+
+
+@pytest.mark.parametrize(
+    ["detector", "final"],
+    [
+        (FidoDetector("tests/data/image_x-dpx/valid_2.0.dpx"), True),
+        (FidoDetector("tests/data/image_x-dpx/valid_2.0.dpx",
+                      mimetype="image/x-dpx"), False),
+        (FidoDetector("tests/data/image_png/valid_1.2.png"), False),
+        (MagicDetector("tests/data/image_x-dpx/valid_2.0.dpx"), False),
+        (PredefinedDetector("tests/data/image_png/valid_1.2.png",
+                            mimetype="image/png", version="1.2"), True),
+        (PredefinedDetector("tests/data/image_png/valid_1.2.png",
+                            mimetype="image/png"), False),
+    ]
+)
+def test_is_final(detector, final):
+    """Test that only confident detection results are final."""
+    detector.detect()
+    assert detector.is_final() == final
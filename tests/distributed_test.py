@@ -0,0 +1,198 @@
+"""
+Tests for the distributed batch mode.
+
+This module tests that:
+    - files are added to the work queue only once, and each file is claimed
+      by only one worker at a time.
+    - the files whose lease has expired are delivered again, at most the
+      maximum number of times, and the leases of a worker can be renewed.
+    - the leases of a claim are renewed while a file takes longer than the
+      lease, so the file is not delivered again.
+    - several worker processes scrape all the files of the queue once, and
+      the merged result shards contain one result per file.
+    - a partially written last line of a result shard is removed when the
+      shard is opened, and skipped when the shards are merged.
+    - the command line tool adds files, scrapes them, reports the state of
+      the queue and merges the shards.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+import multiprocessing
+import sqlite3
+import time
+
+import file_scraper.distributed
+from file_scraper.distributed import (WorkQueue, _open_shard, main,
+                                      merge_results, work)
+
+FILES = ["tests/data/text_plain/valid__ascii.txt",
+         "tests/data/text_plain/valid__iso8859.txt",
+         "tests/data/text_plain/valid__utf8.txt"]
+
+
+def _results(path):
+    """
+    Read results written as JSON Lines.
+
+    :path: File path
+    :returns: List of the file names of the results
+    """
+    with io.open(path, "rt", encoding="utf-8") as infile:
+        return [json.loads(line)["filename"] for line in infile]
+
+
+def test_queue(tmpdir):
+    """Test adding, claiming and completing files."""
+    path = str(tmpdir.join("queue.db"))
+    first = WorkQueue(path, node="first")
+    second = WorkQueue(path, node="second")
+    assert first.add((name, 1) for name in FILES) == 3
+    assert second.add([(FILES[0], 1)]) == 0
+
+    assert first.claim(2) == FILES[:2]
+    assert second.claim(2) == FILES[2:]
+    assert first.claim() == []
+    assert first.status() == {"pending": 0, "claimed": 3, "done": 0,
+                              "failed": 0}
+
+    first.complete(FILES[:2])
+    assert second.status() == {"pending": 0, "claimed": 1, "done": 2,
+                               "failed": 0}
+    first.close()
+    second.close()
+
+
+def test_lease_expiry(tmpdir):
+    """Test delivering files again when their leases expire."""
+    path = str(tmpdir.join("queue.db"))
+    first = WorkQueue(path, node="first", lease=0.2, max_attempts=2)
+    second = WorkQueue(path, node="second", lease=0.2, max_attempts=2)
+    first.add([(FILES[0], 1), (FILES[1], 1)])
+    assert first.claim(2) == FILES[:2]
+
+    time.sleep(0.1)
+    first.renew([FILES[1]])
+    time.sleep(0.15)
+    assert second.claim(2) == FILES[:1]
+    assert second.status() == {"pending": 0, "claimed": 2, "done": 0,
+                               "failed": 0}
+
+    time.sleep(0.25)
+    assert second.claim(2) == FILES[1:2]
+    time.sleep(0.25)
+    assert second.claim(2) == []
+    assert second.status() == {"pending": 0, "claimed": 0, "done": 0,
+                               "failed": 2}
+    first.close()
+    second.close()
+
+
+def test_slow_file(tmpdir, monkeypatch):
+    """Test that a file taking longer than its lease is not re-claimed."""
+    path = str(tmpdir.join("queue.db"))
+    worker = WorkQueue(path, node="worker", lease=0.3, max_attempts=2)
+    other = WorkQueue(path, node="other", lease=0.3, max_attempts=2)
+    worker.add([(FILES[0], 1)])
+    claims = []
+
+    def slow_batch(paths, processes, **kwargs):
+        """Scrape the files slower than their leases."""
+        # pylint: disable=unused-argument
+        for filename in paths:
+            for _ in range(5):
+                time.sleep(0.2)
+                claims.append(other.claim())
+            yield {"filename": filename}
+
+    monkeypatch.setattr(file_scraper.distributed, "scrape_batch",
+                        slow_batch)
+    assert work(worker, str(tmpdir.join("shard.jsonl")),
+                poll_interval=0.01) == (1, 0)
+    assert claims == [[]] * 5
+    assert other.status() == {"pending": 0, "claimed": 0, "done": 1,
+                              "failed": 0}
+    connection = sqlite3.connect(path)
+    assert connection.execute(
+        "SELECT attempts, node FROM items").fetchall() == [(1, "worker")]
+    connection.close()
+    worker.close()
+    other.close()
+
+
+def _work(args):
+    """
+    Run a worker in a separate process.
+
+    :args: Tuple of the queue path and the shard path
+    """
+    (path, output) = args
+    work_queue = WorkQueue(path)
+    try:
+        return work(work_queue, output, claim_files=1, poll_interval=0.01,
+                    detect_only=True)
+    finally:
+        work_queue.close()
+
+
+def test_work(tmpdir):
+    """Test scraping the files of the queue in several workers."""
+    path = str(tmpdir.join("queue.db"))
+    work_queue = WorkQueue(path)
+    work_queue.add((name, 1) for name in FILES * 2)
+    work_queue.close()
+
+    shards = [str(tmpdir.join("shard{}.jsonl".format(index)))
+              for index in range(3)]
+    pool = multiprocessing.Pool(3)
+    try:
+        counts = pool.map(_work, [(path, shard) for shard in shards])
+    finally:
+        pool.close()
+        pool.join()
+    assert sum(files for (files, _) in counts) == 3
+    assert sum(errors for (_, errors) in counts) == 0
+
+    output = str(tmpdir.join("results.jsonl"))
+    with io.open(output, "wb") as outfile:
+        assert merge_results(shards, outfile) == 3
+    assert sorted(_results(output)) == FILES
+    assert WorkQueue(path).status()["done"] == 3
+
+
+def test_partial_shard(tmpdir):
+    """Test removing and skipping partially written results."""
+    shard = tmpdir.join("shard.jsonl")
+    shard.write_binary(b'{"filename": "a"}\n{"filename": "b"}\n{"filen')
+    with _open_shard(str(shard)) as outfile:
+        outfile.write(b'{"filename": "c"}\n')
+    assert shard.read_binary() == \
+        b'{"filename": "a"}\n{"filename": "b"}\n{"filename": "c"}\n'
+
+    other = tmpdir.join("other.jsonl")
+    other.write_binary(b'{"filename": "b", "error": "x"}\n{"filename": "d"}'
+                       b'\n{"file')
+    output = io.BytesIO()
+    assert merge_results([str(shard), str(other)], output) == 4
+    assert output.getvalue() == (b'{"filename": "a"}\n{"filename": "b"}\n'
+                                 b'{"filename": "c"}\n{"filename": "d"}\n')
+
+
+def test_main(tmpdir, capsys):
+    """Test the command line tool."""
+    path = str(tmpdir.join("queue.db"))
+    shard = str(tmpdir.join("shard.jsonl"))
+    output = str(tmpdir.join("results.jsonl"))
+    assert main(["add", path, "tests/data/text_plain", "-i", "valid__*"]) == 0
+    assert "Added 3 files" in capsys.readouterr().err
+    assert main(["status", path]) == 0
+    assert json.loads(capsys.readouterr().out)["pending"] == 3
+
+    assert main(["work", path, "--no-wellformed", "-o", shard]) == 0
+    assert "Scraped 3 files" in capsys.readouterr().err
+    assert main(["merge", "-o", output, shard]) == 0
+    assert sorted(_results(output)) == FILES
+
+    assert main(["status", path]) == 0
+    assert json.loads(capsys.readouterr().out)["done"] == 3
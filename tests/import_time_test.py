@@ -0,0 +1,81 @@
+"""
+Tests for the import time of the main scraper.
+
+This module tests that:
+    - Importing file_scraper.scraper does not import the heavy third party
+      libraries used by the scrapers and detectors.
+    - Importing file_scraper.scraper stays within the import time budget, as
+      measured by python -X importtime.
+    - The library needed by a detector is imported when the detector is run,
+      and other heavy libraries are not.
+"""
+from __future__ import unicode_literals
+
+import subprocess
+import sys
+
+import pytest
+
+# Budget for the cumulative import time of file_scraper.scraper
+IMPORT_TIME_BUDGET = 0.5  # seconds
+
+HEAVY_MODULES = ["PIL", "wand", "ffmpeg", "pymediainfo", "fido", "magic",
+                 "lxml"]
+
+
+def _run_python(code, *options):
+    """
+    Run Python code in a new interpreter.
+
+    :code: Python code to run
+    :options: Extra interpreter options
+    :returns: Tuple of stdout and stderr as text
+    """
+    proc = subprocess.Popen(
+        [sys.executable] + list(options) + ["-c", code],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (stdout, stderr) = proc.communicate()
+    assert proc.returncode == 0, stderr
+    return stdout.decode("utf-8"), stderr.decode("utf-8")
+
+
+def _imported_modules(code):
+    """
+    Return the heavy modules imported by running the given code.
+
+    :code: Python code to run
+    :returns: List of imported module names
+    """
+    stdout, _ = _run_python(
+        code + "\nimport sys\n"
+        "print(' '.join(name for name in %r if name in sys.modules))" %
+        HEAVY_MODULES)
+    return stdout.split()
+
+
+def test_no_heavy_imports():
+    """Test that importing the scraper does not load heavy libraries."""
+    assert _imported_modules("import file_scraper.scraper") == []
+
+
+def test_heavy_imports_when_needed():
+    """Test that running a detector loads only the library it needs."""
+    modules = _imported_modules(
+        "import file_scraper.scraper\n"
+        "from file_scraper.detectors import MagicDetector\n"
+        "MagicDetector('tests/data/image_png/valid_1.2.png').detect()")
+    assert modules == ["magic"]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason="-X importtime requires Python 3.7")
+def test_import_time():
+    """Test that importing the scraper stays within the time budget."""
+    _, stderr = _run_python("import file_scraper.scraper", "-X", "importtime")
+    for line in stderr.splitlines():
+        # Lines look like "import time:  self [us] | cumulative | name"
+        fields = [field.strip() for field in line.split("|")]
+        if fields[-1] == "file_scraper.scraper":
+            assert int(fields[1]) / 1e6 < IMPORT_TIME_BUDGET
+            return
+    pytest.fail("Import time of file_scraper.scraper was not reported.")
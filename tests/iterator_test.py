@@ -4,12 +4,26 @@ Test for file_scraper.scrapers.
 This module tests that:
     - iter_scrapers(mimetype, version) returns the correct scrapers.
     - iter_detectors() returns the correct detectors.
+    - iter_scrapers() returns the same scrapers in the same order as calling
+      is_supported() of all scrapers would, also when parameters affecting
+      the selection are given.
+    - is_supported() results are memoized in iter_scrapers(), keeping only a
+      limited number of the most recently used selections.
+    - the candidate index is built once when threads select scrapers at the
+      same time.
 """
 from __future__ import unicode_literals
 
+import threading
+import time
+
 import pytest
 
-from file_scraper.iterator import iter_scrapers, iter_detectors
+from file_scraper import iterator
+from file_scraper.dummy.dummy_scraper import ScraperNotFound
+from file_scraper.iterator import (iter_scrapers, iter_detectors,
+                                   scraper_classes)
+from file_scraper.pngcheck.pngcheck_scraper import PngcheckScraper
 
 
 @pytest.mark.parametrize(
@@ -96,3 +110,96 @@ def test_iter_detectors():
     assert set([x.__name__ for x in detectors]) == set(["FidoDetector",
                                                         "MagicDetector",
                                                         "PredefinedDetector"])
+
+
+def _iter_all_scrapers(mimetype, version, check_wellformed, params):
+    """Select scrapers by calling is_supported() of every scraper."""
+    scrapers = [scraper for scraper in scraper_classes()
+                if scraper.is_supported(mimetype, version, check_wellformed,
+                                        params)]
+    return scrapers or [ScraperNotFound]
+
+
+@pytest.mark.parametrize("check_wellformed", [True, False])
+@pytest.mark.parametrize("params", [None, {}, {"schematron": "test.sch"}])
+def test_iter_scrapers_order(check_wellformed, params):
+    """
+    Test that the indexed scraper selection gives the same scrapers in the
+    same order as calling is_supported() of every scraper.
+    """
+    mimetypes = set(["test/unknown", None])
+    versions = set([None, "foo"])
+    for scraper in scraper_classes():
+        # pylint: disable=protected-access
+        for md_class in scraper._supported_metadata:
+            for mimetype, md_versions in \
+                    md_class.supported_mimetypes().items():
+                mimetypes.add(mimetype)
+                versions.update(md_versions)
+
+    for mimetype in mimetypes:
+        for version in versions:
+            expected = _iter_all_scrapers(mimetype, version,
+                                          check_wellformed, params)
+            for _ in range(2):
+                assert list(iter_scrapers(mimetype, version,
+                                          check_wellformed,
+                                          params)) == expected
+
+
+def test_iter_scrapers_memoized(monkeypatch):
+    """Test that is_supported() is not called again for the same file type."""
+    calls = []
+
+    def _is_supported(cls, *args):
+        """Record the call."""
+        calls.append(cls)
+        return True
+
+    monkeypatch.setattr(PngcheckScraper, "is_supported",
+                        classmethod(_is_supported))
+    monkeypatch.setattr(iterator, "_DISPATCH", {})
+
+    assert PngcheckScraper in list(iter_scrapers("image/png", "1.2"))
+    assert PngcheckScraper in list(iter_scrapers("image/png", "1.2"))
+    assert calls == [PngcheckScraper]
+
+
+def test_iter_scrapers_memo_limit(monkeypatch):
+    """Test that only the most recently used selections are memoized."""
+    monkeypatch.setattr(iterator, "_DISPATCH", {})
+    monkeypatch.setattr(iterator, "_SUPPORTED_LIMIT", 2)
+    for version in ["1.0", "1.1", "1.0", "1.2"]:
+        list(iter_scrapers("image/png", version))
+    assert list(iterator._DISPATCH["supported"]) == [
+        ("image/png", "1.0", True, ()), ("image/png", "1.2", True, ())]
+
+
+def test_iter_scrapers_threads(monkeypatch):
+    """Test building the candidate index in several threads at once."""
+    builds = []
+    build_dispatch = iterator._build_dispatch
+
+    def _build_dispatch():
+        """Build the index slowly, so that the other threads wait for it."""
+        builds.append(None)
+        time.sleep(0.2)
+        return build_dispatch()
+
+    monkeypatch.setattr(iterator, "_DISPATCH", {})
+    monkeypatch.setattr(iterator, "_build_dispatch", _build_dispatch)
+    results = []
+
+    def select():
+        """Select the scrapers of a PNG file."""
+        results.append(list(iter_scrapers("image/png", "1.2")))
+
+    threads = [threading.Thread(target=select) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
+    assert len(results) == 8
+    assert all(result == results[0] for result in results)
+    assert PngcheckScraper in results[0]
@@ -0,0 +1,101 @@
+"""
+Tests for the progress journal of the batch runs.
+
+This module tests that:
+    - the recorded files are found in a loaded journal, unless they have
+      changed after they were recorded.
+    - the files are written to the journal in batches, after the output has
+      been flushed, and each batch ends with a checkpoint of the output size.
+    - an interrupted batch and a partially written line are removed from the
+      journal on load, and the output size of the last checkpoint is
+      returned.
+    - a journal of many files is loaded fast.
+"""
+from __future__ import unicode_literals
+
+import io
+import os
+import time
+
+from file_scraper.journal import Journal, file_key
+
+
+def _files(tmpdir, count):
+    """
+    Create files.
+
+    :tmpdir: Directory of the files
+    :count: Number of the files
+    :returns: List of the file paths
+    """
+    paths = []
+    for index in range(count):
+        path = tmpdir.join("file{}.txt".format(index))
+        path.write("content {}".format(index))
+        paths.append(str(path))
+    return paths
+
+
+def test_journal(tmpdir):
+    """Test recording and loading files."""
+    paths = _files(tmpdir, 3)
+    journal_path = str(tmpdir.join("journal"))
+    journal = Journal(journal_path, sync_files=2)
+    assert journal.load() == 0
+    with io.open(str(tmpdir.join("output")), "wb") as output:
+        journal.open(output)
+        for path in paths:
+            output.write(b"result\n")
+            journal.done(path)
+            if path == paths[0]:
+                assert os.path.getsize(journal_path) == 0
+        journal.close()
+
+    with io.open(journal_path, "rb") as infile:
+        assert infile.read() == b"".join(
+            [file_key(paths[0]), b"\n", file_key(paths[1]), b"\n#14\n",
+             file_key(paths[2]), b"\n#21\n"])
+
+    journal = Journal(journal_path)
+    assert journal.load() == 21
+    assert len(journal) == 3
+    assert all(journal.is_done(path) for path in paths)
+    assert not journal.is_done(str(tmpdir.join("other")))
+
+    tmpdir.join("file1.txt").write("changed content")
+    assert not journal.is_done(paths[1])
+
+
+def test_interrupted(tmpdir):
+    """Test that the unfinished batch is removed on load."""
+    paths = _files(tmpdir, 2)
+    journal_path = str(tmpdir.join("journal"))
+    with io.open(journal_path, "wb") as outfile:
+        outfile.write(b"".join([file_key(paths[0]), b"\n#10\n",
+                                file_key(paths[1]), b"\n#2"]))
+    journal = Journal(journal_path)
+    assert journal.load() == 10
+    assert len(journal) == 1
+    assert journal.is_done(paths[0])
+    assert not journal.is_done(paths[1])
+    assert os.path.getsize(journal_path) == 21
+
+    with io.open(journal_path, "wb") as outfile:
+        outfile.write(b"0123")
+    assert Journal(journal_path).load() == 0
+    assert os.path.getsize(journal_path) == 0
+
+
+def test_load_time(tmpdir):
+    """Test that a journal of many files is loaded fast."""
+    journal_path = str(tmpdir.join("journal"))
+    with io.open(journal_path, "wb") as outfile:
+        for batch in range(200):
+            outfile.write(b"".join(b"%016x\n" % (batch * 1000 + index)
+                                   for index in range(1000)))
+            outfile.write(b"#%d\n" % batch)
+    start = time.time()
+    journal = Journal(journal_path)
+    assert journal.load() == 199
+    assert len(journal) == 200000
+    assert time.time() - start < 5
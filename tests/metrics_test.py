@@ -0,0 +1,187 @@
+"""
+Tests for the metrics of the Prometheus textfile collector.
+
+This module tests that:
+    - the counters and histograms are rendered in the Prometheus text
+      format, with cumulative buckets and escaped label values.
+    - the metrics recorded elsewhere are merged.
+    - the metrics file is written atomically and periodically.
+    - nothing is recorded without a registry.
+    - the external commands and their timeouts are counted.
+    - the files and tools of the batch runs are counted, also in the worker
+      processes, and written by the command line tool.
+"""
+from __future__ import unicode_literals
+
+import io
+import os
+import stat
+import time
+
+import pytest
+
+from file_scraper import metrics
+from file_scraper.batch import scrape_batch
+from file_scraper.cmdline import main
+from file_scraper.metrics import Registry, TextfileWriter, write_textfile
+from file_scraper.shell import Shell
+
+FILES = ["tests/data/text_plain/valid__ascii.txt",
+         "tests/data/text_plain/valid__utf8.txt"]
+
+
+def test_render():
+    """Test rendering the counters and the histograms."""
+    registry = Registry([0.1, 1.0])
+    registry.inc("file_scraper_files_total",
+                 {"mimetype": "text/plain", "outcome": "well_formed"})
+    registry.inc("file_scraper_files_total",
+                 {"mimetype": "text/plain", "outcome": "well_formed"}, 2)
+    registry.inc("file_scraper_subprocesses_total", {"tool": "a\"b\\c\n"})
+    for value in [0.05, 0.5, 5.0]:
+        registry.observe("file_scraper_tool_duration_seconds", value,
+                         {"tool": "MagicScraper"})
+
+    assert registry.render() == (
+        "# HELP file_scraper_files_total Files scraped by MIME type and "
+        "outcome.\n"
+        "# TYPE file_scraper_files_total counter\n"
+        "file_scraper_files_total{mimetype=\"text/plain\","
+        "outcome=\"well_formed\"} 3\n"
+        "# HELP file_scraper_subprocesses_total External commands run by "
+        "tool.\n"
+        "# TYPE file_scraper_subprocesses_total counter\n"
+        "file_scraper_subprocesses_total{tool=\"a\\\"b\\\\c\\n\"} 1\n"
+        "# HELP file_scraper_tool_duration_seconds Time spent in a detector "
+        "or a scraper.\n"
+        "# TYPE file_scraper_tool_duration_seconds histogram\n"
+        "file_scraper_tool_duration_seconds_bucket{tool=\"MagicScraper\","
+        "le=\"+Inf\"} 3\n"
+        "file_scraper_tool_duration_seconds_bucket{tool=\"MagicScraper\","
+        "le=\"0.1\"} 1\n"
+        "file_scraper_tool_duration_seconds_bucket{tool=\"MagicScraper\","
+        "le=\"1.0\"} 2\n"
+        "file_scraper_tool_duration_seconds_count{tool=\"MagicScraper\"} "
+        "3\n"
+        "file_scraper_tool_duration_seconds_sum{tool=\"MagicScraper\"} "
+        "5.55\n")
+
+
+def test_merge():
+    """Test merging the metrics of another registry."""
+    registry = Registry()
+    other = Registry()
+    registry.inc("file_scraper_subprocesses_total", {"tool": "file"})
+    registry.observe("file_scraper_file_duration_seconds", 0.2)
+    other.inc("file_scraper_subprocesses_total", {"tool": "file"}, 2)
+    other.inc("file_scraper_subprocesses_total", {"tool": "xmllint"})
+    other.observe("file_scraper_file_duration_seconds", 20.0)
+
+    registry.merge(other.take())
+    assert other.render() == ""
+    assert registry.value("file_scraper_subprocesses_total",
+                          {"tool": "file"}) == 3
+    assert registry.value("file_scraper_subprocesses_total",
+                          {"tool": "xmllint"}) == 1
+    assert registry.value("file_scraper_file_duration_seconds") == 2
+    assert "file_scraper_file_duration_seconds_sum 20.2\n" in \
+        registry.render()
+
+
+def test_write_textfile(tmpdir):
+    """Test that the metrics file is replaced and readable to all."""
+    path = str(tmpdir.join("scraper.prom"))
+    registry = Registry()
+    registry.inc("file_scraper_server_rejected_total")
+    write_textfile(registry, path)
+    registry.inc("file_scraper_server_rejected_total")
+    write_textfile(registry, path)
+
+    with io.open(path, "rt", encoding="utf-8") as infile:
+        assert "file_scraper_server_rejected_total 2\n" in infile.read()
+    assert os.listdir(str(tmpdir)) == ["scraper.prom"]
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+
+def test_textfile_writer(tmpdir):
+    """Test writing the metrics periodically and at the stop."""
+    path = str(tmpdir.join("scraper.prom"))
+    registry = Registry()
+    writer = TextfileWriter(registry, path, 0.05)
+    writer.start()
+    registry.inc("file_scraper_server_rejected_total")
+    deadline = time.time() + 10
+    while not os.path.exists(path) and time.time() < deadline:
+        time.sleep(0.01)
+    assert os.path.exists(path)
+
+    registry.inc("file_scraper_server_rejected_total")
+    writer.stop()
+    with io.open(path, "rt", encoding="utf-8") as infile:
+        assert "file_scraper_server_rejected_total 2\n" in infile.read()
+
+
+def test_disabled():
+    """Test that nothing is recorded without a registry."""
+    previous = metrics.set_registry(None)
+    try:
+        metrics.inc("file_scraper_subprocesses_total")
+        metrics.observe("file_scraper_file_duration_seconds", 1.0)
+        metrics.record_file(FILES[0], {"error": "Failed"}, 1.0)
+        with metrics.timed("file_scraper_tool_duration_seconds"):
+            pass
+    finally:
+        metrics.set_registry(previous)
+
+
+def test_shell():
+    """Test counting the external commands and their timeouts."""
+    registry = Registry()
+    previous = metrics.set_registry(registry)
+    try:
+        assert Shell(["true"]).returncode == 0
+        shell = Shell(["sleep", "10"], timeout=0.1)
+        with pytest.raises(Exception):
+            shell.returncode
+    finally:
+        metrics.set_registry(previous)
+    assert registry.value("file_scraper_subprocesses_total",
+                          {"tool": "true"}) == 1
+    assert registry.value("file_scraper_subprocesses_total",
+                          {"tool": "sleep"}) == 1
+    assert registry.value("file_scraper_subprocess_timeouts_total",
+                          {"tool": "sleep"}) == 1
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_scrape_batch(processes):
+    """Test the metrics of the files and the tools of a batch run."""
+    registry = Registry()
+    results = list(scrape_batch(FILES + ["tests/data/missing.txt"],
+                                processes, registry=registry,
+                                check_wellformed=False))
+    assert len(results) == 3
+
+    assert registry.value("file_scraper_files_total", {
+        "mimetype": "text/plain", "outcome": "unknown"}) == 2
+    assert registry.value("file_scraper_file_bytes_total", {
+        "mimetype": "text/plain"}) == sum(os.path.getsize(filename)
+                                          for filename in FILES)
+    assert registry.value("file_scraper_file_duration_seconds") == 3
+    assert registry.value("file_scraper_tool_duration_seconds",
+                          {"tool": "MagicDetector"}) == 2
+    assert registry.value("file_scraper_files_total", {
+        "mimetype": "(:unav)", "outcome": "not_well_formed"}) == 1
+
+
+def test_main(tmpdir):
+    """Test writing the metrics of a run of the command line tool."""
+    output = str(tmpdir.join("results.jsonl"))
+    path = str(tmpdir.join("scraper.prom"))
+    assert main(["-q", "--no-wellformed", "-o", output, "--metrics-file",
+                 path] + FILES) == 0
+    with io.open(path, "rt", encoding="utf-8") as infile:
+        text = infile.read()
+    assert "file_scraper_files_total{mimetype=\"text/plain\"," \
+        "outcome=\"unknown\"} 2\n" in text
+    assert "# TYPE file_scraper_tool_duration_seconds histogram\n" in text
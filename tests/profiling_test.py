@@ -0,0 +1,105 @@
+"""
+Tests for the profiling of single files.
+
+This module tests that:
+    - the profiles of the runs taking at least the threshold, and of the
+      sampled runs, are written as .pstats files, also when the run fails.
+    - no profile is written for fast runs or when profiling is disabled.
+    - the profiles are named by the file name, a digest of the path and the
+      operation.
+    - Scraper, scrape_one() and the command line tool write the profiles
+      and report their paths.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import pstats
+import time
+
+import pytest
+
+from file_scraper.batch import scrape_one
+from file_scraper.cmdline import main
+from file_scraper.profiling import FileProfiler, profile_path
+from file_scraper.scraper import Scraper
+
+FILENAME = "tests/data/text_plain/valid__ascii.txt"
+
+
+@pytest.mark.parametrize(["threshold", "sample", "written"], [
+    (0.0, 0.0, True),
+    (60.0, 0.0, False),
+    (None, 1.0, True),
+    (None, 0.0, False),
+])
+def test_profile(tmpdir, threshold, sample, written):
+    """Test writing the profiles of the slow and the sampled runs."""
+    profiler = FileProfiler(FILENAME, str(tmpdir), threshold, sample)
+    with profiler.profile("scrape"):
+        time.sleep(0.01)
+    if written:
+        assert profiler.path == profile_path(str(tmpdir), FILENAME, "scrape")
+        stats = pstats.Stats(profiler.path)
+        assert stats.total_calls > 0
+    else:
+        assert profiler.path is None
+        assert os.listdir(str(tmpdir)) == []
+
+
+def test_profile_error(tmpdir):
+    """Test that the profile of a failed run is written."""
+    profiler = FileProfiler(FILENAME, str(tmpdir.join("new")), 0.0)
+    with pytest.raises(ValueError):
+        with profiler.profile("detect"):
+            raise ValueError("Failed")
+    assert os.path.isfile(profiler.path)
+
+
+def test_disabled(tmpdir):
+    """Test that nothing is profiled without a directory."""
+    profiler = FileProfiler(FILENAME, None, 0.0, 1.0)
+    with profiler.profile("scrape"):
+        pass
+    assert profiler.path is None
+
+
+def test_profile_path():
+    """Test the names of the profiles."""
+    path = profile_path("profiles", "data/a b/file?.pdf", "scrape")
+    assert os.path.dirname(path) == "profiles"
+    (name, digest, operation, extension) = os.path.basename(path).rsplit(
+        ".", 3)
+    assert name == "file_.pdf"
+    assert len(digest) == 12
+    assert (operation, extension) == ("scrape", "pstats")
+    assert profile_path("profiles", "other/file?.pdf", "scrape") != path
+
+
+@pytest.mark.parametrize("detect_only", [True, False])
+def test_scraper(tmpdir, detect_only):
+    """Test profiling a Scraper and reporting the profile in the results."""
+    scraper = Scraper(FILENAME, profile_dir=str(tmpdir), profile_threshold=0)
+    if detect_only:
+        scraper.detect_filetype()
+    else:
+        scraper.scrape(False)
+    assert scraper.profile.endswith(
+        ".detect.pstats" if detect_only else ".scrape.pstats")
+
+    result = scrape_one(FILENAME, detect_only, False,
+                        profile_dir=str(tmpdir), profile_threshold=0)
+    assert result["profile"] == scraper.profile
+    assert "profile" not in scrape_one(FILENAME, detect_only, False)
+
+
+def test_main(tmpdir):
+    """Test profiling the sampled files with the command line tool."""
+    output = str(tmpdir.join("results.jsonl"))
+    profiles = str(tmpdir.join("profiles"))
+    assert main(["-q", "--detect-only", "-o", output, "--profile-dir",
+                 profiles, "--profile-sample", "1", FILENAME]) == 0
+    with io.open(output, "rt", encoding="utf-8") as infile:
+        result = json.loads(infile.readline())
+    assert os.listdir(profiles) == [os.path.basename(result["profile"])]
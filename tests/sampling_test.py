@@ -0,0 +1,111 @@
+"""
+Tests for the sampling profiler.
+
+This module tests that:
+    - the stacks of the main thread are sampled while the sampler runs,
+      and the previous SIGPROF handler is restored when it stops.
+    - the stacks sampled in the detectors and scrapers are tagged with the
+      class of the tool and the MIME type of the file.
+    - the counts are taken, merged and written in the collapsed stack
+      format, and the hot spots are counted inclusively and by own samples.
+    - the stacks of the batch runs are sampled also in the worker processes,
+      and written by the command line tool.
+"""
+from __future__ import unicode_literals
+
+import io
+import re
+import signal
+import time
+
+import six
+
+from file_scraper.batch import scrape_batch
+from file_scraper.cmdline import main
+from file_scraper.sampling import NO_TOOL, StackSampler
+from file_scraper.scraper import Scraper
+
+FILES = ["tests/data/text_plain/valid__ascii.txt",
+         "tests/data/text_plain/valid__utf8.txt",
+         "tests/data/image_png/valid_1.2.png"]
+
+
+def _busy(seconds):
+    """Use CPU time for the given number of seconds."""
+    start = time.time()
+    while time.time() - start < seconds:
+        sum(range(1000))
+
+
+def test_sample():
+    """Test sampling the stacks of a busy function."""
+    sampler = StackSampler(0.001)
+    with sampler:
+        _busy(0.3)
+    assert signal.getsignal(signal.SIGPROF) == signal.SIG_DFL
+    assert sampler.total > 0
+    stacks = [stack for stack in sampler.counts
+              if "tests/sampling_test.py:_busy" in stack]
+    assert stacks
+    assert all(stack[0] == NO_TOOL for stack in stacks)
+
+    total = sampler.total
+    _busy(0.05)
+    assert sampler.total == total
+
+
+def test_tags():
+    """Test tagging the stacks by the detector or scraper."""
+    sampler = StackSampler(0.001)
+    with sampler:
+        for _ in range(3):
+            Scraper(FILES[0]).scrape(False)
+    tags = set(stack[0] for stack in sampler.counts)
+    tags.discard(NO_TOOL)
+    assert tags
+    for tag in tags:
+        assert re.match(r"^\w+(Detector|Scraper|Exists) \S+$", tag)
+
+
+def test_counts():
+    """Test taking, merging, writing and summarizing the counts."""
+    sampler = StackSampler()
+    sampler.merge({(NO_TOOL, "a.py:main", "b.py:work"): 3,
+                   ("Tool text/plain", "a.py:main"): 1})
+    sampler.merge({(NO_TOOL, "a.py:main", "b.py:work"): 2})
+    assert sampler.total == 6
+    assert sampler.hot_spots() == [("a.py:main", 6, 1),
+                                   ("b.py:work", 5, 5)]
+    assert sampler.hot_spots(1) == [("a.py:main", 6, 1)]
+
+    stream = six.StringIO()
+    sampler.write(stream)
+    assert stream.getvalue() == ("(no tool);a.py:main;b.py:work 5\n"
+                                 "Tool text/plain;a.py:main 1\n")
+    assert len(sampler.take()) == 2
+    assert sampler.total == 0
+
+
+def test_batch():
+    """Test merging the stacks sampled in the worker processes."""
+    sampler = StackSampler(0.001)
+    results = list(scrape_batch(FILES * 2, 2, sampler=sampler,
+                                check_wellformed=False))
+    assert len(results) == 6
+    assert signal.getsignal(signal.SIGPROF) == signal.SIG_DFL
+    functions = set(function for stack in sampler.counts
+                    for function in stack)
+    assert "file_scraper/batch.py:scrape_one" in functions
+
+
+def test_main(tmpdir):
+    """Test writing the sampled stacks of a run."""
+    output = str(tmpdir.join("results.jsonl"))
+    stacks = str(tmpdir.join("run.collapsed"))
+    assert main(["-q", "--no-wellformed", "-o", output, "--sample-stacks",
+                 stacks] + FILES) == 0
+    with io.open(stacks, "rt", encoding="utf-8") as infile:
+        lines = infile.read().splitlines()
+    assert lines
+    for line in lines:
+        assert re.match(r"^[^;]+(;[^;]+)* \d+$", line)
@@ -0,0 +1,104 @@
+"""
+Tests for the synthetic inputs and the scaling benchmarks.
+
+This module tests that:
+    - the synthetic files are generated deterministically, reused when they
+      exist, and identified and scraped as their kind.
+    - the time and the memory of the scrapers and of the merge phase are
+      measured for each scale, and the missing tools are skipped.
+    - the exponents of the power laws are fitted to the measurements.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import io
+import json
+
+import pytest
+
+from benchmarks.scaling import benchmark, exponent, main, measure
+from benchmarks.synthetic import KINDS, generate
+from file_scraper.detectors import MagicDetector
+from file_scraper.utils import encode_path
+
+
+def _digest(path, directory):
+    """
+    Return the SHA-1 digest of a file.
+
+    :path: File path
+    :directory: Directory of the file, replaced in the schema locations of
+                the XML files
+    :returns: Hexadecimal digest
+    """
+    with io.open(path, "rb") as infile:
+        data = infile.read().replace(directory.encode("utf-8"), b"")
+    return hashlib.sha1(data).hexdigest()
+
+
+@pytest.mark.parametrize("kind", sorted(KINDS))
+def test_generate(tmpdir, kind):
+    """Test generating the synthetic files."""
+    (first, second) = (str(tmpdir.join("first")), str(tmpdir.join("second")))
+    path = generate(kind, 20, first)
+    assert path.endswith("{}-20.{}".format(kind, KINDS[kind][0]))
+    assert _digest(path, first) == _digest(generate(kind, 20, second), second)
+    assert generate(kind, 20, first) == path
+    assert generate(kind, 40, first) != path
+
+    detector = MagicDetector(encode_path(path))
+    detector.detect()
+    if kind != "csv":
+        # CSV files are detected as text/plain by older magic databases
+        assert detector.mimetype == KINDS[kind][1]
+
+
+@pytest.mark.parametrize(["name", "kind", "key", "value"], [
+    ("CsvScraper", "csv", "well_formed", True),
+    ("LxmlScraper", "xml-wide", "well_formed", True),
+    ("PilScraper", "tiff", "well_formed", True),
+    ("merge", "gif", "streams", 20),
+])
+def test_measure(tmpdir, name, kind, key, value):
+    """Test measuring a tool on a synthetic file."""
+    path = generate(kind, 20, str(tmpdir))
+    result = measure(name, path, KINDS[kind][1])
+    assert result[key] == value
+    assert result["wall_time"] > 0
+    assert result["peak_rss"] >= 0
+
+
+def test_benchmark(tmpdir):
+    """Test measuring the tools at several scales."""
+    results = benchmark(["csv"], str(tmpdir), scales=[100, 1000])
+    measurements = results["CsvScraper csv"]["measurements"]
+    assert [item["scale"] for item in measurements] == [100, 1000]
+    assert measurements[0]["size"] < measurements[1]["size"]
+    assert "time_exponent" in results["CsvScraper csv"]
+
+
+def test_missing_tool(tmpdir, monkeypatch):
+    """Test that the tools whose executables are missing are skipped."""
+    monkeypatch.setenv("PATH", str(tmpdir))
+    output = str(tmpdir.join("results.json"))
+    assert main(["-k", "warc", "-s", "10", "-d", str(tmpdir),
+                 "-o", output]) == 0
+    with io.open(output, "rt", encoding="utf-8") as infile:
+        results = json.load(infile)
+    assert results["WarcWarctoolsScraper warc"]["skipped"].startswith(
+        "Missing tool")
+
+
+@pytest.mark.parametrize(["sizes", "values", "result"], [
+    ([10, 100, 1000], [1, 10, 100], 1.0),
+    ([10, 100, 1000], [1, 100, 10000], 2.0),
+    ([10, 100], [5, 5], 0.0),
+    ([10], [5], None),
+    ([10, 100], [0, 0], None),
+])
+def test_exponent(sizes, values, result):
+    """Test fitting power laws."""
+    if result is None:
+        assert exponent(sizes, values) is None
+    else:
+        assert exponent(sizes, values) == pytest.approx(result)
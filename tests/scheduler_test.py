@@ -0,0 +1,193 @@
+"""
+Tests for the cost-based scheduling of the scrapers.
+
+This module tests that:
+    - scrapers with too few recorded runs come first in the canonical order,
+      and the others are ordered by mean duration divided by failure rate.
+    - the recorded runs are saved to the history file, and schedulers sharing
+      the file do not lose each other's runs.
+    - a corrupted history file is ignored.
+    - the runs are saved after a number of files, and at the end of a batch
+      run also by the worker processes.
+    - with a scheduler, the scrapers run in the learned order, but the
+      scraping results are the same as without a scheduler.
+    - in fail-fast scraping, a cheap scraper that often finds files not
+      well-formed is run first and the slow scrapers are skipped.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+import time
+
+import pytest
+
+import file_scraper.scheduler
+import file_scraper.scraper
+from file_scraper.base import BaseScraper
+from file_scraper.batch import scrape_batch
+from file_scraper.scheduler import CostScheduler
+from file_scraper.scraper import Scraper
+from tests.common import partial_message_included
+
+FILENAME = "tests/data/text_plain/valid__utf8.txt"
+RUNS = []
+
+
+class _SlowScraper(BaseScraper):
+    """Slow scraper finding the file well-formed."""
+
+    def scrape_file(self):
+        """Sleep for a while."""
+        RUNS.append(self.__class__.__name__)
+        time.sleep(0.1)
+        self._messages.append("Slept.")
+
+
+class _FastScraper(BaseScraper):
+    """Fast scraper finding the file not well-formed."""
+
+    def scrape_file(self):
+        """Report an error."""
+        RUNS.append(self.__class__.__name__)
+        self._messages.append("Scraped.")
+        self._errors.append("Not well-formed.")
+
+
+def _record(scheduler, scraper_class, runs, duration, failures=0):
+    """
+    Record runs of a scraper for text/plain files.
+
+    :scheduler: CostScheduler instance
+    :scraper_class: Scraper class
+    :runs: Number of runs to record
+    :duration: Duration of each run
+    :failures: Number of the runs finding the file not well-formed
+    """
+    for index in range(runs):
+        scraper = scraper_class(FILENAME)
+        scraper._messages = ["Scraped."]
+        scraper._errors = ["Failed."] if index < failures else []
+        scheduler.record("text/plain", scraper, duration)
+
+
+@pytest.fixture(autouse=True)
+def fake_scrapers(monkeypatch):
+    """Use the fake scrapers in the canonical order slow, fast."""
+    monkeypatch.setattr(file_scraper.scraper, "iter_scrapers",
+                        lambda **kwargs: [_SlowScraper, _FastScraper])
+    del RUNS[:]
+
+
+def test_order():
+    """Test the order of the scrapers with and without history."""
+    scheduler = CostScheduler(min_runs=3)
+    scrapers = [_SlowScraper(FILENAME), _FastScraper(FILENAME)]
+    assert scheduler.order("text/plain", scrapers) == scrapers
+    assert scheduler.cost("text/plain", "_FastScraper") is None
+
+    _record(scheduler, _FastScraper, 3, 0.1, failures=2)
+    _record(scheduler, _SlowScraper, 2, 1.0)
+    assert scheduler.order("text/plain", scrapers) == scrapers
+    assert scheduler.cost("text/plain", "_FastScraper") == \
+        pytest.approx(0.1 / 0.6)
+
+    _record(scheduler, _SlowScraper, 1, 1.0)
+    assert scheduler.order("text/plain", scrapers) == scrapers[::-1]
+    assert scheduler.order("image/png", scrapers) == scrapers
+
+
+def test_save(tmpdir):
+    """Test that the history is saved and merged into the file."""
+    path = str(tmpdir.join("cache", "history.json"))
+    first = CostScheduler(path)
+    second = CostScheduler(path)
+    _record(first, _FastScraper, 2, 0.5, failures=1)
+    _record(second, _FastScraper, 1, 1.0)
+    first.save()
+    second.save()
+    first.save()
+
+    expected = {"runs": 3, "time": 2.0, "failures": 1}
+    assert second.stats("text/plain", "_FastScraper") == expected
+    assert CostScheduler(path).stats("text/plain", "_FastScraper") == \
+        expected
+    with io.open(path, "rt", encoding="utf-8") as infile:
+        assert json.load(infile) == {
+            "mimetypes": {"text/plain": {"_FastScraper": expected}}}
+
+    with io.open(path, "wt", encoding="utf-8") as outfile:
+        outfile.write("{")
+    assert CostScheduler(path).stats("text/plain", "_FastScraper")[
+        "runs"] == 0
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_scraper_scheduler(concurrency):
+    """Test that the scheduler changes the order but not the results."""
+    scraper = Scraper(FILENAME, concurrency=concurrency)
+    scraper.scrape()
+    expected = (scraper.streams, scraper.well_formed, scraper.info)
+
+    scheduler = CostScheduler(min_runs=1)
+    _record(scheduler, _SlowScraper, 1, 1.0)
+    _record(scheduler, _FastScraper, 1, 0.01, failures=1)
+    del RUNS[:]
+    scraper = Scraper(FILENAME, concurrency=concurrency,
+                      scheduler=scheduler)
+    scraper.scrape()
+    assert (scraper.streams, scraper.well_formed, scraper.info) == expected
+    if concurrency == 1:
+        assert RUNS == ["_FastScraper", "_SlowScraper"]
+    assert scheduler.stats("text/plain", "_FastScraper") == {
+        "runs": 2, "time": pytest.approx(0.01, abs=0.5), "failures": 2}
+    assert scheduler.stats("text/plain", "_SlowScraper")["runs"] == 2
+
+
+def test_scheduler_fail_fast():
+    """Test that the cheap failing scraper makes the others skipped."""
+    scheduler = CostScheduler(min_runs=1)
+    _record(scheduler, _SlowScraper, 1, 1.0)
+    _record(scheduler, _FastScraper, 1, 0.01, failures=1)
+    scraper = Scraper(FILENAME, scheduler=scheduler)
+    scraper.scrape(fail_fast=True)
+
+    assert RUNS == ["_FastScraper"]
+    assert scraper.well_formed is False
+    infos = [info for info in scraper.info.values()
+             if info["class"] in ["_SlowScraper", "_FastScraper"]]
+    assert [info["class"] for info in infos] == ["_SlowScraper",
+                                                 "_FastScraper"]
+    assert partial_message_included("Skipping scraper",
+                                    infos[0]["messages"])
+
+
+def _saved_runs(path, name):
+    """Return the number of runs of a scraper in a history file."""
+    return CostScheduler(path).stats("text/plain", name)["runs"]
+
+
+def test_checkpoint(tmpdir):
+    """Test that the runs are saved after a number of files."""
+    path = str(tmpdir.join("history.json"))
+    scheduler = CostScheduler(path, save_files=3, save_interval=3600)
+    for _ in range(2):
+        Scraper(FILENAME, scheduler=scheduler).scrape()
+    assert _saved_runs(path, "_FastScraper") == 0
+    assert scheduler.stats("text/plain", "_FastScraper")["runs"] == 2
+
+    Scraper(FILENAME, scheduler=scheduler).scrape()
+    assert _saved_runs(path, "_FastScraper") == 3
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_scrape_batch(tmpdir, monkeypatch, processes):
+    """Test that the runs of a batch are saved when the batch ends."""
+    path = str(tmpdir.join("history.json"))
+    monkeypatch.setattr(file_scraper.scheduler, "SCHEDULER_HISTORY_PATH",
+                        path)
+    monkeypatch.setattr(file_scraper.scheduler, "_DEFAULT_SCHEDULERS", {})
+    results = list(scrape_batch([FILENAME] * 3, processes, scheduler=True))
+    assert len(results) == 3
+    assert _saved_runs(path, "_SlowScraper") == 3
+    assert _saved_runs(path, "_FastScraper") == 3
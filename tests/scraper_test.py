@@ -15,12 +15,30 @@ This module tests that:
       scraping with a result of not well-formed.
     - file type detection without scraping works and respects the forced file
       type if provided.
+    - the detection stops at the first detector giving a final result, the
+      skipped detectors are recorded in info and the detected file type is
+      the same as when all the detectors are run.
+    - resource usage is reported in info and per stage only when requested.
+    - a command timing out during scraping is recorded as a scraper error and
+      the file is not well-formed.
+    - with concurrency, the detectors and scrapers of a file run in parallel
+      and the results are the same as when they are run one by one.
+    - in fail-fast scraping, the scrapers after the first one finding the
+      file not well-formed are skipped and recorded as skipped in info, also
+      with concurrency.
 """
 from __future__ import unicode_literals
 
+import time
+
 import pytest
 
+import file_scraper.scraper
+import file_scraper.shell
+from file_scraper.base import BaseScraper
 from file_scraper.scraper import Scraper
+from file_scraper.shell import Shell
+from tests.common import partial_message_included
 
 
 def test_is_textfile():
@@ -111,3 +129,200 @@ def test_detect_filetype(filename, params, expected_results):
         assert getattr(scraper, field) == value
     assert scraper.streams is None
     assert scraper.info
+
+
+def _detectors_run(scraper):
+    """
+    Return the detectors run and skipped by a scraper.
+
+    :scraper: Scraper instance
+    :returns: Tuple of lists of the class names of the detectors run and
+              skipped
+    """
+    infos = [info for info in scraper.info.values()
+             if info["class"].endswith("Detector")]
+    skipped = [partial_message_included("Skipping detector", info["messages"])
+               for info in infos]
+    return ([info["class"] for (info, skip) in zip(infos, skipped)
+             if not skip],
+            [info["class"] for (info, skip) in zip(infos, skipped) if skip])
+
+
+@pytest.mark.parametrize(
+    ["filename", "params", "detectors_run"],
+    [
+        ("tests/data/image_png/valid_1.2.png",
+         {"mimetype": "image/png", "version": "1.2"},
+         ["PredefinedDetector"]),
+        ("tests/data/image_x-dpx/valid_2.0.dpx", {},
+         ["FidoDetector"]),
+        ("tests/data/image_png/valid_1.2.png", {"mimetype": "image/png"},
+         ["FidoDetector", "MagicDetector", "PredefinedDetector"]),
+    ]
+)
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_detection_short_circuit(monkeypatch, filename, params,
+                                 detectors_run, concurrency):
+    """
+    Test that the detection stops at a final result.
+
+    The detectors run are recorded in info, the remaining ones are recorded
+    as skipped, and the detected file type is the same as when all the
+    detectors are run.
+    """
+    scraper = Scraper(filename, concurrency=concurrency, **params)
+    scraper.detect_filetype()
+    (run, skipped) = _detectors_run(scraper)
+    assert run == detectors_run
+    assert sorted(run + skipped) == ["FidoDetector", "MagicDetector",
+                                     "PredefinedDetector"]
+
+    monkeypatch.setattr(file_scraper.scraper, "DETECTION_SHORT_CIRCUIT",
+                        False)
+    full_scraper = Scraper(filename, concurrency=concurrency, **params)
+    full_scraper.detect_filetype()
+    assert _detectors_run(full_scraper)[1] == []
+    assert (scraper.mimetype, scraper.version) == \
+        (full_scraper.mimetype, full_scraper.version)
+
+
+def test_resource_usage():
+    """
+    Test that the resource usage is reported per detector and scraper and per
+    stage only when requested.
+    """
+    filename = "tests/data/image_png/valid_1.2.png"
+    scraper = Scraper(filename)
+    scraper.scrape(check_wellformed=False)
+    assert scraper.resource_usage is None
+    for info in scraper.info.values():
+        assert "resource_usage" not in info
+
+    scraper = Scraper(filename, resource_usage=True)
+    scraper.scrape(check_wellformed=False)
+    assert set(scraper.resource_usage) == set(
+        ["total", "detection", "scraping", "merge", "utf8"])
+    total = scraper.resource_usage["total"]
+    for info in scraper.info.values():
+        assert info["resource_usage"]["wall_time"] <= total["wall_time"]
+        assert info["resource_usage"]["subprocesses"] <= \
+            total["subprocesses"]
+
+    scraper.detect_filetype()
+    assert set(scraper.resource_usage) == set(["total", "detection"])
+
+
+class _SleepScraper(BaseScraper):
+    """Scraper running a command that does not finish in time."""
+
+    def scrape_file(self):
+        """Run a command exceeding its timeout."""
+        self._messages.append("Sleeping.")
+        Shell(["sleep", "10"], timeout=0.1).popen()
+
+
+def test_shell_timeout(monkeypatch):
+    """Test that a timed out command is recorded as a scraper error."""
+    monkeypatch.setattr(file_scraper.shell, "SHELL_KILL_GRACE", 0.1)
+    monkeypatch.setattr(file_scraper.scraper, "iter_scrapers",
+                        lambda **kwargs: [_SleepScraper])
+    scraper = Scraper("tests/data/image_png/valid_1.2.png")
+    scraper.scrape()
+    assert scraper.well_formed is False
+    info = [info for info in scraper.info.values()
+            if info["class"] == "_SleepScraper"][0]
+    assert partial_message_included("did not finish within", info["errors"])
+
+
+class _SlowScraper(BaseScraper):
+    """Scraper running a slow command."""
+
+    def scrape_file(self):
+        """Run a slow command."""
+        self._messages.append(Shell(["sh", "-c", "sleep 0.5; echo slept"],
+                                    tool="sleep").stdout)
+
+
+class _OtherSlowScraper(_SlowScraper):
+    """Another scraper running a slow command."""
+
+    def scrape_file(self):
+        """Run a slow command and report the file not well-formed."""
+        super(_OtherSlowScraper, self).scrape_file()
+        self._errors.append("Not well-formed.")
+
+
+@pytest.mark.parametrize(["concurrency", "min_time", "max_time"],
+                         [(1, 1.0, 60), (2, 0, 1.0)])
+def test_concurrency_time(monkeypatch, concurrency, min_time, max_time):
+    """Test that the scrapers of a file run in parallel with concurrency."""
+    monkeypatch.setattr(file_scraper.scraper, "iter_scrapers",
+                        lambda **kwargs: [_OtherSlowScraper, _SlowScraper])
+    scraper = Scraper("tests/data/text_plain/valid__utf8.txt",
+                      concurrency=concurrency, resource_usage=True)
+    start = time.time()
+    scraper.scrape()
+    assert min_time <= time.time() - start < max_time
+
+    infos = [info for info in scraper.info.values()
+             if "SlowScraper" in info["class"]]
+    assert [info["class"] for info in infos] == ["_OtherSlowScraper",
+                                                 "_SlowScraper"]
+    assert [info["messages"] for info in infos] == [["slept\n"]] * 2
+    assert [info["resource_usage"]["subprocesses"] for info in infos] == [1, 1]
+    assert scraper.resource_usage["scraping"]["subprocesses"] == 2
+    assert scraper.well_formed is False
+
+
+@pytest.mark.parametrize("filename", [
+    "tests/data/text_plain/valid__utf8.txt",
+    "tests/data/image_png/valid_1.2.png",
+    "tests/data/application_pdf/valid_1.4.pdf",
+    "tests/data/video_mp4/valid__h264_aac.mp4",
+    "nonexistent"
+])
+@pytest.mark.parametrize("check_wellformed", [True, False])
+def test_concurrency_results(filename, check_wellformed):
+    """Test that the results do not depend on the concurrency."""
+    results = []
+    for concurrency in [1, 4]:
+        scraper = Scraper(filename, concurrency=concurrency)
+        scraper.scrape(check_wellformed)
+        results.append((scraper.mimetype, scraper.version, scraper.streams,
+                        scraper.well_formed, scraper.info))
+    assert results[0] == results[1]
+
+
+class _FailingScraper(BaseScraper):
+    """Scraper finding the file not well-formed."""
+
+    def scrape_file(self):
+        """Report an error."""
+        self._messages.append("Scraped.")
+        self._errors.append("Not well-formed.")
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+@pytest.mark.parametrize("fail_fast", [True, False])
+def test_fail_fast(monkeypatch, concurrency, fail_fast):
+    """Test that fail-fast scraping skips the remaining scrapers."""
+    monkeypatch.setattr(
+        file_scraper.scraper, "iter_scrapers",
+        lambda **kwargs: [_FailingScraper, _SlowScraper, _SlowScraper])
+    scraper = Scraper("tests/data/text_plain/valid__utf8.txt",
+                      concurrency=concurrency)
+    scraper.scrape(fail_fast=fail_fast)
+    assert scraper.well_formed is False
+
+    infos = [info for info in scraper.info.values()
+             if info["class"] == "_SlowScraper"]
+    assert len(infos) == 2
+    skipped = [partial_message_included("Skipping scraper", info["messages"])
+               for info in infos]
+    if not fail_fast:
+        assert skipped == [False, False]
+    elif concurrency == 1:
+        assert skipped == [True, True]
+    else:
+        # The scraper started together with the failing one may have run
+        assert skipped[1]
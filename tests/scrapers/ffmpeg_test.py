@@ -45,6 +45,8 @@ This module tests that:
     - If scraping is done without well-formedness check, an error is recorded
       and no metadata is scraped.
     - Forcing MIME type and/or version works.
+    - In fail-fast scraping, invalid files are not well-formed and valid files
+      are well-formed.
 """
 from __future__ import unicode_literals
 
@@ -305,6 +307,25 @@ def test_ffmpeg_scraper_invalid(filename, result_dict, mimetype,
     evaluate_scraper(scraper, correct)
 
 
+@pytest.mark.parametrize(
+    ["filename", "mimetype", "well_formed"],
+    [
+        ("tests/data/video_x-matroska/invalid_4_ffv1_missing_data.mkv",
+         "video/x-matroska", False),
+        ("tests/data/video_mp4/invalid__h264_aac_missing_data.mp4",
+         "video/mp4", False),
+        ("tests/data/video_x-matroska/valid_4_ffv1.mkv",
+         "video/x-matroska", True),
+        ("tests/data/video_mp4/valid__h264_aac.mp4", "video/mp4", True),
+    ])
+def test_fail_fast(filename, mimetype, well_formed):
+    """Test that the decoding stopping at the first error gives the verdict."""
+    scraper = FFMpegScraper(filename, True, {"mimetype_guess": mimetype,
+                                             "fail_fast": True})
+    scraper.scrape_file()
+    assert scraper.well_formed == well_formed
+
+
 @pytest.mark.parametrize(
     ["mime", "ver"],
     [
@@ -40,6 +40,13 @@ This module tests that:
         - For empty file, scraper errors contains "imporoper image header".
     - When well-formedness is not checked, scraper messages contains "Skipping
       scraper" and well_formed is None.
+    - When the file is pinged, streams are scraped from the image headers and
+      scraper messages tell that the pixel data was not decoded. Pinging is
+      used by default when well-formedness is not checked. The file is
+      decoded if the Wand version cannot ping images.
+    - Configured ImageMagick resource limits are applied once before reading
+      the first file, and the limits given to the scraper only while the file
+      is read.
     - With or without well-formedness check, the following MIME type and
       version pairs are supported by both WandScraper and their corresponding
       metadata models:
@@ -59,6 +66,7 @@ import os
 import pytest
 import six
 
+import file_scraper.wand.wand_scraper
 from file_scraper.wand.wand_model import WandImageMeta, WandTiffMeta
 from file_scraper.wand.wand_scraper import WandScraper
 from tests.common import (parse_results, force_correct_filetype,
@@ -286,6 +294,74 @@ def test_no_wellformed():
     assert scraper.well_formed is None
 
 
+@pytest.mark.parametrize(
+    ["check_wellformed", "params", "pinged"],
+    [
+        (True, {}, False),
+        (False, {}, True),
+        (True, {"wand_ping": True}, True),
+        (False, {"wand_ping": False}, False)
+    ]
+)
+def test_ping(check_wellformed, params, pinged):
+    """Test scraping only the image headers."""
+    scraper = WandScraper("tests/data/image_tiff/valid_6.0.tif",
+                          check_wellformed, params)
+    scraper.scrape_file()
+    assert partial_message_included("pixel data was not decoded",
+                                    scraper.messages()) == pinged
+    assert scraper.streams[0].width() == "10"
+    assert scraper.streams[0].height() == "6"
+    assert scraper.streams[0].byte_order() == "little endian"
+
+
+def test_ping_unavailable(monkeypatch):
+    """Test that the image is decoded with Wand versions unable to ping."""
+    import wand.image
+    monkeypatch.delattr(wand.image.Image, "ping", raising=False)
+    scraper = WandScraper("tests/data/image_tiff/valid_6.0.tif", False)
+    scraper.scrape_file()
+    assert not partial_message_included("pixel data was not decoded",
+                                        scraper.messages())
+    assert scraper.streams[0].width() == "10"
+
+
+def test_resource_limits(monkeypatch):
+    """
+    Test that the configured ImageMagick resource limits are set once, and
+    the limits given to the scraper only while the image is read.
+    """
+    import wand.resource
+    limits = {"memory": 2**30, "map": 2**31, "disk": 2**32, "thread": 4}
+    monkeypatch.setattr(wand.resource, "limits", limits)
+    monkeypatch.setattr(file_scraper.wand.wand_scraper,
+                        "WAND_RESOURCE_LIMITS",
+                        {"memory": None, "map": 2**30, "disk": None,
+                         "thread": None})
+    monkeypatch.setattr(file_scraper.wand.wand_scraper,
+                        "_LIMITS_CONFIGURED", False)
+    read_limits = []
+    read_image = WandScraper._read_image
+
+    def _read_image(self):
+        """Record the limits in effect when the image is read."""
+        read_limits.append(dict(limits))
+        return read_image(self)
+
+    monkeypatch.setattr(WandScraper, "_read_image", _read_image)
+    scraper = WandScraper("tests/data/image_png/valid_1.2.png", True,
+                          {"wand_limits": {"memory": 2**20, "thread": 1}})
+    scraper.scrape_file()
+    assert read_limits == [{"memory": 2**20, "map": 2**30, "disk": 2**32,
+                            "thread": 1}]
+    assert limits == {"memory": 2**30, "map": 2**30, "disk": 2**32,
+                      "thread": 4}
+
+    limits["map"] = 2**31
+    WandScraper("tests/data/image_png/valid_1.2.png", True).scrape_file()
+    assert limits["map"] == 2**31
+
+
 @pytest.mark.parametrize(
     ["mime", "ver", "class_"],
     [
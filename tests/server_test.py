@@ -0,0 +1,199 @@
+"""
+Tests for the scraping server.
+
+This module tests that:
+    - the server scrapes and detects the files of the requests over TCP and
+      Unix sockets, and returns the results as JSON.
+    - the health endpoint reports the status of the server.
+    - invalid requests and unknown paths are rejected.
+    - when the request queue is full, new requests are rejected with 503
+      while the queued requests are still served.
+    - a Unix socket left by a previous server is replaced, but another file
+      in its place is not.
+    - the server is shut down and its socket removed on SIGTERM.
+"""
+from __future__ import unicode_literals
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+from six.moves import http_client
+
+import file_scraper.server
+from file_scraper.scraper import Scraper
+from file_scraper.server import make_server
+
+FILENAME = "tests/data/text_plain/valid__utf8.txt"
+
+
+@pytest.fixture
+def server():
+    """
+    Run a server on a free TCP port.
+
+    :yields: A function sending a request to the server and returning a
+             tuple of the status and the JSON response
+    """
+    instance = make_server(("127.0.0.1", 0), workers=1, queue_size=1)
+    thread = threading.Thread(target=instance.serve_forever)
+    thread.start()
+
+    def request(method, path, body=None):
+        """Send a request."""
+        connection = http_client.HTTPConnection(*instance.server_address,
+                                                timeout=30)
+        try:
+            if body is not None and not isinstance(body, bytes):
+                body = json.dumps(body).encode("utf-8")
+            connection.request(method, path, body)
+            response = connection.getresponse()
+            return (response.status, json.loads(response.read()))
+        finally:
+            connection.close()
+
+    request.server = instance
+    yield request
+    instance.shutdown()
+    instance.server_close()
+    instance.stop_workers()
+    thread.join()
+
+
+def test_scrape(server):
+    """Test scraping and detecting files."""
+    scraper = Scraper(FILENAME)
+    scraper.scrape(False)
+    (status, result) = server("POST", "/scrape",
+                              {"path": FILENAME, "check_wellformed": False})
+    assert status == 200
+    assert result["mimetype"] == scraper.mimetype
+    assert result["streams"]["0"]["charset"] == \
+        scraper.streams[0]["charset"]
+
+    (status, result) = server("POST", "/detect",
+                              {"path": FILENAME, "mimetype": "text/html",
+                               "version": "5.0"})
+    assert status == 200
+    assert (result["mimetype"], result["version"]) == ("text/html", "5.0")
+    assert result["streams"] is None
+
+    (status, result) = server("GET", "/health")
+    assert (status, result) == (200, {"status": "ok", "workers": 1,
+                                      "queued": 0})
+
+
+@pytest.mark.parametrize(["method", "path", "body", "status"], [
+    ("POST", "/scrape", b"{", 400),
+    ("POST", "/scrape", {"file": FILENAME}, 400),
+    ("POST", "/other", {"path": FILENAME}, 404),
+    ("GET", "/scrape", None, 404),
+])
+def test_invalid_request(server, method, path, body, status):
+    """Test that invalid requests are rejected."""
+    assert server(method, path, body)[0] == status
+
+
+def test_load_shedding(server, monkeypatch):
+    """Test that requests are rejected when the queue is full."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking_scrape(filename, **kwargs):
+        """Wait until released."""
+        started.set()
+        release.wait(30)
+        return {"filename": filename}
+
+    monkeypatch.setattr(file_scraper.server, "scrape_one", blocking_scrape)
+    results = []
+
+    def send():
+        """Send a scraping request."""
+        results.append(server("POST", "/scrape", {"path": FILENAME}))
+
+    threads = [threading.Thread(target=send) for _ in range(2)]
+    threads[0].start()
+    assert started.wait(30)
+    threads[1].start()
+    while server.server.queued() < 1:
+        threading.Event().wait(0.01)
+
+    assert server("POST", "/scrape", {"path": FILENAME}) == \
+        (503, {"error": "Server overloaded"})
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [(200, {"filename": FILENAME})] * 2
+
+
+def test_unix_socket(tmpdir):
+    """Test serving requests on a Unix socket."""
+    path = str(tmpdir.join("server.sock"))
+    instance = make_server(path, workers=1)
+    thread = threading.Thread(target=instance.serve_forever)
+    thread.start()
+    try:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(path)
+        body = json.dumps({"path": FILENAME}).encode("utf-8")
+        client.sendall(b"POST /detect HTTP/1.0\r\nContent-Length: " +
+                       str(len(body)).encode("ascii") + b"\r\n\r\n" + body)
+        response = b""
+        while True:
+            data = client.recv(65536)
+            if not data:
+                break
+            response += data
+        client.close()
+    finally:
+        instance.shutdown()
+        instance.server_close()
+        instance.stop_workers()
+        thread.join()
+
+    (head, body) = response.split(b"\r\n\r\n", 1)
+    assert head.startswith(b"HTTP/1.0 200")
+    assert json.loads(body.decode("utf-8"))["mimetype"] == "text/plain"
+
+
+def test_unix_socket_path(tmpdir):
+    """Test that only a socket is replaced by the socket of the server."""
+    path = str(tmpdir.join("server.sock"))
+    for _ in range(2):
+        instance = make_server(path, workers=1)
+        instance.server_close()
+        instance.stop_workers()
+    assert os.path.exists(path)
+
+    os.remove(path)
+    tmpdir.join("server.sock").write("data")
+    with pytest.raises(ValueError):
+        make_server(path, workers=1)
+    assert tmpdir.join("server.sock").read() == "data"
+
+
+def test_sigterm(tmpdir):
+    """Test that the server is shut down cleanly on SIGTERM."""
+    path = str(tmpdir.join("server.sock"))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "file_scraper.server", "--socket", path],
+        stderr=subprocess.PIPE)
+    try:
+        line = process.stderr.readline()
+        while line and not line.startswith(b"Serving on"):
+            line = process.stderr.readline()
+        assert line
+        process.send_signal(signal.SIGTERM)
+        assert process.wait() == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stderr.close()
+    assert not os.path.exists(path)
@@ -0,0 +1,163 @@
+"""
+Tests for the record and replay of the external commands.
+
+This module tests that:
+    - the results of the recorded commands are replayed without running
+      the commands, also for a copy of the input file under another name.
+    - a command whose input file or extra environment differs from the
+      recorded one is not replayed, and fails as if the tool was missing.
+    - the replayed commands wait for the given fraction of their recorded
+      run time.
+    - SHELL_FIXTURE_MODE records and replays all commands, and a scraper
+      gives the same results from the replayed commands as from the tool.
+    - the temporary directories in the arguments and the environment do not
+      change the key of a fixture, and the files written by a command in
+      them are recorded and written again when it is replayed, so that a
+      converting scraper finds its output.
+"""
+from __future__ import unicode_literals
+
+import errno
+import os
+import shutil
+import stat
+import tempfile
+import time
+
+import pytest
+
+import file_scraper.pspp.pspp_scraper
+import file_scraper.shell
+from file_scraper.pspp.pspp_scraper import PsppScraper
+from file_scraper.shell import Shell, subprocess_runner
+from file_scraper.shell_fixtures import (FixtureStore, record_runner,
+                                         replay_runner)
+from file_scraper.utils import encode_path
+from file_scraper.xmllint.xmllint_scraper import XmllintScraper
+
+
+def _write(path, content):
+    """Write a text file."""
+    with open(path, "w") as outfile:
+        outfile.write(content)
+
+
+def test_record_replay(tmpdir):
+    """Test replaying a recorded command."""
+    store = FixtureStore(str(tmpdir.join("fixtures")))
+    original = str(tmpdir.join("original.txt"))
+    _write(original, "first\nsecond\n")
+    with subprocess_runner(record_runner(store)):
+        recorded = Shell(["sh", "-c", "cat $0; echo error >&2; exit 3",
+                          original])
+        assert recorded.returncode == 3
+
+    copy = str(tmpdir.join("copy.txt"))
+    shutil.copy(original, copy)
+    os.remove(original)
+    with subprocess_runner(replay_runner(store)):
+        replayed = Shell(["sh", "-c", "cat $0; echo error >&2; exit 3",
+                          copy])
+        assert replayed.returncode == 3
+        assert replayed.stdout == "first\nsecond\n"
+        assert replayed.stderr == "error\n"
+        assert replayed.stdout_raw == recorded.stdout_raw
+
+
+@pytest.mark.parametrize(["content", "env"], [
+    ("changed\n", None),
+    ("first\n", {"EXTRA": "value"}),
+])
+def test_not_recorded(tmpdir, content, env):
+    """Test that only the recorded commands are replayed."""
+    store = FixtureStore(str(tmpdir.join("fixtures")))
+    path = str(tmpdir.join("input.txt"))
+    _write(path, "first\n")
+    with subprocess_runner(record_runner(store)):
+        assert Shell(["cat", path]).returncode == 0
+
+    _write(path, content)
+    with subprocess_runner(replay_runner(store)):
+        shell = Shell(["cat", path], env=env)
+        with pytest.raises(OSError) as error:
+            shell.popen()
+    assert error.value.errno == errno.ENOENT
+
+
+@pytest.mark.parametrize(["latency", "minimum", "maximum"], [
+    (0.0, 0.0, 0.2),
+    (1.0, 0.3, None),
+])
+def test_latency(tmpdir, latency, minimum, maximum):
+    """Test simulating the recorded run time of the commands."""
+    store = FixtureStore(str(tmpdir))
+    with subprocess_runner(record_runner(store)):
+        assert Shell(["sleep", "0.3"]).returncode == 0
+
+    start = time.time()
+    with subprocess_runner(replay_runner(store, latency)):
+        assert Shell(["sleep", "0.3"]).returncode == 0
+    elapsed = time.time() - start
+    assert elapsed >= minimum
+    assert maximum is None or elapsed < maximum
+
+
+def test_configured_mode(tmpdir, monkeypatch):
+    """Test recording and replaying a scraper with SHELL_FIXTURE_MODE."""
+    filename = encode_path("tests/data/text_xml/valid_1.0_dtd.xml")
+    params = {"mimetype_guess": "text/xml"}
+    monkeypatch.setattr(file_scraper.shell, "SHELL_FIXTURE_DIR", str(tmpdir))
+    monkeypatch.setattr(file_scraper.shell, "SHELL_FIXTURE_MODE", "record")
+    recorded = XmllintScraper(filename, True, params)
+    recorded.scrape_file()
+    assert os.listdir(str(tmpdir)) == ["xmllint"]
+
+    monkeypatch.setattr(file_scraper.shell, "SHELL_FIXTURE_MODE", "replay")
+    monkeypatch.setenv("PATH", str(tmpdir))
+    replayed = XmllintScraper(filename, True, params)
+    replayed.scrape_file()
+    assert replayed.well_formed == recorded.well_formed
+    assert replayed.messages() == recorded.messages()
+    assert replayed.errors() == recorded.errors()
+
+
+def test_temporary_directories(tmpdir):
+    """Test that the temporary directories do not change the key."""
+    store = FixtureStore(str(tmpdir))
+    keys = []
+    for _ in range(2):
+        directory = tempfile.mkdtemp()
+        try:
+            keys.append(store.key(Shell(
+                ["soffice", "--outdir", directory,
+                 os.path.join(directory, "output.pdf")],
+                env={"HOME": directory})))
+        finally:
+            shutil.rmtree(directory)
+    assert keys[0] == keys[1]
+    assert keys[0] != store.key(Shell(
+        ["soffice", "--outdir", "/nonexistent", "/nonexistent/output.pdf"],
+        env={"HOME": "/nonexistent"}))
+
+
+def test_converting_scraper(tmpdir, monkeypatch):
+    """Test replaying a scraper checking the file written by its tool."""
+    tool = str(tmpdir.join("pspp-convert"))
+    _write(tool, "#!/bin/sh\ncp \"$1\" \"$2\"\n")
+    os.chmod(tool, stat.S_IRWXU)
+    monkeypatch.setattr(file_scraper.pspp.pspp_scraper, "PSPP_PATH", tool)
+    filename = encode_path("tests/data/application_x-spss-por/valid.por")
+    store = FixtureStore(str(tmpdir.join("fixtures")))
+
+    with subprocess_runner(record_runner(store)):
+        recorded = PsppScraper(filename, True)
+        recorded.scrape_file()
+    assert "File conversion was succesful." in recorded.messages()
+
+    os.remove(tool)
+    with subprocess_runner(replay_runner(store)):
+        replayed = PsppScraper(filename, True)
+        replayed.scrape_file()
+    assert replayed.well_formed == recorded.well_formed
+    assert replayed.messages() == recorded.messages()
+    assert replayed.errors() == recorded.errors()
@@ -10,15 +10,38 @@
           recorded in that file.
         - If custom environment variables are supplied, they are used when
           running the command.
+        - Commands that do not finish within the timeout are terminated
+          together with their child processes, also when SIGTERM is ignored,
+          and ShellTimeoutError is raised when the results are accessed. A
+          child that has left the process group does not delay the timeout.
+        - Commands are terminated if the waiting for them is interrupted.
+        - The configured timeout of a tool is scaled by the size of the
+          largest input file of the command.
+        - Commands are run in their own session.
+        - Commands of a tool with limited concurrency wait for a free slot,
+          also when the slot is held by another process, while other tools
+          are not limited.
+        - In the spooled mode large outputs are stored in temporary files
+          and can be iterated in chunks and lines, and the decoded text is
+          cached.
+        - Stored stderr can be capped, in which case the rest of it is
+          replaced with a truncation marker without splitting characters.
 """
 
 import os
+import signal
+import subprocess
+import sys
+import threading
+import time
 from tempfile import TemporaryFile
 
 import six
 
 import pytest
 
+import file_scraper.shell
+from file_scraper.exceptions import ShellTimeoutError
 from file_scraper.shell import Shell
 
 
@@ -74,3 +97,218 @@ def test_shell_with_env():
     assert shell.returncode == 0
     assert shell.stdout == "testing\n"
     assert not shell.stderr
+
+
+@pytest.mark.parametrize(
+    ["command", "ignore_sigterm"],
+    [
+        (["sleep", "10"], False),
+        (["sh", "-c", "trap '' TERM; sleep 10"], True),
+        # The child keeps the pipes open after the shell exits
+        (["sh", "-c", "sleep 10 & echo started"], False),
+        # The child leaves the process group and keeps the pipes open
+        (["sh", "-c", "setsid sleep 10 & sleep 10"], False)
+    ]
+)
+def test_shell_timeout(monkeypatch, command, ignore_sigterm):
+    """
+    Test that a command exceeding its timeout is terminated with its whole
+    process group and ShellTimeoutError is raised.
+    """
+    monkeypatch.setattr(file_scraper.shell, "SHELL_KILL_GRACE", 0.5)
+    start = time.time()
+    shell = Shell(command, timeout=0.5)
+    with pytest.raises(ShellTimeoutError):
+        shell.popen()
+    elapsed = time.time() - start
+    assert shell.timed_out
+    assert elapsed < 5
+    if ignore_sigterm:
+        assert elapsed >= 1
+
+    # The results stay unavailable
+    with pytest.raises(ShellTimeoutError):
+        assert shell.returncode
+
+
+class _Interrupted(Exception):
+    """Exception raised by the alarm signal handler."""
+
+
+def test_shell_interrupted(testpath):
+    """Test that the command is terminated if the waiting is interrupted."""
+    pidfile = os.path.join(testpath, "pid")
+
+    def _interrupt(signum, frame):
+        """Interrupt the waiting."""
+        raise _Interrupted()
+
+    previous = signal.signal(signal.SIGALRM, _interrupt)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, 0.5)
+        shell = Shell(["sh", "-c", "echo $$ > %s; exec sleep 10" % pidfile],
+                      timeout=30)
+        with pytest.raises(_Interrupted):
+            shell.popen()
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+    with open(pidfile) as infile:
+        pid = int(infile.read())
+    # The process has been terminated and reaped
+    with pytest.raises(OSError):
+        os.kill(pid, 0)
+
+
+def test_shell_configured_timeout(monkeypatch, testpath):
+    """Test that the configured timeout is scaled by the input file size."""
+    monkeypatch.setattr(file_scraper.shell, "SHELL_TIMEOUTS",
+                        {"cat": (10, 2), "true": None})
+    monkeypatch.setattr(file_scraper.shell, "SHELL_DEFAULT_TIMEOUT", (5, 0))
+    input_file = os.path.join(testpath, "input")
+    with open(input_file, "wb") as outfile:
+        outfile.write(b"a" * 3 * 1024**2)
+
+    assert Shell(["cat", input_file]).timeout == 16
+    assert Shell(["cat", "nonexistent"]).timeout == 10
+    assert Shell(["true", input_file]).timeout is None
+    assert Shell(["echo", input_file]).timeout == 5
+    assert Shell(["/bin/cat", input_file], tool="echo").timeout == 5
+    assert Shell(["cat", input_file], timeout=1).timeout == 1
+
+
+def test_shell_new_session():
+    """Test that the command is run in its own session."""
+    shell = Shell(["ps", "-o", "sid=", "-p", str(os.getpid())])
+    own_sid = int(shell.stdout)
+    shell = Shell(["sh", "-c", "ps -o sid= -p $$"])
+    assert int(shell.stdout) != own_sid
+
+
+def _run_concurrently(commands):
+    """
+    Run commands with Shell in parallel threads.
+
+    :commands: List of commands
+    :returns: Elapsed time in seconds
+    """
+    start = time.time()
+    threads = [threading.Thread(target=lambda cmd=cmd: Shell(cmd).returncode)
+               for cmd in commands]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start
+
+
+def test_shell_concurrency(monkeypatch, testpath):
+    """Test that only the limited tools wait for a free slot."""
+    monkeypatch.setattr(file_scraper.shell, "SHELL_CONCURRENCY",
+                        {"sleep": 1})
+    monkeypatch.setattr(file_scraper.shell, "SHELL_LOCK_DIR", testpath)
+
+    assert _run_concurrently([["sleep", "0.3"]] * 3) >= 0.9
+    assert _run_concurrently([["sh", "-c", "sleep 0.3"]] * 3) < 0.9
+    assert os.listdir(testpath) == ["sleep.0.lock"]
+
+
+def test_shell_concurrency_processes(monkeypatch, testpath):
+    """Test that a slot held by another process is waited for."""
+    monkeypatch.setattr(file_scraper.shell, "SHELL_CONCURRENCY",
+                        {"true": 1})
+    monkeypatch.setattr(file_scraper.shell, "SHELL_LOCK_DIR", testpath)
+    holder = subprocess.Popen(
+        [sys.executable, "-c",
+         "import fcntl, sys, time\n"
+         "lock = open(sys.argv[1], 'w')\n"
+         "fcntl.flock(lock, fcntl.LOCK_EX)\n"
+         "print('locked')\n"
+         "sys.stdout.flush()\n"
+         "time.sleep(0.5)",
+         os.path.join(testpath, "true.0.lock")],
+        stdout=subprocess.PIPE)
+    assert holder.stdout.readline() == b"locked\n"
+
+    start = time.time()
+    assert Shell(["true"]).returncode == 0
+    assert time.time() - start >= 0.3
+    holder.wait()
+    holder.stdout.close()
+
+
+def test_shell_concurrency_other_user(testpath):
+    """
+    Test that a 0644 slot file of another user can be locked, and that a
+    tool is run without a slot when its slot files cannot be created.
+    """
+    os.chmod(testpath, 0o1777)
+    with open(os.path.join(testpath, "true.0.lock"), "w"):
+        pass
+    os.chmod(os.path.join(testpath, "true.0.lock"), 0o644)
+    private = os.path.join(testpath, "private")
+    os.mkdir(private, 0o755)
+    # Run as another user, or make the files read-only for a normal user
+    code = (
+        "import os, sys\n"
+        "import file_scraper.shell as shell\n"
+        "(testpath, private) = sys.argv[1:]\n"
+        "if os.geteuid() == 0:\n"
+        "    os.setgid(65534)\n"
+        "    os.setuid(65534)\n"
+        "else:\n"
+        "    os.chmod(os.path.join(testpath, 'true.0.lock'), 0o444)\n"
+        "    os.chmod(private, 0o555)\n"
+        "shell.SHELL_CONCURRENCY = {'true': 1}\n"
+        "shell.SHELL_LOCK_DIR = testpath\n"
+        "slot = shell.ToolSlot('true')\n"
+        "assert slot.acquire_nowait()\n"
+        "assert slot._fd is not None\n"
+        "assert not shell.ToolSlot('true').acquire_nowait()\n"
+        "slot.release()\n"
+        "shell.SHELL_LOCK_DIR = private\n"
+        "print(shell.Shell(['true']).returncode)\n")
+    process = subprocess.Popen([sys.executable, "-c", code, testpath,
+                                private],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (stdout, stderr) = process.communicate()
+    assert process.returncode == 0, stderr
+    assert stdout == b"0\n"
+    assert os.listdir(private) == []
+
+
+@pytest.mark.parametrize("spool", [True, False])
+def test_shell_spool(monkeypatch, spool):
+    """Test that large outputs are spooled to temporary files."""
+    monkeypatch.setattr(file_scraper.shell, "SHELL_SPOOL_THRESHOLD", 1000)
+    shell = Shell(["seq", "1000"], spool=spool)
+
+    expected = "".join("%d\n" % number for number in range(1, 1001))
+    assert list(shell.iter_lines()) == expected.splitlines(True)
+    assert b"".join(shell.iter_chunks(size=100)) == expected.encode("ascii")
+    assert len(next(shell.iter_chunks(size=100))) == 100
+    assert list(shell.iter_lines("stderr")) == []
+    # pylint: disable=protected-access
+    assert getattr(shell._outputs["stdout"], "_rolled", False) == spool
+
+    assert shell.stdout == expected
+    assert shell.stdout is shell.stdout
+    assert shell.stdout_raw == expected.encode("ascii")
+    assert shell.popen()["stdout"] == expected.encode("ascii")
+    shell.close()
+
+
+def test_shell_stderr_limit():
+    """Test that the stored stderr is capped with a truncation marker."""
+    # Four-byte characters straddling the limit are not split
+    command = ["sh", "-c", "printf 'a\\360\\237\\230\\200b' >&2; echo out"]
+
+    shell = Shell(command, stderr_limit=3)
+    assert shell.stderr == "a\n[Output truncated: 5 bytes omitted]\n"
+    assert shell.stderr_truncated == 5
+    assert shell.stdout == "out\n"
+
+    shell = Shell(command, stderr_limit=6)
+    assert shell.stderr_raw == b"a\xf0\x9f\x98\x80b"
+    assert shell.stderr_truncated == 0
@@ -0,0 +1,81 @@
+"""
+Tests for the throughput benchmark.
+
+This module tests that:
+    - the worker counts are the powers of two up to the largest count.
+    - the throughput, the CPU utilization and the wait times of the tools
+      are measured for each worker count and cache mode.
+    - the worker count where the throughput stops growing is found.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+
+import pytest
+
+from benchmarks.throughput import (benchmark, drop_caches, main,
+                                   scaling_limit, worker_counts)
+
+FILES = ["tests/data/text_plain/valid__ascii.txt",
+         "tests/data/text_plain/valid__utf8.txt"]
+
+
+@pytest.mark.parametrize(["max_workers", "counts"], [
+    (1, [1]),
+    (2, [1, 2]),
+    (6, [1, 2, 4, 6]),
+    (8, [1, 2, 4, 8]),
+])
+def test_worker_counts(max_workers, counts):
+    """Test the worker counts to measure."""
+    assert worker_counts(max_workers) == counts
+
+
+@pytest.mark.parametrize(["throughputs", "limit"], [
+    ([10.0, 19.0, 35.0], None),
+    ([10.0, 19.0, 20.0], 2),
+    ([10.0, 9.0, 30.0], 1),
+    ([10.0], None),
+])
+def test_scaling_limit(throughputs, limit):
+    """Test finding the worker count where scaling stops."""
+    runs = [{"workers": 2 ** index, "files_per_second": throughput}
+            for (index, throughput) in enumerate(throughputs)]
+    assert scaling_limit(runs) == limit
+
+
+def test_benchmark():
+    """Test measuring the throughput with warm and cold cache."""
+    files = [(path, 1000) for path in FILES] * 2
+    results = benchmark(files, [1, 2], ["warm", "cold"],
+                        check_wellformed=False)
+    assert set(results) == {"warm", "cold"}
+    assert results["cold"]["drop_method"] in ["drop_caches", "fadvise", None]
+    for result in results.values():
+        assert [run["workers"] for run in result["runs"]] == [1, 2]
+        for run in result["runs"]:
+            assert run["files"] == 4
+            assert run["errors"] == 0
+            assert run["files_per_second"] > 0
+            assert run["bytes_per_second"] == pytest.approx(
+                run["files_per_second"] * 1000)
+            assert run["cpu_utilization"] >= 0
+            assert "MagicDetector" in run["waits"]
+
+
+def test_drop_caches():
+    """Test that the cached pages of missing files are skipped."""
+    assert drop_caches(FILES + ["missing"]) in ["drop_caches", "fadvise",
+                                                None]
+
+
+def test_main(tmpdir, capsys):
+    """Test running the benchmark on given paths."""
+    output = str(tmpdir.join("results.json"))
+    assert main(FILES + ["-w", "1", "-r", "2", "--no-wellformed",
+                          "-o", output]) == 0
+    assert "warm cache: " in capsys.readouterr().out
+    with io.open(output, "rt", encoding="utf-8") as infile:
+        results = json.load(infile)
+    assert results["warm"]["runs"][0]["files"] == 4
@@ -0,0 +1,211 @@
+"""
+Tests for the tracing of the scraping phases.
+
+This module tests that:
+    - the spans of a file are nested under the span of Scraper.scrape(),
+      also when the tools are run in the thread pool, and are exported
+      together when it ends.
+    - a Scraper given a traceparent continues its trace.
+    - the spans of the external commands carry their arguments and exit
+      codes.
+    - a span ended by an exception records the error.
+    - JsonFileExporter appends each export as a line of OTLP JSON.
+    - nothing is recorded when no tracer is set.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+
+import pytest
+
+from file_scraper import tracing
+from file_scraper.scraper import Scraper
+from file_scraper.shell import Shell
+from file_scraper.tracing import JsonFileExporter, Tracer
+from file_scraper.utils import encode_path
+from file_scraper.xmllint.xmllint_scraper import XmllintScraper
+
+FILENAME = "tests/data/text_plain/valid__ascii.txt"
+XML_FILENAME = "tests/data/text_xml/valid_1.0_dtd.xml"
+
+
+class ListExporter(object):
+    """Exporter collecting the exported spans."""
+
+    def __init__(self):
+        """Initialize exporter."""
+        self.exports = []
+
+    def export(self, spans):
+        """Collect the spans of an export."""
+        self.exports.append(spans)
+
+
+@pytest.fixture
+def exporter():
+    """Set a tracer exporting to a list for the test."""
+    collector = ListExporter()
+    previous = tracing.set_tracer(Tracer(collector))
+    yield collector
+    tracing.set_tracer(previous)
+
+
+def _by_id(spans):
+    """Return the spans by their span IDs."""
+    return dict((span.span_id, span) for span in spans)
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_scrape_spans(exporter, concurrency):
+    """Test that the spans of the phases are nested under the file span."""
+    scraper = Scraper(FILENAME, concurrency=concurrency)
+    scraper.scrape(check_wellformed=False)
+
+    assert len(exporter.exports) == 1
+    spans = exporter.exports[0]
+    root = spans[-1]
+    assert root.name == "Scraper.scrape"
+    assert root.parent_id is None
+    assert root.attributes["file.path"] == FILENAME
+    assert root.attributes["file.size"] > 0
+    assert root.attributes["file_scraper.mimetype"] == "text/plain"
+
+    names = [span.name for span in spans]
+    for name in ["detection", "detector", "scraper", "merge", "utf8"]:
+        assert name in names
+
+    by_id = _by_id(spans)
+    for span in spans:
+        assert span.trace_id == root.trace_id
+        assert span.end_time >= span.start_time
+        if span is root:
+            continue
+        assert span.parent_id in by_id
+        parent = by_id[span.parent_id]
+        assert parent.start_time <= span.start_time
+        if span.name == "detector":
+            assert parent.name == "detection"
+            assert "file_scraper.tool" in span.attributes
+        if span.name == "scraper":
+            assert parent.name in ["Scraper.scrape", "utf8"]
+    assert tracing.current_span() is None
+
+
+def test_detect_filetype_span(exporter):
+    """Test the span of Scraper.detect_filetype()."""
+    Scraper(FILENAME).detect_filetype()
+    root = exporter.exports[0][-1]
+    assert root.name == "Scraper.detect_filetype"
+    assert root.attributes["file_scraper.mimetype"] == "text/plain"
+
+
+def test_traceparent(exporter):
+    """Test that a Scraper continues the trace of a given traceparent."""
+    trace_id = "0af7651916cd43dd8448eb211c80319c"
+    parent_id = "b7ad6b7169203331"
+    scraper = Scraper(FILENAME,
+                      traceparent="00-{}-{}-01".format(trace_id, parent_id))
+    scraper.detect_filetype()
+    root = exporter.exports[0][-1]
+    assert root.trace_id == trace_id
+    assert root.parent_id == parent_id
+    assert all(span.trace_id == trace_id for span in exporter.exports[0])
+
+
+def test_invalid_traceparent(exporter):
+    """Test that an invalid traceparent starts a new trace."""
+    Scraper(FILENAME, traceparent="invalid").detect_filetype()
+    root = exporter.exports[0][-1]
+    assert root.parent_id is None
+    assert len(root.trace_id) == 32
+
+
+def test_subprocess_span(exporter):
+    """Test the attributes of the spans of the external commands."""
+    scraper = XmllintScraper(encode_path(XML_FILENAME), True,
+                             {"mimetype_guess": "text/xml"})
+    with tracing.span("scraper"):
+        scraper.scrape_file()
+    spans = exporter.exports[0]
+    xmllint = [span for span in spans if span.name == "subprocess" and
+               span.attributes["process.executable.name"] == "xmllint"]
+    assert xmllint
+    span = xmllint[0]
+    assert span.attributes["process.command_args"][0] == "xmllint"
+    assert span.attributes["process.exit_code"] == 0
+    assert span.attributes["file_scraper.timed_out"] is False
+    assert _by_id(spans)[span.parent_id].name == "scraper"
+
+
+def test_subprocess_span_without_parent(exporter):
+    """Test that a command run outside a Scraper is exported alone."""
+    Shell(["true"]).returncode
+    assert len(exporter.exports) == 1
+    (span,) = exporter.exports[0]
+    assert span.name == "subprocess"
+    assert span.parent_id is None
+    assert span.attributes["process.command_args"] == ["true"]
+
+
+def test_error(exporter):
+    """Test that a span ended by an exception records the error."""
+    with pytest.raises(ValueError):
+        with tracing.span("outer"):
+            with tracing.span("inner"):
+                raise ValueError("Failed")
+    (inner, outer) = exporter.exports[0]
+    assert inner.error == "ValueError: Failed"
+    assert outer.error == "ValueError: Failed"
+    assert tracing.otlp_span(inner)["status"] == {
+        "code": 2, "message": "ValueError: Failed"}
+    assert tracing.current_span() is None
+
+
+def test_json_file_exporter(tmpdir):
+    """Test that the spans are appended as lines of OTLP JSON."""
+    path = str(tmpdir.join("spans.jsonl"))
+    previous = tracing.set_tracer(Tracer(JsonFileExporter(path)))
+    try:
+        for _ in range(2):
+            with tracing.span("outer") as span:
+                span.set_attribute("file.size", 10)
+                span.set_attribute("file_scraper.well_formed", None)
+                with tracing.span("inner") as child:
+                    child.set_attribute("process.command_args", ["a", "b"])
+    finally:
+        tracing.set_tracer(previous)
+
+    with io.open(path, "rt", encoding="utf-8") as infile:
+        lines = infile.readlines()
+    assert len(lines) == 2
+    request = json.loads(lines[0])
+    (resource_spans,) = request["resourceSpans"]
+    assert resource_spans["resource"]["attributes"] == [
+        {"key": "service.name", "value": {"stringValue": "file-scraper"}}]
+    (scope_spans,) = resource_spans["scopeSpans"]
+    (inner, outer) = scope_spans["spans"]
+    assert outer["name"] == "outer"
+    assert "parentSpanId" not in outer
+    assert inner["parentSpanId"] == outer["spanId"]
+    assert inner["traceId"] == outer["traceId"]
+    assert outer["attributes"] == [
+        {"key": "file.size", "value": {"intValue": "10"}}]
+    assert inner["attributes"] == [
+        {"key": "process.command_args",
+         "value": {"arrayValue": {"values": [{"stringValue": "a"},
+                                             {"stringValue": "b"}]}}}]
+    assert int(outer["endTimeUnixNano"]) >= int(outer["startTimeUnixNano"])
+
+
+def test_disabled():
+    """Test that nothing is recorded without a tracer."""
+    previous = tracing.set_tracer(None)
+    try:
+        with tracing.span("outer") as span:
+            assert span.recording is False
+            span.set_attribute("file.size", 10)
+            assert tracing.current_span() is None
+        Scraper(FILENAME).detect_filetype()
+    finally:
+        tracing.set_tracer(previous)